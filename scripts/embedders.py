@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""Benchmark routing accuracy and latency of local embedders.
+
+Aliases and examples of extensions are indexed with every embedder, then queries
+made of aliases with typos, changed case and filler words are routed. Query counts
+as routed right when it reaches interface of its alias, unrelated messages are
+right when they are not routed at all.
+
+    python scripts/embedders.py
+    python scripts/embedders.py zoozl.plugins.helpers zoozl.plugins.pong --variants 50
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from zoozl import chatbot
+
+EMBEDDERS = {
+    "char": {"embedder": "char"},
+    "char-ngrams": {"embedder": "char", "char_ngrams": [2, 3]},
+    "tfidf": {"embedder": "tfidf"},
+}
+FILLERS = ("please ", "can you ", "i want to ", "", "")
+ENDINGS = (" please", " now", "?", "!", "")
+# Messages no alias should be routed to
+UNRELATED = (
+    "what is the weather in riga tomorrow",
+    "send me last invoice",
+    "ok",
+    "lorem ipsum dolor sit amet",
+    "i would like to book a table for two",
+    "42",
+    "thanks, bye",
+    "where is my parcel",
+)
+
+
+def get_variant(rng, alias):
+    """Return alias changed as if typed in hurry."""
+    chars = list(alias)
+    position = rng.randrange(len(chars))
+    change = rng.choice(("drop", "swap", "repeat", "none"))
+    if change == "drop" and len(chars) > 2:
+        del chars[position]
+    elif change == "swap" and position < len(chars) - 1:
+        chars[position], chars[position + 1] = chars[position + 1], chars[position]
+    elif change == "repeat":
+        chars.insert(position, chars[position])
+    text = rng.choice(FILLERS) + "".join(chars) + rng.choice(ENDINGS)
+    return text.upper() if rng.random() < 0.1 else text
+
+
+def measure(conf, queries):
+    """Return right, missed and wrongly routed rates, median query and load times.
+
+    Query of alias None is right when it is not routed to any alias.
+    """
+    started = time.perf_counter()
+    root = chatbot.InterfaceRoot(dict(conf, storage="memory"))
+    root.load()
+    load_time = time.perf_counter() - started
+    right = missed = wrong = 0
+    spent = []
+    for alias, text in queries:
+        started = time.perf_counter()
+        found = root.find_subjects(text)
+        spent.append(time.perf_counter() - started)
+        if not found or found[0][1] <= root.subject_threshold:
+            right += alias is None
+            missed += alias is not None
+        elif alias and root.routes.commands[found[0][0]] is root.routes.commands[alias]:
+            right += 1
+        else:
+            wrong += 1
+    root.close()
+    count = len(queries)
+    median = statistics.median(spent)
+    return right / count, missed / count, wrong / count, median, load_time
+
+
+def main():
+    """Run benchmark from command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "extensions",
+        nargs="*",
+        default=["zoozl.plugins.helpers", "zoozl.plugins.greeter"],
+    )
+    parser.add_argument("--variants", type=int, default=20, help="queries per alias")
+    parser.add_argument("--threshold", type=float, help="subject threshold")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    root = chatbot.InterfaceRoot({"extensions": args.extensions, "storage": "memory"})
+    root.load()
+    entries = root.routes.entries()
+    root.close()
+    rng = random.Random(args.seed)
+    queries = [
+        (alias, get_variant(rng, text))
+        for alias, text in entries
+        for _ in range(args.variants)
+    ]
+    queries.extend((None, i) for i in UNRELATED for _ in range(args.variants))
+    print(f"{len(entries)} aliases and examples, {len(queries)} queries")
+    print(
+        f"{'embedder':<12} {'right':>6} {'missed':>7} {'wrong':>6} "
+        f"{'query':>10} {'load':>9}"
+    )
+    for name, conf in EMBEDDERS.items():
+        conf = dict(conf, extensions=args.extensions)
+        if args.threshold is not None:
+            conf["subject_threshold"] = args.threshold
+        right, missed, wrong, query, load = measure(conf, queries)
+        print(
+            f"{name:<12} {right:6.1%} {missed:7.1%} {wrong:6.1%} "
+            f"{query * 1e6:7.0f} us {load * 1e3:6.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
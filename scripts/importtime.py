@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""Benchmark import time of zoozl modules with python -X importtime.
+
+Imports module in fresh interpreter several times, reports median cumulative import
+time and slowest imported packages. With --check exits with error if any of heavy
+optional dependencies got imported.
+
+    python scripts/importtime.py
+    python scripts/importtime.py zoozl.server --runs 10 --top 15 --check
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Heavy dependencies that only configured transports, embedders or plugins may import
+HEAVY = ("aiosmtpd", "membank", "openai", "pydantic", "scipy", "slack_sdk")
+
+
+def measure(module):
+    """Import module in fresh interpreter, return {package: cumulative microseconds}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        name = name.strip()
+        times[name] = max(times.get(name, 0), int(cumulative))
+    return times
+
+
+def main():
+    """Run benchmark from command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("module", nargs="?", default="zoozl.server")
+    parser.add_argument("--runs", type=int, default=5, help="number of imports")
+    parser.add_argument("--top", type=int, default=10, help="slowest packages shown")
+    parser.add_argument(
+        "--check", action="store_true", help="fail if heavy dependency is imported"
+    )
+    args = parser.parse_args()
+    runs = [measure(args.module) for _ in range(args.runs)]
+    total = statistics.median(i[args.module] for i in runs)
+    print(f"{args.module}: {total / 1000:.1f} ms median of {args.runs} runs")
+    last = runs[-1]
+    packages = {i: t for i, t in last.items() if "." not in i and i != args.module}
+    for name, spent in sorted(packages.items(), key=lambda x: -x[1])[: args.top]:
+        print(f"  {spent / 1000:8.1f} ms  {name}")
+    imported = sorted(i for i in HEAVY if i in last)
+    if imported:
+        print(f"Heavy dependencies imported: {', '.join(imported)}")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+"""Testcases on configuring and running agents as OpenAI assistants."""
+
+import asyncio
+import dataclasses
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+import types
+import unittest
+
+from zoozl import agentgear, chatbot
+from zoozl.agentgear import tools
+
+
+class FakeAssistants:
+    """Assistants endpoint keeping assistants in memory."""
+
+    def __init__(self):
+        """Initialise endpoint."""
+        self.assistants = {}
+        self.ids = itertools.count()
+        self.calls = []
+        self.running = 0
+        self.most_running = 0
+        self.lock = threading.Lock()
+
+    def call(self, name):
+        """Record call and simulate latency."""
+        with self.lock:
+            self.calls.append(name)
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+
+    def list(self):
+        """List assistants."""
+        self.call("list")
+        return list(self.assistants.values())
+
+    def create(self, name, metadata, **kwargs):
+        """Create assistant."""
+        self.call("create")
+        assistant = types.SimpleNamespace(
+            id=f"asst_{next(self.ids)}", name=name, metadata=metadata
+        )
+        with self.lock:
+            self.assistants[assistant.id] = assistant
+        return assistant
+
+    def delete(self, assistant_id):
+        """Delete assistant."""
+        self.call("delete")
+        with self.lock:
+            del self.assistants[assistant_id]
+
+
+def get_agent(name, instructions=""):
+    """Return agent definition."""
+    return type(name, (agentgear.BaseAgent,), {"instructions": instructions})
+
+
+class Configure(unittest.TestCase):
+    """Testcases on syncing agents with assistants of account."""
+
+    def setUp(self):
+        """Prepare fake client and manifest path."""
+        self.assistants = FakeAssistants()
+        self.client = types.SimpleNamespace(
+            beta=types.SimpleNamespace(assistants=self.assistants)
+        )
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manifest = os.path.join(self.tmp.name, "agents.json")
+        self.agents = [get_agent(f"Agent{i}") for i in range(8)]
+
+    def tearDown(self):
+        """Remove manifest."""
+        self.tmp.cleanup()
+
+    def configure(self, agents, **kwargs):
+        """Configure agents with manifest."""
+        self.assistants.calls.clear()
+        return agentgear.configure(self.client, agents, self.manifest, **kwargs)
+
+    def test_concurrent(self):
+        """Assistants are created in parallel and unknown ones deleted."""
+        self.assistants.create("Stray", {})
+        deployed = self.configure(self.agents, workers=4)
+        self.assertEqual([f"Agent{i}" for i in range(8)], [i.name for i in deployed])
+        self.assertEqual(4, self.assistants.most_running)
+        self.assertEqual(
+            sorted(i.id for i in deployed), sorted(self.assistants.assistants)
+        )
+        self.assertEqual(1, self.assistants.calls.count("delete"))
+
+    def test_manifest(self):
+        """Account is synced only when agent definitions change."""
+        first = self.configure(self.agents)
+        self.assertEqual(first, self.configure(self.agents))
+        self.assertEqual([], self.assistants.calls)
+        changed = self.agents[:-1] + [get_agent("Agent7", "Be brief")]
+        deployed = self.configure(changed)
+        self.assertEqual(first[:-1], deployed[:-1])
+        self.assertNotEqual(first[-1].id, deployed[-1].id)
+        self.assertEqual(["create", "delete", "list"], sorted(self.assistants.calls))
+        self.assertEqual(deployed, list(tools.load_manifest(self.manifest).values()))
+
+    def test_failed_save(self):
+        """Failed save leaves previous manifest and no temporary file."""
+        deployed = self.configure(self.agents)
+        broken = dataclasses.replace(deployed[0], name=object())
+        with self.assertRaises(TypeError):
+            tools.save_manifest(self.manifest, [broken])
+        self.assertEqual(deployed, list(tools.load_manifest(self.manifest).values()))
+        self.assertEqual(["agents.json"], os.listdir(self.tmp.name))
+
+    def test_refresh(self):
+        """Assistants gone from account are recreated on refresh or stale manifest."""
+        first = self.configure(self.agents[:2])
+        self.assistants.delete(first[0].id)
+        self.assistants.create("Stray", {})
+        self.assertEqual(first, self.configure(self.agents[:2], max_age=60))
+        self.assertEqual([], self.assistants.calls)
+        deployed = self.configure(self.agents[:2], refresh=True)
+        self.assertNotEqual(first[0].id, deployed[0].id)
+        self.assertEqual(first[1], deployed[1])
+        self.assertEqual(["create", "delete", "list"], sorted(self.assistants.calls))
+        self.assertEqual(
+            sorted(i.id for i in deployed), sorted(self.assistants.assistants)
+        )
+        self.assistants.delete(deployed[1].id)
+        os.utime(self.manifest, (0, 0))
+        deployed = self.configure(self.agents[:2], max_age=60)
+        self.assertEqual(["create", "list"], sorted(self.assistants.calls))
+        self.assertEqual(2, len(self.assistants.assistants))
+
+    def test_dry_run(self):
+        """Dry run returns changes without making them."""
+        self.configure(self.agents[:2])
+        diff = self.configure(self.agents[1:3], dry_run=True)
+        self.assertEqual(["list"], self.assistants.calls)
+        self.assertEqual([self.agents[2]], [agent for _, agent in diff.create])
+        self.assertEqual(["Agent0"], [i.name for i in diff.delete])
+        self.assertEqual(["Agent1"], [i.name for i in diff.keep])
+        self.assertEqual(2, len(self.assistants.assistants))
+        self.assertFalse(self.configure(self.agents[:2], dry_run=True))
+
+
+class Stream(unittest.TestCase):
+    """Testcases on streaming assistant replies."""
+
+    def test_delta(self):
+        """Text pieces are written to package stream and closed with whole text."""
+        streams = []
+
+        def streamer():
+            streams.append(chatbot.TextStream(answers.append))
+            return streams[-1]
+
+        answers = []
+        package = chatbot.Package(chatbot.Conversation(), answers.append, streamer)
+        handler = agentgear.StreamHandler(None, "thread", {}, package, None)
+        for piece in ("Hel", "lo", None, " [1]"):
+            handler.on_text_delta(types.SimpleNamespace(value=piece), None)
+        self.assertEqual("Hello [1]", streams[0].text)
+        text = types.SimpleNamespace(
+            value="Hello [1]", annotations=[types.SimpleNamespace(text=" [1]")]
+        )
+        handler.on_text_done(text)
+        self.assertEqual(["Hello"], answers)
+        handler.on_text_done(types.SimpleNamespace(value="Bye", annotations=[]))
+        self.assertEqual(["Hello", "Bye"], answers)
+        self.assertEqual(1, len(streams))
+
+
+def get_tool_call(call_id, name, **arguments):
+    """Return tool call of assistant run."""
+    function = types.SimpleNamespace(name=name, arguments=json.dumps(arguments))
+    return types.SimpleNamespace(id=call_id, function=function)
+
+
+async def wait_async(seconds):
+    """Wait without blocking."""
+    await asyncio.sleep(seconds)
+    return {"waited": seconds}
+
+
+def wait_blocking(seconds):
+    """Wait blocking thread."""
+    time.sleep(seconds)
+    return "done"
+
+
+class Tools(unittest.TestCase):
+    """Testcases on executing tool calls."""
+
+    def setUp(self):
+        """Prepare executor."""
+        self.tools = agentgear.ToolExecutor(
+            {"wait_async": wait_async, "wait_blocking": wait_blocking}
+        )
+        self.tools.register(
+            agentgear.FunctionSchema(name="wait_short", description="Wait briefly"),
+            wait_blocking,
+            timeout=0.05,
+        )
+
+    def tearDown(self):
+        """Stop executor threads."""
+        self.tools.close()
+
+    def test_concurrent(self):
+        """Calls run at the same time, outputs keep order of calls."""
+        started = time.perf_counter()
+        outputs = self.tools.execute(
+            [
+                get_tool_call("1", "wait_async", seconds=0.2),
+                get_tool_call("2", "wait_blocking", seconds=0.2),
+                get_tool_call("3", "wait_blocking", seconds=0.2),
+            ]
+        )
+        self.assertLess(time.perf_counter() - started, 0.35)
+        self.assertEqual(
+            [
+                {"tool_call_id": "1", "output": '{"waited": 0.2}'},
+                {"tool_call_id": "2", "output": "done"},
+                {"tool_call_id": "3", "output": "done"},
+            ],
+            outputs,
+        )
+
+    def test_errors(self):
+        """Failed, unknown and timed out calls are answered with error."""
+        outputs = self.tools.execute(
+            [
+                get_tool_call("1", "wait_short", seconds=0.2),
+                get_tool_call("2", "missing"),
+                get_tool_call("3", "wait_async", minutes=1),
+            ]
+        )
+        self.assertIn("timed out", outputs[0]["output"])
+        self.assertEqual("Error: Unknown tool missing", outputs[1]["output"])
+        self.assertTrue(outputs[2]["output"].startswith("Error: "))
+
+    def test_loop(self):
+        """Tools are executed outside of event loop thread only."""
+
+        async def execute():
+            self.tools.execute([get_tool_call("1", "wait_async", seconds=0)])
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(execute())
+
+
+class FakeRun:
+    """Stream of run that sends prepared events to handler."""
+
+    def __init__(self, handler, events):
+        """Initialise stream."""
+        self.handler = handler
+        self.events = events
+
+    def __enter__(self):
+        """Enter stream."""
+        return self
+
+    def __exit__(self, *args):
+        """Exit stream."""
+
+    def until_done(self):
+        """Send events to handler."""
+        for event in self.events:
+            if isinstance(event, str):
+                text = types.SimpleNamespace(value=event, annotations=[])
+                self.handler.on_text_done(text)
+            else:
+                self.handler.on_event(event)
+
+
+class Handoff(unittest.TestCase):
+    """Testcases on runs with tool calls and handoffs."""
+
+    def setUp(self):
+        """Prepare fake runs endpoint."""
+        required = types.SimpleNamespace(
+            submit_tool_outputs=types.SimpleNamespace(
+                tool_calls=[
+                    get_tool_call("1", "wait_blocking", seconds=0),
+                    get_tool_call("2", "transfer_to_Expert"),
+                ]
+            )
+        )
+        action = types.SimpleNamespace(
+            event="thread.run.requires_action",
+            data=types.SimpleNamespace(id="run_1", required_action=required),
+        )
+        self.events = {"asst_main": [action], "asst_expert": ["Expert answer"]}
+        self.started = []
+        self.submitted = []
+        runs = types.SimpleNamespace(
+            stream=self.stream, submit_tool_outputs_stream=self.submit
+        )
+        self.client = types.SimpleNamespace(
+            beta=types.SimpleNamespace(threads=types.SimpleNamespace(runs=runs))
+        )
+
+    def stream(self, thread_id, assistant_id, event_handler):
+        """Start run of assistant."""
+        self.started.append(assistant_id)
+        return FakeRun(event_handler, self.events[assistant_id])
+
+    def submit(self, thread_id, run_id, tool_outputs, event_handler):
+        """Submit tool outputs."""
+        self.submitted.append(tool_outputs)
+        return FakeRun(event_handler, [])
+
+    def test_handoff(self):
+        """Outputs are submitted at once and expert agent answers next."""
+        answers = []
+        package = chatbot.Package(chatbot.Conversation(), answers.append)
+        tools = agentgear.ToolExecutor({"wait_blocking": wait_blocking})
+        name = agentgear.stream_agent(
+            self.client,
+            "thread",
+            "Main",
+            {"Main": "asst_main", "Expert": "asst_expert"},
+            package,
+            None,
+            tools,
+        )
+        tools.close()
+        self.assertEqual("Expert", name)
+        self.assertEqual(["asst_main", "asst_expert"], self.started)
+        self.assertEqual(
+            [
+                [
+                    {"tool_call_id": "1", "output": "done"},
+                    {"tool_call_id": "2", "output": "Transferred to Expert"},
+                ]
+            ],
+            self.submitted,
+        )
+        self.assertEqual(["Expert answer"], answers)
+
+    def test_exhausted(self):
+        """Agent that ran last is returned when handoffs are exhausted."""
+        package = chatbot.Package(chatbot.Conversation(), lambda x: None)
+        tools = agentgear.ToolExecutor({"wait_blocking": wait_blocking})
+        with self.assertLogs("zoozl.agentgear.tools", "WARNING"):
+            name = agentgear.stream_agent(
+                self.client,
+                "thread",
+                "Main",
+                {"Main": "asst_main", "Expert": "asst_expert"},
+                package,
+                None,
+                tools,
+                max_handoffs=0,
+            )
+        tools.close()
+        self.assertEqual("Main", name)
+        self.assertEqual(["asst_main"], self.started)
+
+    def test_scheduler(self):
+        """Run requests are admitted one at a time without holding slot."""
+        requests = chatbot.RequestScheduler(max_concurrency=1)
+        package = chatbot.Package(chatbot.Conversation(), lambda x: None)
+        tools = agentgear.ToolExecutor({"wait_blocking": wait_blocking})
+        agentgear.stream_agent(
+            self.client,
+            "thread",
+            "Main",
+            {"Main": "asst_main", "Expert": "asst_expert"},
+            package,
+            None,
+            tools,
+            scheduler=requests,
+        )
+        tools.close()
+        self.assertEqual({"completed": 3, "queued": 0, "in_flight": 0}, requests.stats)
+
+
+class FakeThreads:
+    """Threads endpoint keeping messages of threads in memory."""
+
+    def __init__(self):
+        """Initialise endpoint."""
+        self.threads = {}
+        self.ids = itertools.count()
+        self.calls = 0
+        self.messages = types.SimpleNamespace(create=self.add)
+
+    def create(self, messages):
+        """Create thread with messages."""
+        self.calls += 1
+        thread = types.SimpleNamespace(id=f"thread_{next(self.ids)}")
+        self.threads[thread.id] = [i["content"] for i in messages]
+        return thread
+
+    def add(self, thread_id, role, content):
+        """Add message to thread."""
+        self.calls += 1
+        self.threads[thread_id].append(content)
+
+    def delete(self, thread_id):
+        """Delete thread."""
+        self.calls += 1
+        del self.threads[thread_id]
+
+
+class Threads(unittest.TestCase):
+    """Testcases on threads of conversations."""
+
+    def setUp(self):
+        """Prepare sessions with fake client."""
+        self.threads = FakeThreads()
+        client = types.SimpleNamespace(beta=types.SimpleNamespace(threads=self.threads))
+        self.sessions = agentgear.ThreadSessions(client, author="bot", max_threads=2)
+
+    def ask(self, conversation, *texts):
+        """Add talker messages with bot replies to conversation, return thread id."""
+        for text in texts:
+            conversation.messages.append(chatbot.Message(text, author="talker"))
+            conversation.messages.append(chatbot.Message("reply", author="bot"))
+        return self.sessions.sync(conversation)
+
+    def test_sync(self):
+        """Only new talker messages are sent to thread of conversation."""
+        conversation = chatbot.Conversation()
+        thread_id = self.ask(conversation, "hello", "how are you")
+        self.assertEqual(1, self.threads.calls)
+        self.assertEqual(thread_id, self.ask(conversation, "bye"))
+        self.assertEqual(2, self.threads.calls)
+        self.assertEqual(
+            ["hello", "how are you", "bye"], self.threads.threads[thread_id]
+        )
+        self.assertEqual(thread_id, conversation.data["openai_thread"]["id"])
+
+    def test_compacted(self):
+        """Messages added after older ones are trimmed are still sent."""
+        conversation = chatbot.Conversation()
+        thread_id = self.ask(conversation, *[f"message {i}" for i in range(15)])
+        del conversation.messages[:-10]
+        self.ask(conversation, "new")
+        self.assertEqual("new", self.threads.threads[thread_id][-1])
+        self.assertEqual(16, len(self.threads.threads[thread_id]))
+        stored = chatbot.Conversation(**dataclasses.asdict(conversation))
+        self.ask(stored, "stored")
+        self.assertEqual("stored", self.threads.threads[thread_id][-1])
+        self.assertEqual(17, len(self.threads.threads[thread_id]))
+
+    def test_evicted(self):
+        """Conversation evicted from cache reuses thread kept in its data."""
+        first, second, third = [chatbot.Conversation() for _ in range(3)]
+        thread_id = self.ask(first, "first")
+        self.ask(second, "second")
+        self.ask(third, "third")
+        self.assertNotIn(first.uuid, self.sessions.threads)
+        stored = chatbot.Conversation(**dataclasses.asdict(first))
+        self.assertEqual(thread_id, self.ask(stored, "again"))
+        self.assertEqual(["first", "again"], self.threads.threads[thread_id])
+
+    def test_collect(self):
+        """Idle threads are deleted and conversation starts new thread."""
+        conversation = chatbot.Conversation()
+        thread_id = self.ask(conversation, "hello")
+        self.assertEqual(0, self.sessions.collect())
+        self.sessions.idle_timeout = -1
+        self.assertEqual(1, self.sessions.collect())
+        self.assertEqual({}, self.threads.threads)
+        self.sessions.idle_timeout = 60
+        conversation.data["openai_thread"]["used"] -= 120
+        new_id = self.ask(conversation, "again")
+        self.assertNotEqual(thread_id, new_id)
+        self.assertEqual(["hello", "again"], self.threads.threads[new_id])
+
+    def test_restore(self):
+        """Threads of stored conversations are collected after restart."""
+        storage = chatbot.storage.MemoryStorage()
+        conversation = chatbot.Conversation()
+        thread_id = self.ask(conversation, "hello")
+        conversation.data["openai_thread"]["used"] -= 120
+        asyncio.run(storage.put(conversation))
+        sessions = agentgear.ThreadSessions(
+            self.sessions.client, idle_timeout=60, storage=storage
+        )
+        self.assertEqual(0, sessions.collect())
+        self.assertEqual(1, asyncio.run(sessions.restore(page=1)))
+        self.assertEqual(1, sessions.collect())
+        self.assertNotIn(thread_id, self.threads.threads)
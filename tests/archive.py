@@ -0,0 +1,76 @@
+"""Testcases on conversation history archival."""
+
+import tempfile
+import threading
+
+from zoozl import chatbot
+from zoozl.chatbot import archive
+from zoozl.tests import TestChatbot
+
+from tests import base as bs
+
+
+class Archive(bs.TestCase):
+    """Testcases on archiving conversation history."""
+
+    def setUp(self):
+        """Set up chatbot that archives into temporary directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.bot = TestChatbot()
+        self.bot.load(
+            {
+                "extensions": ["zoozl.plugins.pong"],
+                "archive_path": self.tmp.name,
+                "history_hot_messages": 2,
+            }
+        )
+        self.root = self.bot._interfaces
+
+    def tearDown(self):
+        """Remove temporary archive."""
+        self.bot.close()
+        self.tmp.cleanup()
+
+    async def test_compact(self):
+        """Ongoing conversation keeps only hot messages."""
+        for i in range(6):
+            await self.bot.ask(f"message {i}")
+        conversation = await self.root.storage.get_ongoing("caller")
+        self.assertEqual(
+            ["message 4", "message 5"], [i.text for i in conversation.messages]
+        )
+        # Trimmed messages are written before conversation is saved
+        self.assertEqual(0, self.root.archiver.flush())
+        records = list(self.root.archiver.read(archive.get_day()))
+        self.assertEqual(4, len(records))
+        self.assertEqual("message", records[0]["type"])
+        self.assertEqual("message 0", records[0]["message"]["parts"][0]["text"])
+
+    async def test_finished(self):
+        """Finished conversations are moved out of storage."""
+        await self.bot.ask("hello")
+        await self.bot.bot.clear_subject()
+        await self.bot.ask("hello again")
+        self.assertEqual(1, await self.root.archiver.step(self.root.storage))
+        self.assertEqual(0, await self.root.archiver.step(self.root.storage))
+        self.assertEqual([], await self.root.storage.list_finished(10))
+        conversation = await self.root.storage.get_ongoing("caller")
+        self.assertEqual("hello again", conversation.messages[0].text)
+        records = list(self.root.archiver.read(archive.get_day()))
+        self.assertEqual(1, len(records))
+        conversation = chatbot.Conversation(**records[0]["conversation"])
+        self.assertEqual("hello", conversation.messages[0].text)
+
+    async def test_thread(self):
+        """Segments are written outside event loop thread."""
+        threads = []
+        flush = self.root.archiver.flush
+
+        def record():
+            threads.append(threading.get_ident())
+            return flush()
+
+        self.root.archiver.flush = record
+        await self.root.archiver.step(self.root.storage)
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertEqual(1, len(threads))
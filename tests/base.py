@@ -111,6 +111,12 @@ class AbstractSlack(SlackMethods, ConfigurationMethods, TestCase):
             task1 = tg.create_task(asyncio.to_thread(super().send_slack_event, body))
         return task1.result()
 
+    async def wait_called(self, mock, timeout=2):
+        """Wait until mock is called, event is handled after slack is answered."""
+        async with asyncio.timeout(timeout):
+            while not mock.called:
+                await asyncio.sleep(0.01)
+
     def assert_slack_called_with(self, mock, secret, channel, message):
         """Check if mock was called with arguments."""
         call = mock.call_args
@@ -0,0 +1,86 @@
+"""Testcases on cancelling subjects without calling cancel plugin every turn.
+
+Module is also loaded as chatbot extension, it provides cancel and quiz plugins.
+"""
+
+from zoozl import chatbot
+from zoozl.chatbot import Interface, interface
+
+from tests import base as bs
+
+CALLS = []
+
+
+class Cancel(Interface):
+    """Plugin that cancels with few phrases."""
+
+    aliases = {"cancel", "stop"}
+    examples = {"never mind"}
+
+    async def consume(self, package):
+        """Confirm cancel."""
+        CALLS.append("cancel")
+        package.callback("Cancelled")
+
+
+class Quiz(Interface):
+    """Plugin that asks questions until talker gives up."""
+
+    aliases = {"start quiz"}
+
+    async def consume(self, package):
+        """Ask next question."""
+        CALLS.append("quiz")
+        package.callback("Next question")
+
+    def is_cancelled(self, package):
+        """Talker gives up quiz."""
+        return package.last_message_text.startswith("give up")
+
+
+class Cancelling(bs.TestCase):
+    """Testcases on cancelling ongoing subject."""
+
+    def setUp(self):
+        """Load interface root with cancel and quiz plugins."""
+        CALLS.clear()
+        self.root = chatbot.InterfaceRoot({"extensions": ["tests.cancel"]})
+        self.root.load()
+        self.answers = []
+        self.bot = chatbot.Chat("talker", self.answers.append, self.root)
+
+    def tearDown(self):
+        """Close interface root."""
+        self.root.close()
+
+    async def test_not_called(self):
+        """Turns of ongoing subject call subject plugin only."""
+        for text in ("start quiz", "42", "no idea"):
+            await self.bot.ask(chatbot.Message(text))
+        self.assertEqual(["quiz"] * 3, CALLS)
+        self.assertEqual("start quiz", self.bot.subject)
+
+    async def test_phrases(self):
+        """Aliases and examples of cancel plugin cancel apart from case."""
+        for text in ("Stop!", "never  mind", "CANCEL"):
+            await self.bot.ask(chatbot.Message("start quiz"))
+            await self.bot.ask(chatbot.Message(text))
+            self.assertEqual("", self.bot.subject)
+        self.assertEqual(["quiz", "cancel"] * 3, CALLS)
+        self.assertEqual("Cancelled", self.answers[-1].text)
+
+    async def test_predicate(self):
+        """Predicate of subject plugin cancels."""
+        await self.bot.ask(chatbot.Message("start quiz"))
+        await self.bot.ask(chatbot.Message("give up now"))
+        self.assertEqual(["quiz", "cancel"], CALLS)
+        self.assertEqual("", self.bot.subject)
+        self.assertFalse(self.bot.conversation.messages)
+
+    def test_catch_all(self):
+        """Interface that handles all special aliases cancels only with cancel."""
+        helper = Interface()
+        helper.aliases = {"cancel", "greet", "help", "hello"}
+        routes = interface.Routes()
+        routes.register(helper)
+        self.assertEqual({"cancel"}, routes.get_cancels())
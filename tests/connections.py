@@ -0,0 +1,264 @@
+"""Testcases on connection handling, heartbeat and gateway of zoozl server."""
+
+import asyncio
+import base64
+import json
+from unittest.mock import MagicMock
+
+import websockets
+
+from zoozl import chatbot, server
+from zoozl.websocket import FrameQueue, Heartbeat
+
+from tests import base as bs
+
+
+class AbstractConnections(bs.TestCase):
+    """Abstract testcase with websocket server running in test loop."""
+
+    ws_port = 30010
+    conf = {
+        "extensions": ["zoozl.plugins.pong"],
+        "websocket_port": ws_port,
+        "force_bind": True,
+    }
+
+    async def asyncSetUp(self):
+        """Start websocket server."""
+        self.root = chatbot.InterfaceRoot(self.conf)
+        self.root.load()
+        self.connections = []
+        self.servers = await server.build_servers(
+            self.root, self.conf, self.connections
+        )
+
+    async def asyncTearDown(self):
+        """Stop websocket server."""
+        await server.drain_servers(self.servers, self.connections, timeout=1)
+        for srv in self.servers:
+            await srv.wait_closed()
+        self.root.close()
+
+    def connect(self):
+        """Return websocket client connection."""
+        return websockets.connect(f"ws://localhost:{self.ws_port}")
+
+
+class Limits(AbstractConnections):
+    """Testcases on connection limits."""
+
+    conf = dict(AbstractConnections.conf, max_connections_per_ip=1)
+
+    async def test_per_ip(self):
+        """Second connection from the same address is rejected."""
+        async with self.connect() as websocket:
+            await websocket.send('{"text": "ping"}')
+            self.assertEqual('{"author": "", "text": "ping"}', await websocket.recv())
+            with self.assertRaises(websockets.InvalidStatus) as catch:
+                async with self.connect():
+                    pass
+            self.assertEqual(503, catch.exception.response.status_code)
+        # Slot is released after connection is closed
+        async with self.connect() as websocket:
+            await websocket.send('{"text": "ping"}')
+            self.assertEqual('{"author": "", "text": "ping"}', await websocket.recv())
+
+
+class Idle(AbstractConnections):
+    """Testcases on idle connections."""
+
+    conf = dict(AbstractConnections.conf, websocket_idle_timeout=0.2)
+
+    async def test_idle(self):
+        """Idle connection is closed with close handshake."""
+        async with self.connect() as websocket:
+            async with asyncio.timeout(2):
+                await websocket.wait_closed()
+            self.assertEqual(1001, websocket.close_code)
+        self.assertEqual({}, self.connections[0].connections)
+
+
+class Drain(AbstractConnections):
+    """Testcases on draining connections on shutdown."""
+
+    async def test_drain(self):
+        """Open connections are asked to go away."""
+        async with self.connect() as websocket:
+            await websocket.send('{"text": "ping"}')
+            await websocket.recv()
+            await self.connections[0].drain(timeout=2)
+            self.assertEqual(1001, websocket.close_code)
+            self.assertEqual({}, self.connections[0].connections)
+        with self.assertRaises(websockets.InvalidStatus):
+            async with self.connect():
+                pass
+
+
+class FakeQueue:
+    """Frame queue that records frames put into it."""
+
+    def __init__(self):
+        """Initialise with no frames."""
+        self.frames = []
+
+    def put(self, frame):
+        """Record frame."""
+        self.frames.append(frame)
+
+
+class Stuck(bs.TestCase):
+    """Testcases on closing frame queue of peer that stopped reading."""
+
+    async def test_close(self):
+        """Connection is aborted when queued frames are not read within timeout."""
+        writer = MagicMock()
+        writer.drain.side_effect = asyncio.Event().wait
+        queue = FrameQueue(writer)
+        queue.start()
+        queue.put(b"frame")
+        async with asyncio.timeout(2):
+            await queue.close(timeout=0.05)
+        writer.transport.abort.assert_called_once()
+
+
+class Heartbeats(bs.TestCase):
+    """Testcases on heartbeat scheduler."""
+
+    async def asyncSetUp(self):
+        """Set up heartbeat with two ticks between pings."""
+        self.heartbeat = Heartbeat(interval=20, timeout=10, tick=10)
+        self.queue = FakeQueue()
+        self.dead = MagicMock()
+        self.stats = self.heartbeat.register(self.queue, self.dead)
+
+    async def test_dead(self):
+        """Peer not answering ping is evicted."""
+        self.heartbeat.advance()
+        self.assertEqual([], self.queue.frames)
+        self.heartbeat.advance()
+        self.assertEqual(1, len(self.queue.frames))
+        self.assertEqual(1, self.stats.pings)
+        self.heartbeat.advance()
+        self.dead.assert_called_once()
+        self.assertEqual(0, len(self.heartbeat))
+
+    async def test_alive(self):
+        """Peer answering ping is measured and pinged again."""
+        self.heartbeat.advance()
+        self.heartbeat.advance()
+        payload = self.queue.frames[0][2:]
+        self.assertIsNotNone(self.heartbeat.pong(self.queue, payload))
+        self.assertIsNone(self.heartbeat.pong(self.queue, payload))
+        self.heartbeat.advance()
+        self.heartbeat.advance()
+        self.dead.assert_not_called()
+        self.assertEqual(2, len(self.queue.frames))
+        self.assertEqual(1, self.stats.pongs)
+        self.assertEqual(self.stats.last_rtt, self.stats.avg_rtt)
+
+
+class Ping(AbstractConnections):
+    """Testcases on server sent pings."""
+
+    conf = dict(
+        AbstractConnections.conf,
+        websocket_ping_interval=0.1,
+        websocket_ping_timeout=0.1,
+    )
+
+    async def test_rtt(self):
+        """Round trip time is measured for connected talker."""
+        async with self.connect():
+            await asyncio.sleep(0.5)
+            (connection,) = self.connections[0].connections.values()
+            self.assertGreater(connection.stats.pongs, 1)
+            self.assertGreater(connection.stats.avg_rtt, 0)
+
+
+class Auth(AbstractConnections):
+    """Testcases on connections of authenticated talkers."""
+
+    conf = dict(AbstractConnections.conf, auth_required=True)
+
+    async def test_greet(self):
+        """Greeting waits on turn of talker running on another channel."""
+        payload = base64.urlsafe_b64encode(b'{"email": "talker@localhost"}')
+        auth = {"token": f"e30.{payload.decode()}.sig"}
+        async with self.connect() as websocket:
+            async with self.root.turn("talker@localhost"):
+                await websocket.send(json.dumps({"auth": auth}))
+                await asyncio.sleep(0.1)
+                self.assertNotIn("talker@localhost", self.root.sessions)
+            await websocket.send('{"text": "ping"}')
+            async with asyncio.timeout(2):
+                self.assertEqual(
+                    {"author": "", "text": "ping"}, json.loads(await websocket.recv())
+                )
+            self.assertIn("talker@localhost", self.root.sessions)
+
+
+class Gateway(AbstractConnections):
+    """Testcases on multiplexed gateway connection."""
+
+    conf = dict(
+        AbstractConnections.conf,
+        websocket_gateway_token="secret",
+        max_sessions=1,
+    )
+
+    def connect(self, token="secret"):
+        """Return gateway websocket connection."""
+        return websockets.connect(
+            f"ws://localhost:{self.ws_port}",
+            additional_headers={"X-Zoozl-Gateway": token},
+        )
+
+    async def receive(self, websocket, count):
+        """Receive count packets."""
+        async with asyncio.timeout(2):
+            return [json.loads(await websocket.recv()) for _ in range(count)]
+
+    async def test_multiplex(self):
+        """Talkers share one connection."""
+        async with self.connect() as websocket:
+            for talker in ("a", "b", "c", "a"):
+                await websocket.send(json.dumps({"talker": talker, "text": talker}))
+            packets = await self.receive(websocket, 4)
+            self.assertCountEqual(
+                [
+                    {"author": "", "text": "a", "talker": "a"},
+                    {"author": "", "text": "b", "talker": "b"},
+                    {"author": "", "text": "c", "talker": "c"},
+                    {"author": "", "text": "a", "talker": "a"},
+                ],
+                packets,
+            )
+            await websocket.send('{"text": "no talker"}')
+            packets = await self.receive(websocket, 1)
+            self.assertEqual([{"error": "Missing 'talker' key in JSON"}], packets)
+
+    async def test_shared(self):
+        """Talker shares one chat of interface root with other channels."""
+        async with self.connect() as websocket:
+            await websocket.send('{"talker": "a", "text": "one"}')
+            await self.receive(websocket, 1)
+            replies = []
+            gateway = self.root.sessions.get("a")
+            async with self.root.turn("a"):
+                bot = await self.root.session("slack:C1", "a", replies.append)
+                self.assertIs(gateway, bot)
+                await bot.ask(chatbot.Message("two"))
+            await websocket.send('{"talker": "a", "text": "three"}')
+            packets = await self.receive(websocket, 1)
+            self.assertIs(bot, self.root.sessions.get("a"))
+        self.assertEqual(["two"], [i.text for i in replies])
+        self.assertEqual([{"author": "", "text": "three", "talker": "a"}], packets)
+
+    async def test_invalid_token(self):
+        """Connection with invalid token serves single talker."""
+        async with self.connect("invalid") as websocket:
+            await websocket.send('{"talker": "a", "text": "hello"}')
+            packets = await self.receive(websocket, 1)
+            self.assertEqual([{"author": "", "text": "hello"}], packets)
+            # Single talker connection takes Chat from session registry as well
+            self.assertEqual(1, len(self.root.sessions))
@@ -0,0 +1,177 @@
+"""Testcases on delivery of replies through async callbacks.
+
+Module is also loaded as chatbot extension, it provides plugins that send replies.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+from zoozl import chatbot
+from zoozl.chatbot import Interface
+
+from tests import base as bs
+
+
+class Shout(Interface):
+    """Plugin that replies without waiting on delivery."""
+
+    aliases = {"shout"}
+
+    async def consume(self, package):
+        """Reply twice, second time from thread."""
+        package.callback("one")
+        thread = threading.Thread(target=package.callback, args=("two",))
+        thread.start()
+        thread.join()
+
+
+class Talk(Interface):
+    """Plugin that waits on delivery of every reply."""
+
+    aliases = {"talk"}
+
+    async def consume(self, package):
+        """Reply three times."""
+        package.callback("one")
+        for text in ("two", "three"):
+            await package.send(text)
+
+
+class Burst(Interface):
+    """Plugin that replies several times at once."""
+
+    aliases = {"burst"}
+
+    async def consume(self, package):
+        """Reply three times without waiting."""
+        for text in ("one", "two", "three"):
+            package.callback(text)
+
+
+class Story(Interface):
+    """Plugin that streams reply and replies once more."""
+
+    aliases = {"story"}
+
+    async def consume(self, package):
+        """Stream reply and reply without waiting."""
+        stream = package.stream()
+        stream.write("once")
+        stream.close()
+        package.callback("after")
+
+
+class SlowStream(chatbot.TextStream):
+    """Stream that delivers whole text later from thread."""
+
+    def __init__(self, delivered, pool):
+        """Initialise stream recording delivered texts."""
+        super().__init__()
+        self.delivered = delivered
+        self.pool = pool
+
+    def finish(self, text):
+        """Deliver whole text after delay, return future of delivery."""
+
+        def deliver():
+            time.sleep(0.05)
+            self.delivered.append(text)
+
+        return self.pool.submit(deliver)
+
+
+class Transport:
+    """Transport that lets through one message at a time when released.
+
+    Failing transport raises on delivery as if talker has gone.
+    """
+
+    def __init__(self):
+        """Initialise transport with no messages delivered."""
+        self.delivered = []
+        self.failing = False
+        self.slots = asyncio.Semaphore(0)
+
+    async def __call__(self, message):
+        """Deliver message once slot is released."""
+        await self.slots.acquire()
+        if self.failing:
+            raise ConnectionError("Talker is gone")
+        self.delivered.append(message.text)
+
+
+class Delivery(bs.TestCase):
+    """Testcases on replies sent over async callback."""
+
+    def setUp(self):
+        """Load interface root with sending plugins."""
+        self.root = chatbot.InterfaceRoot({"extensions": ["tests.delivery"]})
+        self.root.load()
+        self.transport = Transport()
+        self.bot = chatbot.Chat("talker", self.transport, self.root)
+
+    def tearDown(self):
+        """Close interface root."""
+        self.root.close()
+
+    async def test_shim(self):
+        """Replies given to sync callback are delivered before turn ends."""
+        for _ in range(2):
+            self.transport.slots.release()
+        await self.bot.ask(chatbot.Message("shout"))
+        self.assertEqual(["one", "two"], self.transport.delivered)
+
+    async def test_backpressure(self):
+        """Plugin waits until transport delivers its replies in order."""
+        turn = asyncio.create_task(self.bot.ask(chatbot.Message("talk")))
+        for count in range(1, 4):
+            await asyncio.sleep(0.01)
+            self.assertFalse(turn.done())
+            self.assertEqual(count - 1, len(self.transport.delivered))
+            self.transport.slots.release()
+        await turn
+        self.assertEqual(["one", "two", "three"], self.transport.delivered)
+
+    async def test_order(self):
+        """Replies given to sync callback are delivered in order they were given."""
+        delivered = []
+
+        async def transport(message):
+            await asyncio.sleep(0.05 if message.text == "one" else 0)
+            delivered.append(message.text)
+
+        bot = chatbot.Chat("talker", transport, self.root)
+        await bot.ask(chatbot.Message("burst"))
+        self.assertEqual(["one", "two", "three"], delivered)
+
+    async def test_stream(self):
+        """Whole text of stream is delivered before next reply and within turn."""
+        delivered = []
+
+        async def transport(message):
+            delivered.append(message.text)
+
+        with concurrent.futures.ThreadPoolExecutor(1) as pool:
+            bot = chatbot.Chat(
+                "talker", transport, self.root, lambda: SlowStream(delivered, pool)
+            )
+            await bot.ask(chatbot.Message("story"))
+            self.assertEqual(["once", "after"], delivered)
+
+    async def test_failed(self):
+        """Failed delivery of reply fails the turn."""
+        self.transport.failing = True
+        for _ in range(2):
+            self.transport.slots.release()
+        with self.assertRaises(ConnectionError):
+            await self.bot.ask(chatbot.Message("shout"))
+
+    async def test_sync(self):
+        """Package without sender awaits callback that returns awaitable."""
+        transport = Transport()
+        transport.slots.release()
+        package = chatbot.Package(chatbot.Conversation(), transport)
+        await package.send(chatbot.Message("hello"))
+        self.assertEqual(["hello"], transport.delivered)
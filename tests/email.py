@@ -19,7 +19,7 @@ from smtplib import LMTP
 
 from zoozl import chatbot, emailer
 
-from tests import base as bs
+from tests import base as bs, fixtures as fix
 from tests.fixtures import smtp_server, zoozl_server
 
 
@@ -60,7 +60,15 @@ class EmailHandler(smtp_server.AsyncMessage):
             raise ValueError(f"Unknown recipient {message['to']}")
 
     async def forward_to_lmtp(self, message: email.message.Message):
-        """Forward message to LMTP server."""
+        """Forward message to LMTP server.
+
+        Zoozl server delivers reply before it confirms message, thus forwarding
+        must not block server that receives reply.
+        """
+        await asyncio.to_thread(self.send_lmtp, message)
+
+    def send_lmtp(self, message: email.message.Message):
+        """Send message to LMTP server."""
         with LMTP(host="localhost", port=self.receiver_port) as lmtp:
             lmtp.send_message(message, message["from"], message["to"])
 
@@ -116,3 +124,32 @@ class Email(bs.AbstractServer):
         self.assertEqual(message["from"], self.sender)
         for part in message.walk():
             self.assertIn(text, message.get_payload().strip())
+
+
+class Replies(bs.TestCase):
+    """Testcases on replies of turn collected into one email."""
+
+    @fix.patch("zoozl.emailer.send")
+    async def test_merged(self, mock_send):
+        """Texts are joined and files attached in one email."""
+        replies = emailer.Replies("bot@local", "talker@local", "Hi", port=8025)
+        replies(chatbot.Message("Hello", author="bot"))
+        replies(
+            chatbot.Message(
+                [
+                    chatbot.MessagePart("What next?"),
+                    chatbot.MessagePart("", b"%PDF", "application/pdf", "a.pdf"),
+                ]
+            )
+        )
+        await replies.send()
+        await replies.send()
+        mock_send.assert_called_once()
+        sender, receiver, subject, msg, port = mock_send.call_args.args
+        self.assertEqual(
+            ("bot@local", "talker@local", "Hi", 8025), (sender, receiver, subject, port)
+        )
+        self.assertEqual("bot", msg.author)
+        self.assertEqual("Hello\n\nWhat next?", msg.parts[0].text)
+        mail = emailer.deserialise_email(sender, receiver, subject, msg)
+        self.assertEqual(["a.pdf"], [i.get_filename() for i in mail.iter_attachments()])
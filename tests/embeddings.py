@@ -0,0 +1,204 @@
+"""Testcases on embeddings and intent index."""
+
+import os
+import tempfile
+
+import numpy as np
+
+from zoozl import chatbot
+from zoozl.chatbot import embeddings
+
+from tests import base as bs
+
+
+def get_clustered(count, dimensions=32, clusters=50, seed=1):
+    """Return labels and vectors scattered around cluster centres."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dimensions))
+    labels = [f"intent {i % clusters}" for i in range(count)]
+    vectors = [
+        centres[i % clusters] + rng.normal(scale=0.1, size=dimensions)
+        for i in range(count)
+    ]
+    return labels, vectors, centres
+
+
+class Index(bs.TestCase):
+    """Testcases on brute force and IVF indexes."""
+
+    def test_brute_force(self):
+        """Best label per phrasing is returned with score."""
+        index = embeddings.BruteForceIndex(
+            ["a", "a", "b", "c"], [[1, 0], [1, 1], [0, 1], [-1, 0]]
+        )
+        found = index.search([1, 0.1], k=2)
+        self.assertEqual(["a", "b"], [i for i, _ in found])
+        self.assertAlmostEqual(1, found[0][1], places=2)
+        self.assertEqual(3, len(index.search([1, 0], k=5)))
+        self.assertEqual(0, index.search([0, 0])[0][1])
+        self.assertEqual([], embeddings.BruteForceIndex([], []).search([1, 0]))
+
+    def test_ivf(self):
+        """IVF index finds nearly the same intents as exact search."""
+        labels, vectors, centres = get_clustered(5000)
+        exact = embeddings.BruteForceIndex(labels, vectors)
+        index = embeddings.IVFIndex(labels, vectors)
+        self.assertEqual(70, len(index.lists))
+        found = 0
+        for centre in centres:
+            expected = exact.search(centre, k=3)
+            approximate = index.search(centre, k=3)
+            self.assertEqual(expected[0], approximate[0])
+            found += len({i for i, _ in expected} & {i for i, _ in approximate})
+        self.assertGreater(found / (3 * len(centres)), 0.8)
+
+    def test_persist(self):
+        """Index is loaded from file only under the same key."""
+        labels, vectors, centres = get_clustered(500)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "intents.npz")
+            index = embeddings.IVFIndex(labels, vectors)
+            index.save(path, "key")
+            self.assertIsNone(embeddings.load_index(path, "other"))
+            loaded = embeddings.load_index(path, "key")
+            self.assertIsInstance(loaded, embeddings.IVFIndex)
+            self.assertEqual(index.search(centres[0]), loaded.search(centres[0]))
+
+
+class Char(bs.TestCase):
+    """Testcases on local character embedder."""
+
+    def test_counts(self):
+        """Letters, separators, digits and other characters are counted."""
+        embedder = embeddings.CharEmbedder()
+        vector = embedder.get("Ab, 1ā😀\udcff")
+        self.assertEqual(29, len(vector))
+        self.assertEqual([1, 1], vector[:2])
+        self.assertEqual([2, 1, 3], vector[-3:])
+        self.assertEqual(8, sum(vector))
+        self.assertEqual([0] * 29, embedder.get(""))
+
+    def test_many(self):
+        """Batch embeds every text same as one by one."""
+        embedder = embeddings.CharEmbedder(ngrams=(2, 3), buckets=64)
+        texts = ["play games", "", "hello there", "ā"]
+        matrix = embedder.get_many(texts)
+        self.assertEqual((4, 93), matrix.shape)
+        self.assertEqual([embedder.get(i) for i in texts], matrix.tolist())
+        self.assertEqual((0, 93), embedder.get_many([]).shape)
+
+    def test_ngrams(self):
+        """N-grams tell apart texts of the same characters."""
+        plain = embeddings.CharEmbedder()
+        self.assertEqual(plain.get("stop"), plain.get("pots"))
+        embedder = embeddings.CharEmbedder(ngrams=(2,))
+        self.assertNotEqual(embedder.get("stop"), embedder.get("pots"))
+        self.assertEqual(3, sum(embedder.get("stop")[29:]))
+        self.assertNotEqual(plain.name, embedder.name)
+
+
+class CountingEmbedder(embeddings.CharEmbedder):
+    """Char embedder that counts embedded texts."""
+
+    def __init__(self):
+        """Initialise counter."""
+        super().__init__()
+        self.count = 0
+
+    def get_many(self, texts):
+        """Count and embed texts."""
+        self.count += len(texts)
+        return super().get_many(texts)
+
+
+class Routing(bs.TestCase):
+    """Testcases on routing messages with intent index."""
+
+    def setUp(self):
+        """Prepare temporary directory for index."""
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Remove temporary directory."""
+        self.tmp.cleanup()
+
+    def load(self, embedder):
+        """Return loaded interface root with persisted index."""
+        root = chatbot.InterfaceRoot(
+            {
+                "extensions": ["zoozl.plugins.helpers"],
+                "embedder": embedder,
+                "intent_index_path": os.path.join(self.tmp.name, "intents.npz"),
+            }
+        )
+        root.load()
+        return root
+
+    def test_best(self):
+        """Most similar alias wins over the first one above threshold."""
+        root = self.load(embeddings.CharEmbedder())
+        cmd, score = root.find_subjects("how are yo")[0]
+        self.assertEqual("how are you", cmd)
+        self.assertGreater(score, 0.9)
+        self.assertEqual(3, len(root.find_subjects("hey", k=3)))
+        root.close()
+
+    def test_persisted(self):
+        """Aliases are not embedded again on next start."""
+        first = CountingEmbedder()
+        self.load(first).close()
+        self.assertGreater(first.count, 0)
+        second = CountingEmbedder()
+        root = self.load(second)
+        self.assertEqual(0, second.count)
+        self.assertEqual("hello", root.find_subjects("hello")[0][0])
+        root.close()
+
+
+class Tfidf(bs.TestCase):
+    """Testcases on local TF-IDF embedder."""
+
+    def test_route(self):
+        """Words around alias and unrelated messages are not routed wrongly."""
+        root = chatbot.InterfaceRoot(
+            {"extensions": ["zoozl.plugins.helpers"], "embedder": "tfidf"}
+        )
+        root.load()
+        self.assertIsInstance(root.lookup.embedder, embeddings.TfidfEmbedder)
+        cmd, score = root.find_subjects("can you play gmes please")[0]
+        self.assertEqual("play games", cmd)
+        self.assertGreater(score, root.subject_threshold)
+        _, score = root.find_subjects("where is my parcel")[0]
+        self.assertLess(score, root.subject_threshold)
+        root.close()
+
+    def test_workers(self):
+        """Large batches are embedded in worker processes with the same result."""
+        texts = ["play games", "hello there", "", "how are you?"] * 4
+        local = embeddings.TfidfEmbedder(dimensions=256).fit(texts[:3])
+        embedder = embeddings.TfidfEmbedder(dimensions=256, workers=2, min_batch=8)
+        embedder.warmup()
+        try:
+            fitted = embedder.fit(texts[:3])
+            self.assertIsNotNone(fitted.pool)
+            np.testing.assert_allclose(
+                local.get_many(texts), fitted.get_many(texts), rtol=1e-6
+            )
+        finally:
+            embedder.close()
+        self.assertIsNone(embedder.pool)
+
+    def test_refit(self):
+        """Index built for other entries leaves weights of existing index intact."""
+        lookup = embeddings.Lookup(None, embeddings.TfidfEmbedder(dimensions=256))
+        old = lookup.build_index([("games", "play games"), ("hello", "hello there")])
+        before = old.search(lookup.get("play games please", old))
+        lookup.build_index([("games", "play games"), ("games", "play chess")])
+        after = old.search(lookup.get("play games please", old))
+        self.assertEqual(before, after)
+        lookup.clear()
+
+    def test_unknown(self):
+        """Unknown embedder in configuration is refused."""
+        with self.assertRaises(RuntimeError):
+            embeddings.get_embedder({"embedder": "glove"})
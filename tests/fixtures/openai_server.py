@@ -0,0 +1,474 @@
+"""OpenAI compatible server for offline and load testing.
+
+Serves embeddings, assistants, threads, messages and runs endpoints, runs are
+streamed as server-sent events like OpenAI does. Latency, delay between streamed
+pieces, server errors and rate limiting are configurable, so that scheduler,
+embedders and agents are measured reproducibly without real API.
+
+Example usage:
+>>> from tests.fixtures import openai_server
+>>> with openai_server.OpenAIServer(latency=0.05, rate_limit_rate=0.1) as server:
+...     client = server.get_client()
+...     client.embeddings.create(input=["hello"], model="text-embedding-3-small")
+...     print(server.stats)
+
+Replies of runs are made by `respond(assistant, messages, outputs)` callable, that
+returns reply text or list of `(function name, arguments)` tool calls the run
+requires. Outputs are None on first step of run and list of submitted tool
+outputs afterwards. Default responder echoes last message of talker.
+"""
+
+import collections
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORD = re.compile(r"\S+\s*")
+IDS = itertools.count(1)
+
+
+def echo(assistant, messages, outputs):
+    """Reply with last message of talker or with tool outputs."""
+    if outputs:
+        return "Tools said: " + ", ".join(i["output"] for i in outputs)
+    said = [i["content"][0]["text"]["value"] for i in messages if i["role"] == "user"]
+    return f"You said: {said[-1] if said else ''}"
+
+
+def get_embedding(text, dimensions):
+    """Return normalised vector of hashed character trigrams of text."""
+    vector = [0.0] * dimensions
+    text = f" {text.lower()} "
+    for i in range(len(text) - 2):
+        vector[zlib.crc32(text[i:][:3].encode()) % dimensions] += 1
+    norm = math.sqrt(sum(i * i for i in vector)) or 1
+    return [i / norm for i in vector]
+
+
+def get_message(thread_id, role, text, **kwargs):
+    """Return message object."""
+    return dict(
+        {
+            "id": f"msg_{next(IDS)}",
+            "object": "thread.message",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "role": role,
+            "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+            "attachments": [],
+            "metadata": {},
+            "status": "completed",
+            "assistant_id": None,
+            "run_id": None,
+        },
+        **kwargs,
+    )
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Request handler of OpenAI API endpoints."""
+
+    protocol_version = "HTTP/1.1"
+    # Streamed pieces are sent at once, not held back until previous is acked
+    disable_nagle_algorithm = True
+    routes = (
+        ("POST", r"/embeddings", "create_embeddings"),
+        ("GET", r"/assistants", "list_assistants"),
+        ("POST", r"/assistants", "create_assistant"),
+        ("DELETE", r"/assistants/(?P<id>[^/]+)", "delete_assistant"),
+        ("POST", r"/threads", "create_thread"),
+        ("DELETE", r"/threads/(?P<id>[^/]+)", "delete_thread"),
+        ("GET", r"/threads/(?P<id>[^/]+)/messages", "list_messages"),
+        ("POST", r"/threads/(?P<id>[^/]+)/messages", "create_message"),
+        ("POST", r"/threads/(?P<id>[^/]+)/runs", "create_run"),
+        (
+            "POST",
+            r"/threads/(?P<id>[^/]+)/runs/(?P<run>[^/]+)/submit_tool_outputs",
+            "submit_tool_outputs",
+        ),
+    )
+
+    def log_message(self, format, *args):
+        """Keep test output quiet."""
+
+    def do_GET(self):
+        """Handle GET request."""
+        self.dispatch("GET")
+
+    def do_POST(self):
+        """Handle POST request."""
+        self.dispatch("POST")
+
+    def do_DELETE(self):
+        """Handle DELETE request."""
+        self.dispatch("DELETE")
+
+    def dispatch(self, method):
+        """Route request to endpoint, injecting latency and errors on the way."""
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length)) if length else {}
+        path = self.path.split("?")[0].removeprefix("/v1")
+        for route_method, pattern, name in self.routes:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                break
+        else:
+            self.send_json({"error": {"message": f"No route {path}"}}, 404)
+            return
+        server = self.server.api
+        server.count(name)
+        time.sleep(server.latency)
+        fault = server.get_fault()
+        if fault == 429:
+            server.count("rate_limited")
+            self.send_json(
+                {"error": {"message": "Rate limit reached", "type": "requests"}},
+                429,
+                {"retry-after": str(server.retry_after)},
+            )
+        elif fault:
+            server.count("failed")
+            self.send_json({"error": {"message": "Server error"}}, fault)
+        else:
+            getattr(self, name)(body, **match.groupdict())
+
+    def send_json(self, data, status=200, headers=None):
+        """Send JSON response."""
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_events(self, events):
+        """Send server-sent events, connection is closed after last one."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for event, data in events:
+            self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"event: done\ndata: [DONE]\n\n")
+
+    def create_embeddings(self, body):
+        """Return embeddings of input texts."""
+        texts = body["input"]
+        texts = [texts] if isinstance(texts, str) else texts
+        dimensions = self.server.api.dimensions
+        tokens = sum(len(i) for i in texts) // 4 + 1
+        self.send_json(
+            {
+                "object": "list",
+                "model": body.get("model", ""),
+                "data": [
+                    {
+                        "object": "embedding",
+                        "index": i,
+                        "embedding": get_embedding(text, dimensions),
+                    }
+                    for i, text in enumerate(texts)
+                ],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            }
+        )
+
+    def list_assistants(self, body):
+        """Return all assistants on one page."""
+        assistants = list(self.server.api.assistants.values())
+        self.send_json(
+            {
+                "object": "list",
+                "data": assistants,
+                "first_id": assistants[0]["id"] if assistants else None,
+                "last_id": assistants[-1]["id"] if assistants else None,
+                "has_more": False,
+            }
+        )
+
+    def create_assistant(self, body):
+        """Create assistant."""
+        assistant = {
+            "id": f"asst_{next(IDS)}",
+            "object": "assistant",
+            "created_at": int(time.time()),
+            "name": body.get("name"),
+            "description": body.get("description"),
+            "model": body.get("model", ""),
+            "instructions": body.get("instructions"),
+            "tools": body.get("tools", []),
+            "metadata": body.get("metadata", {}),
+        }
+        with self.server.api.lock:
+            self.server.api.assistants[assistant["id"]] = assistant
+        self.send_json(assistant)
+
+    def delete_assistant(self, body, id):
+        """Delete assistant."""
+        with self.server.api.lock:
+            deleted = self.server.api.assistants.pop(id, None) is not None
+        self.send_json({"id": id, "object": "assistant.deleted", "deleted": deleted})
+
+    def create_thread(self, body):
+        """Create thread with optional messages."""
+        thread_id = f"thread_{next(IDS)}"
+        messages = [
+            get_message(thread_id, i.get("role", "user"), i["content"])
+            for i in body.get("messages", [])
+        ]
+        with self.server.api.lock:
+            self.server.api.threads[thread_id] = messages
+        self.send_json(
+            {
+                "id": thread_id,
+                "object": "thread",
+                "created_at": int(time.time()),
+                "metadata": {},
+                "tool_resources": None,
+            }
+        )
+
+    def delete_thread(self, body, id):
+        """Delete thread."""
+        with self.server.api.lock:
+            deleted = self.server.api.threads.pop(id, None) is not None
+        self.send_json({"id": id, "object": "thread.deleted", "deleted": deleted})
+
+    def list_messages(self, body, id):
+        """Return messages of thread, latest first as OpenAI does by default."""
+        messages = list(reversed(self.server.api.threads.get(id, [])))
+        self.send_json(
+            {
+                "object": "list",
+                "data": messages,
+                "first_id": messages[0]["id"] if messages else None,
+                "last_id": messages[-1]["id"] if messages else None,
+                "has_more": False,
+            }
+        )
+
+    def create_message(self, body, id):
+        """Add message to thread."""
+        message = get_message(id, body.get("role", "user"), body["content"])
+        with self.server.api.lock:
+            if id not in self.server.api.threads:
+                self.send_json({"error": {"message": f"No thread {id}"}}, 404)
+                return
+            self.server.api.threads[id].append(message)
+        self.send_json(message)
+
+    def create_run(self, body, id):
+        """Start run of assistant on thread."""
+        run = {
+            "id": f"run_{next(IDS)}",
+            "object": "thread.run",
+            "created_at": int(time.time()),
+            "thread_id": id,
+            "assistant_id": body["assistant_id"],
+            "status": "queued",
+            "required_action": None,
+            "tools": [],
+            "metadata": {},
+            "model": "",
+            "instructions": "",
+        }
+        self.server.api.runs[run["id"]] = run
+        self.step(run, None, body.get("stream", False))
+
+    def submit_tool_outputs(self, body, id, run):
+        """Continue run with tool outputs."""
+        run = self.server.api.runs[run]
+        self.step(dict(run, required_action=None), body["tool_outputs"], True)
+
+    def step(self, run, outputs, stream):
+        """Run assistant until it replies or requires tool calls."""
+        api = self.server.api
+        assistant = api.assistants.get(run["assistant_id"], {})
+        reply = api.respond(assistant, api.threads.get(run["thread_id"], []), outputs)
+        events = [("thread.run.created", dict(run, status="queued"))]
+        if not isinstance(reply, str):
+            calls = [
+                {
+                    "id": f"call_{next(IDS)}",
+                    "type": "function",
+                    "function": {"name": name, "arguments": json.dumps(arguments)},
+                }
+                for name, arguments in reply
+            ]
+            run = dict(
+                run,
+                status="requires_action",
+                required_action={
+                    "type": "submit_tool_outputs",
+                    "submit_tool_outputs": {"tool_calls": calls},
+                },
+            )
+            api.runs[run["id"]] = run
+            events.append(("thread.run.requires_action", run))
+            self.send_run(run, events, stream)
+            return
+        message = get_message(
+            run["thread_id"],
+            "assistant",
+            reply,
+            assistant_id=run["assistant_id"],
+            run_id=run["id"],
+        )
+        with api.lock:
+            api.threads.setdefault(run["thread_id"], []).append(message)
+        run = dict(run, status="completed")
+        api.runs[run["id"]] = run
+        events.append(
+            ("thread.message.created", dict(message, content=[], status="in_progress"))
+        )
+        for piece in WORD.findall(reply):
+            content = {"index": 0, "type": "text", "text": {"value": piece}}
+            delta = {"role": "assistant", "content": [content]}
+            events.append(
+                (
+                    "thread.message.delta",
+                    {
+                        "id": message["id"],
+                        "object": "thread.message.delta",
+                        "delta": delta,
+                    },
+                )
+            )
+        events.append(("thread.message.completed", message))
+        events.append(("thread.run.completed", run))
+        self.send_run(run, events, stream)
+
+    def send_run(self, run, events, stream):
+        """Send run as events with delay between pieces, or as run object."""
+        if not stream:
+            self.send_json(run)
+            return
+        delay = self.server.api.stream_delay
+
+        def delayed():
+            for event in events:
+                if event[0] == "thread.message.delta":
+                    time.sleep(delay)
+                yield event
+
+        self.send_events(delayed())
+
+
+class OpenAIServer:
+    """OpenAI compatible server running in background thread."""
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency: float = 0,
+        stream_delay: float = 0,
+        error_rate: float = 0,
+        rate_limit_rate: float = 0,
+        retry_after: float = 0.01,
+        dimensions: int = 64,
+        respond=echo,
+        seed: int = 0,
+    ):
+        """Initialise server.
+
+        :param port: port to listen on, 0 picks free port
+        :param latency: seconds every request waits before response
+        :param stream_delay: seconds between streamed pieces of reply
+        :param error_rate: share of requests answered with server error
+        :param rate_limit_rate: share of requests answered with 429
+        :param retry_after: seconds told to rate limited clients to wait
+        :param dimensions: size of embeddings
+        :param respond: callable that makes replies of runs
+        :param seed: seed of random errors, same seed injects same errors
+        """
+        self.port = port
+        self.latency = latency
+        self.stream_delay = stream_delay
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.dimensions = dimensions
+        self.respond = respond
+        self.random = random.Random(seed)
+        self.faults = collections.deque()
+        self.counters = collections.Counter()
+        self.lock = threading.Lock()
+        self.assistants = {}
+        self.threads = {}
+        self.runs = {}
+        self.server = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        """Return base url to pass to OpenAI client."""
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    @property
+    def stats(self):
+        """Return counts of requests by endpoint and of injected faults."""
+        with self.lock:
+            return dict(self.counters)
+
+    def count(self, name):
+        """Count request."""
+        with self.lock:
+            self.counters[name] += 1
+
+    def fail_next(self, status: int = 429, count: int = 1):
+        """Answer next count of requests with status."""
+        with self.lock:
+            self.faults.extend([status] * count)
+
+    def get_fault(self):
+        """Return status of fault to inject into request, None if none."""
+        with self.lock:
+            if self.faults:
+                return self.faults.popleft()
+            draw = self.random.random()
+        if draw < self.rate_limit_rate:
+            return 429
+        if draw < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+    def get_client(self, **kwargs):
+        """Return OpenAI client of server, without retries unless asked for."""
+        from openai import OpenAI
+
+        kwargs.setdefault("max_retries", 0)
+        return OpenAI(api_key="test", base_url=self.base_url, **kwargs)
+
+    def start(self):
+        """Start serving in background thread."""
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self.server.daemon_threads = True
+        self.server.api = self
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        """Start server."""
+        return self.start()
+
+    def __exit__(self, *args):
+        """Stop server."""
+        self.stop()
@@ -0,0 +1,228 @@
+"""Testcases on loading extensions of interface root.
+
+Module is also loaded as chatbot extension, it provides plugins with slow load hooks.
+"""
+
+import collections
+import os
+import subprocess
+import sys
+import threading
+import time
+from unittest import mock
+
+from zoozl import chatbot
+from zoozl.chatbot import Interface
+
+from tests import base as bs
+
+LOADS = collections.Counter()
+THREADS = {}
+AUTHORS = []
+
+if os.environ.get("ZOOZL_TEST_FAIL_IMPORT"):
+    raise ImportError("Import fails as asked by test")
+
+
+class AbstractSlowLoad(Interface):
+    """Plugin that takes a while to load and echoes messages back."""
+
+    def load(self, root):
+        """Wait as if configuring remote services."""
+        if root.conf.get("fail_load"):
+            raise RuntimeError("Remote services are down")
+        time.sleep(0.2)
+        LOADS[type(self).__name__] += 1
+        THREADS[type(self).__name__] = threading.current_thread()
+        AUTHORS.append(root.conf.get("author"))
+
+    async def consume(self, package):
+        """Send back last message."""
+        package.callback(package.last_message_text)
+
+    def is_complete(self, package):
+        """Complete immediately the conversation."""
+        return True
+
+
+class First(AbstractSlowLoad):
+    """First slow plugin."""
+
+    aliases = {"first"}
+
+
+class Second(AbstractSlowLoad):
+    """Second slow plugin."""
+
+    aliases = {"second"}
+
+
+class Third(AbstractSlowLoad):
+    """Third slow plugin."""
+
+    aliases = {"third"}
+
+
+class Loading(bs.TestCase):
+    """Testcases on eager, parallel and lazy loading of extensions."""
+
+    def tearDown(self):
+        """Close interface root."""
+        self.root.close()
+
+    def load(self, **conf):
+        """Load interface root with configuration."""
+        self.root = chatbot.InterfaceRoot(conf)
+        self.root.load()
+
+    def test_parallel(self):
+        """Load hooks run concurrently."""
+        started = time.perf_counter()
+        self.load(extensions=["tests.loading"], parallel_load=True)
+        self.assertLess(time.perf_counter() - started, 0.5)
+        report = self.root.load_report["tests.loading"]
+        self.assertGreater(report["load"], 0.5)
+        self.assertEqual(
+            {"tests.loading": ["first", "second", "third"]}, self.root.manifest()
+        )
+
+    async def test_lazy(self):
+        """Extension is loaded on first use of its alias."""
+        loads = LOADS["First"]
+        self.load(
+            extensions=["zoozl.plugins.pong"],
+            lazy_extensions={"tests.loading": ["first", "second", "missing"]},
+        )
+        self.assertEqual(loads, LOADS["First"])
+        self.assertNotIn("tests.loading", self.root.load_report)
+        answers = []
+        bot = chatbot.Chat("talker", answers.append, self.root)
+        await bot.ask(chatbot.Message("first"))
+        self.assertEqual(["first"], [i.text for i in answers])
+        self.assertEqual(loads + 1, LOADS["First"])
+        # Hook runs within event loop thread
+        self.assertIs(threading.current_thread(), THREADS["First"])
+        self.assertIn("tests.loading", self.root.load_report)
+        # Aliases missing in manifest are served as well, missing ones do nothing
+        await bot.ask(chatbot.Message("third"))
+        self.assertEqual(["first", "third"], [i.text for i in answers])
+        await self.root.consume(bot._package, "missing")
+        self.assertEqual(loads + 1, LOADS["First"])
+
+
+class Reload(bs.TestCase):
+    """Testcases on reloading extensions of loaded interface root."""
+
+    def setUp(self):
+        """Load interface root with games."""
+        self.root = chatbot.InterfaceRoot(
+            {"extensions": ["zoozl.plugins.helpers"], "admin_token": "secret"}
+        )
+        self.root.load()
+        self.answers = []
+        self.bot = chatbot.Chat("talker", self.answers.append, self.root)
+
+    def tearDown(self):
+        """Close interface root."""
+        self.root.close()
+
+    async def test_handover(self):
+        """Chat in the middle of subject continues with new routing table."""
+        await self.bot.ask(chatbot.Message("play games"))
+        self.assertEqual("play games", self.bot.subject)
+        help_class = type(self.root.routes.commands["help"])
+        await self.root.reload({"extensions": ["tests.loading", "zoozl.plugins.pong"]})
+        self.assertFalse(self.root.has_subject("play games"))
+        await self.bot.ask(chatbot.Message("first"))
+        self.assertEqual("first", self.answers[-1].text)
+        await self.root.reload()
+        self.assertIsNot(help_class, type(self.root.routes.commands["help"]))
+        self.assertEqual(
+            ["tests.loading", "zoozl.plugins.pong"], list(self.root.manifest())
+        )
+
+    async def test_operation(self):
+        """Reload operation requires admin token."""
+        packets = []
+        await self.root.handle_operation({"operation": "reload"}, packets.append)
+        await self.root.handle_operation(
+            {"operation": "reload", "token": "secret"}, packets.append
+        )
+        self.assertEqual(
+            [
+                {"operation": "reload", "error": "Not authorised"},
+                {
+                    "operation": "reload",
+                    "status": "reloaded",
+                    "extensions": ["zoozl.plugins.helpers"],
+                },
+            ],
+            packets,
+        )
+
+    async def test_failed(self):
+        """Failed reload keeps previous routing table and configuration."""
+        routes = self.root.routes
+        with self.assertRaises(ModuleNotFoundError):
+            await self.root.reload({"extensions": ["tests.nowhere"]})
+        self.assertIs(routes, self.root.routes)
+        self.assertEqual(["zoozl.plugins.helpers"], self.root.conf["extensions"])
+
+    async def test_failed_import(self):
+        """Failed import leaves modules of previous table working."""
+        await self.root.reload({"extensions": ["tests.loading"]})
+        module = sys.modules[__name__]
+        loads = module.LOADS
+        with mock.patch.dict(os.environ, {"ZOOZL_TEST_FAIL_IMPORT": "1"}):
+            with self.assertRaises(ImportError):
+                await self.root.reload()
+        self.assertIs(module, sys.modules[__name__])
+        self.assertIs(loads, module.LOADS)
+        await self.bot.ask(chatbot.Message("first"))
+        self.assertEqual("first", self.answers[-1].text)
+
+    async def test_failed_lazy(self):
+        """Load hook that fails reload leaves lazy extension imported."""
+        lazy = {"zoozl.plugins.pong": ["help"]}
+        await self.root.reload({"lazy_extensions": lazy})
+        await self.bot.ask(chatbot.Message("help"))
+        conf = self.root.conf
+        with self.assertRaises(RuntimeError):
+            await self.root.reload(
+                {
+                    "extensions": ["tests.loading"],
+                    "lazy_extensions": lazy,
+                    "fail_load": True,
+                }
+            )
+        self.assertIn("zoozl.plugins.pong", sys.modules)
+        self.assertIs(conf, self.root.conf)
+
+    async def test_conf(self):
+        """Load hooks see new configuration."""
+        await self.root.reload({"extensions": ["tests.loading"], "author": "new"})
+        self.assertEqual({"new"}, set(sys.modules[__name__].AUTHORS))
+        self.assertEqual("new", self.root.conf["author"])
+
+
+class Imports(bs.TestCase):
+    """Testcases on modules imported at server start."""
+
+    def test_server(self):
+        """Server imports no optional dependencies of unconfigured features."""
+        code = "import sys, zoozl.server; print(' '.join(sys.modules))"
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        modules = set(result.stdout.split())
+        for heavy in ("aiosmtpd", "membank", "openai", "pydantic", "slack_sdk"):
+            self.assertNotIn(heavy, modules)
+
+    def test_moved(self):
+        """Email transport classes are still found in server, with warning."""
+        from zoozl import lmtp, server
+
+        with self.assertWarns(DeprecationWarning):
+            self.assertIs(lmtp.EmailHandler, server.EmailHandler)
+        with self.assertRaises(AttributeError):
+            server.Missing
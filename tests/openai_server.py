@@ -0,0 +1,207 @@
+"""Testcases on agents and embedders against OpenAI compatible server fixture."""
+
+import asyncio
+import time
+import unittest
+
+import numpy as np
+import openai
+
+from zoozl import agentgear, chatbot
+from zoozl.chatbot import embeddings
+
+from tests.fixtures import openai_server
+
+# Client imports its HTTP transport on first use, concurrent imports from threads
+# left by other testcases fail at times, so it is imported while tests are loaded
+openai.OpenAI(api_key="test").close()
+
+
+def get_agent(name, agents=()):
+    """Return agent definition."""
+    attrs = {"agents": agents, "__doc__": f"Agent {name}"}
+    return type(name, (agentgear.BaseAgent,), attrs)
+
+
+def hand_off(assistant, messages, outputs):
+    """Hand off to Expert from Main, Expert answers."""
+    if assistant["name"] == "Main" and outputs is None:
+        return [("transfer_to_Expert", {})]
+    return openai_server.echo(assistant, messages, outputs)
+
+
+class Server(unittest.TestCase):
+    """Testcases on faults and latency injected by server."""
+
+    def setUp(self):
+        """Start server."""
+        self.server = openai_server.OpenAIServer().start()
+        self.client = self.server.get_client()
+
+    def tearDown(self):
+        """Stop server."""
+        self.client.close()
+        self.server.stop()
+
+    def test_rate_limited(self):
+        """Injected 429 reaches client with retry-after header."""
+        self.server.fail_next(429)
+        with self.assertRaises(openai.RateLimitError) as error:
+            self.client.embeddings.create(input="hello", model="test")
+        self.assertEqual("0.01", error.exception.response.headers["retry-after"])
+        self.client.embeddings.create(input="hello", model="test")
+        self.assertEqual({"create_embeddings": 2, "rate_limited": 1}, self.server.stats)
+
+    def test_reproducible(self):
+        """Same seed injects faults into same requests."""
+        runs = []
+        for _ in range(2):
+            server = openai_server.OpenAIServer(seed=7, error_rate=0.3)
+            runs.append([server.get_fault() for _ in range(20)])
+        self.assertEqual(runs[0], runs[1])
+        self.assertIn(500, runs[0])
+        self.assertIn(None, runs[0])
+
+    def test_latency(self):
+        """Every request waits for latency."""
+        self.server.latency = 0.05
+        started = time.perf_counter()
+        self.client.beta.assistants.list()
+        self.assertGreater(time.perf_counter() - started, 0.05)
+
+
+class Embedder(unittest.TestCase):
+    """Testcases on OpenAI embedder with scheduler."""
+
+    def setUp(self):
+        """Start server and embedder pointing to it."""
+        self.server = openai_server.OpenAIServer().start()
+        self.embedder = embeddings.OpenAIEmbedder(
+            {"api_key": "test", "openai_base_url": self.server.base_url}
+        )
+        self.embedder.scheduler = chatbot.RequestScheduler(backoff=0.001)
+
+    def tearDown(self):
+        """Stop server."""
+        self.embedder.client.close()
+        self.server.stop()
+
+    def test_retried(self):
+        """Rate limited and failed requests are retried by scheduler only."""
+        self.server.fail_next(429)
+        self.server.fail_next(500)
+        vectors = self.embedder.get_many(["hello there", "hello there!", "invoice"])
+        vectors = np.array(vectors)
+        self.assertGreater(vectors[0] @ vectors[1], vectors[0] @ vectors[2])
+        self.assertEqual(3, self.server.stats["create_embeddings"])
+        stats = self.embedder.scheduler.stats
+        self.assertEqual(
+            (1, 1, 1), (stats["throttled"], stats["retried"], stats["completed"])
+        )
+
+    def test_loop(self):
+        """Root loads within running event loop as server loads it."""
+
+        async def load():
+            root = chatbot.InterfaceRoot(
+                {"extensions": ["zoozl.plugins.helpers"], "embedder": self.embedder}
+            )
+            root.load()
+            root.close()
+            return root.routes.intents.labels
+
+        self.assertIn("help", asyncio.run(load()))
+
+    def test_routing(self):
+        """Message is embedded for routing without stopping event loop."""
+        root = chatbot.InterfaceRoot(
+            {"extensions": ["zoozl.plugins.helpers"], "embedder": self.embedder}
+        )
+        root.load()
+        self.server.latency = 0.2
+        ticks = []
+
+        async def tick():
+            while True:
+                await asyncio.sleep(0.01)
+                ticks.append(time.monotonic())
+
+        async def ask():
+            ticker = asyncio.create_task(tick())
+            bot = chatbot.Chat("talker", lambda x: None, root)
+            await bot.ask(chatbot.Message("hello"))
+            ticker.cancel()
+
+        asyncio.run(ask())
+        root.close()
+        self.assertGreater(len(ticks), 5)
+
+
+class Agents(unittest.TestCase):
+    """Testcases on agents deployed and run on server."""
+
+    def setUp(self):
+        """Start server with responder that hands off."""
+        self.server = openai_server.OpenAIServer(respond=hand_off).start()
+        self.client = self.server.get_client()
+        self.requests = chatbot.RequestScheduler()
+
+    def tearDown(self):
+        """Stop server."""
+        self.client.close()
+        self.server.stop()
+
+    def test_handoff(self):
+        """Talker message is synced, run hands off and expert reply is streamed."""
+        expert = get_agent("Expert")
+        deployed = agentgear.configure(
+            self.client,
+            [get_agent("Main", (expert,)), expert],
+            scheduler=self.requests,
+        )
+        self.assertEqual(2, len(self.server.assistants))
+        sessions = agentgear.ThreadSessions(
+            self.client, author="bot", scheduler=self.requests
+        )
+        conversation = chatbot.Conversation(talker="talker")
+        conversation.messages.append(chatbot.Message("Hello", author="talker"))
+        thread_id = sessions.sync(conversation)
+        answers = []
+        package = chatbot.Package(conversation, answers.append)
+        name = agentgear.stream_agent(
+            self.client,
+            thread_id,
+            "Main",
+            {i.name: i.id for i in deployed},
+            package,
+            None,
+            scheduler=self.requests,
+        )
+        self.assertEqual("Expert", name)
+        self.assertEqual(
+            ["Tools said: Transferred to Expert", "You said: Hello"], answers
+        )
+        self.assertEqual(
+            {"create_run": 2, "submit_tool_outputs": 1},
+            {k: v for k, v in self.server.stats.items() if "run" in k or "tool" in k},
+        )
+
+    def test_streamed(self):
+        """Reply arrives piece by piece with stream delay between pieces."""
+        self.server.stream_delay = 0.05
+        assistant = self.client.beta.assistants.create(name="Echo", model="test")
+        thread = self.client.beta.threads.create(
+            messages=[{"role": "user", "content": "one two three"}]
+        )
+        pieces = []
+
+        class Handler(openai.AssistantEventHandler):
+            def on_text_delta(self, delta, snapshot):
+                pieces.append((delta.value, time.perf_counter()))
+
+        with self.client.beta.threads.runs.stream(
+            thread_id=thread.id, assistant_id=assistant.id, event_handler=Handler()
+        ) as stream:
+            stream.until_done()
+        self.assertEqual("You said: one two three", "".join(i for i, _ in pieces))
+        self.assertGreater(pieces[-1][1] - pieces[0][1], 0.05)
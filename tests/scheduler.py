@@ -0,0 +1,184 @@
+"""Testcases on scheduler of outbound requests."""
+
+import threading
+import time
+import types
+import unittest
+
+from zoozl import chatbot
+from zoozl.chatbot import scheduler
+
+from tests import base as bs
+
+
+class APIError(Exception):
+    """Error as raised by HTTP client on response with error status."""
+
+    def __init__(self, status_code, retry_after=None):
+        """Initialise error with status and optional retry-after header."""
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+        headers = {} if retry_after is None else {"retry-after": str(retry_after)}
+        self.response = types.SimpleNamespace(headers=headers)
+
+
+class Flaky:
+    """Request that fails with errors first, then returns result."""
+
+    def __init__(self, *errors):
+        """Initialise request with errors to raise."""
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self, result="ok"):
+        """Make request."""
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return result
+
+
+def wait_queued(requests, count):
+    """Wait until count of requests are queued in scheduler."""
+    deadline = time.monotonic() + 3
+    while requests.stats["queued"] < count:
+        if time.monotonic() > deadline:
+            raise TimeoutError("Requests were not queued")
+        time.sleep(0.001)
+
+
+class Limits(unittest.TestCase):
+    """Testcases on concurrency, priority and rate limits."""
+
+    def test_concurrency(self):
+        """No more than max_concurrency requests are in flight."""
+        requests = scheduler.RequestScheduler(max_concurrency=2)
+        lock = threading.Lock()
+        running = []
+
+        def request():
+            with lock:
+                running.append(requests.stats["in_flight"])
+            time.sleep(0.02)
+
+        threads = [
+            threading.Thread(target=requests.call, args=(request,)) for _ in "123456"
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(2, max(running))
+        self.assertEqual({"completed": 6, "queued": 0, "in_flight": 0}, requests.stats)
+
+    def test_priority(self):
+        """Waiting requests are admitted by priority, then in order of arrival."""
+        requests = scheduler.RequestScheduler(max_concurrency=1)
+        order = []
+        requests.acquire(scheduler.PRIORITY_NORMAL, 0)
+        threads = []
+        levels = [
+            ("background", scheduler.PRIORITY_BACKGROUND),
+            ("normal", scheduler.PRIORITY_NORMAL),
+            ("interactive", scheduler.PRIORITY_INTERACTIVE),
+            ("normal2", scheduler.PRIORITY_NORMAL),
+        ]
+        for name, level in levels:
+            thread = threading.Thread(
+                target=requests.call,
+                args=(order.append, name),
+                kwargs={"priority": level},
+            )
+            thread.start()
+            threads.append(thread)
+            wait_queued(requests, len(threads))
+        requests.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(["interactive", "normal", "normal2", "background"], order)
+
+    def test_tokens(self):
+        """Request waits until tokens per minute refill."""
+        requests = scheduler.RequestScheduler(tokens_per_minute=600)
+        requests.call(Flaky(), tokens=600)
+        started = time.monotonic()
+        requests.call(Flaky(), tokens=2)
+        self.assertGreater(time.monotonic() - started, 0.15)
+
+    def test_requests(self):
+        """Requests per minute are kept."""
+        requests = scheduler.RequestScheduler(requests_per_minute=1200)
+        requests.requests.available = 1
+        started = time.monotonic()
+        for _ in range(3):
+            requests.call(Flaky())
+        self.assertGreater(time.monotonic() - started, 0.09)
+
+
+class Retries(unittest.TestCase):
+    """Testcases on retries of failed requests."""
+
+    def test_rate_limited(self):
+        """Rate limited request waits as server asks and pauses others."""
+        requests = scheduler.RequestScheduler()
+        request = Flaky(APIError(429, retry_after=0.1))
+        started = time.monotonic()
+        self.assertEqual("done", requests.call(request, "done"))
+        self.assertGreater(time.monotonic() - started, 0.09)
+        self.assertEqual(2, request.calls)
+        self.assertEqual(1, requests.stats["throttled"])
+        self.assertGreater(requests.paused_until, started)
+
+    def test_server_error(self):
+        """Server errors are retried with backoff until max_retries."""
+        requests = scheduler.RequestScheduler(max_retries=2, backoff=0.001)
+        request = Flaky(*(APIError(500) for _ in range(3)))
+        with self.assertRaises(APIError):
+            requests.call(request)
+        self.assertEqual(3, request.calls)
+        self.assertEqual(2, requests.stats["retried"])
+        self.assertEqual(1, requests.stats["failed"])
+        self.assertEqual(0, requests.stats["in_flight"])
+
+    def test_client_error(self):
+        """Client errors are raised at once."""
+        requests = scheduler.RequestScheduler()
+        request = Flaky(APIError(400))
+        with self.assertRaises(APIError):
+            requests.call(request)
+        self.assertEqual(1, request.calls)
+        self.assertEqual(1, requests.stats["failed"])
+
+    def test_connection_error(self):
+        """Connection errors are retried."""
+        requests = scheduler.RequestScheduler(backoff=0.001)
+        self.assertEqual("ok", requests.call(Flaky(ConnectionResetError())))
+        self.assertEqual(1, requests.stats["retried"])
+
+
+class Coroutines(bs.TestCase):
+    """Testcases on requests made from coroutines."""
+
+    async def test_priority(self):
+        """Priority set by context is carried into thread of request."""
+        requests = scheduler.RequestScheduler()
+        with scheduler.priority(scheduler.PRIORITY_BATCH):
+            level = await requests.run(scheduler.current_priority.get)
+        self.assertEqual(scheduler.PRIORITY_BATCH, level)
+        self.assertEqual(scheduler.PRIORITY_NORMAL, scheduler.current_priority.get())
+
+    async def test_loop(self):
+        """Request is refused on event loop thread, it would stop the loop."""
+        requests = scheduler.RequestScheduler()
+        with self.assertRaises(RuntimeError):
+            requests.call(time.time)
+        self.assertEqual(0, requests.stats["in_flight"])
+
+    def test_root(self):
+        """Interface root holds scheduler as per configuration."""
+        root = chatbot.InterfaceRoot(
+            {"openai_max_concurrency": 3, "openai_requests_per_minute": 60}
+        )
+        self.assertEqual(3, root.scheduler.max_concurrency)
+        self.assertEqual(60, root.scheduler.requests.capacity)
+        self.assertIsNone(root.scheduler.tokens)
@@ -0,0 +1,94 @@
+"""Testcases on session registry of recently active chats."""
+
+import time
+import types
+import unittest
+
+from zoozl import chatbot
+from zoozl.chatbot.interface import SessionRegistry
+
+from tests import base as bs
+
+
+def get_chat(messages=0):
+    """Return chat like object holding number of messages."""
+    conversation = chatbot.Conversation(messages=["text"] * messages)
+    return types.SimpleNamespace(conversation=conversation)
+
+
+class Registry(unittest.TestCase):
+    """Testcases on eviction of sessions."""
+
+    def test_lru(self):
+        """Least recently used session is evicted first."""
+        sessions = SessionRegistry(max_sessions=2)
+        first, second, third = get_chat(), get_chat(), get_chat()
+        sessions.put("first", first)
+        sessions.put("second", second)
+        self.assertIs(first, sessions.get("first"))
+        sessions.put("third", third)
+        self.assertNotIn("second", sessions)
+        self.assertIs(first, sessions.get("first"))
+        self.assertIs(third, sessions.get("third"))
+
+    def test_ttl(self):
+        """Unused session expires."""
+        sessions = SessionRegistry(ttl=0.01)
+        sessions.put("first", get_chat())
+        time.sleep(0.02)
+        self.assertIsNone(sessions.get("first"))
+        self.assertEqual(0, len(sessions))
+
+    def test_messages(self):
+        """Sessions holding too many messages are evicted."""
+        sessions = SessionRegistry(max_messages=10)
+        sessions.put("first", get_chat(6))
+        sessions.put("second", get_chat(4))
+        self.assertEqual(10, sessions.messages)
+        sessions.put("third", get_chat(1))
+        self.assertNotIn("first", sessions)
+        self.assertEqual(5, sessions.messages)
+
+    def test_get_or_create(self):
+        """Factory is called only for missing session."""
+        sessions = SessionRegistry()
+        chat = sessions.get_or_create("first", get_chat)
+        self.assertIs(chat, sessions.get_or_create("first", get_chat))
+
+
+class Sessions(bs.TestCase):
+    """Testcases on reusing chats of talkers on interface root."""
+
+    def setUp(self):
+        """Load interface root."""
+        self.root = chatbot.InterfaceRoot({"extensions": ["zoozl.plugins.pong"]})
+        self.root.load()
+
+    def tearDown(self):
+        """Close interface root."""
+        self.root.close()
+
+    async def test_reuse(self):
+        """Consecutive events of talker reuse chat with new callback."""
+        first, second = [], []
+        bot = await self.root.session("email", "talker", first.append)
+        await bot.ask(chatbot.Message("hello"))
+        self.assertIs(bot, await self.root.session("email", "talker", second.append))
+        await bot.ask(chatbot.Message("again"))
+        self.assertEqual(["hello"], [i.text for i in first])
+        self.assertEqual(["again"], [i.text for i in second])
+        self.assertIs(bot, await self.root.session("slack:C1", "talker", first.append))
+
+    async def test_channels(self):
+        """Turns of talker in different channels continue one conversation."""
+        root = chatbot.InterfaceRoot({"extensions": ["zoozl.plugins.helpers"]})
+        root.load()
+        self.addCleanup(root.close)
+        for channel, text in (("A", "play games"), ("B", "hello there"), ("A", "bull")):
+            bot = await root.session(f"slack:{channel}", "talker", lambda x: None)
+            await bot.ask(chatbot.Message(text, author="talker"))
+        conversation = await root.storage.get_ongoing("talker")
+        self.assertEqual(
+            ["play games", "hello there", "bull"],
+            [i.text for i in conversation.messages if i.author == "talker"],
+        )
@@ -1,5 +1,10 @@
 """Testcases on slack server."""
 
+import asyncio
+import threading
+import time
+
+from zoozl import slack
 from zoozl.chatbot import Message
 
 from tests import base as bs, fixtures as fix
@@ -19,6 +24,7 @@ class Pong(bs.AbstractSlack):
         status, headers, body = await self.send_slack_event(payload)
         self.assertEqual(status, 200)
         self.assertEqual(body, b"")
+        await self.wait_called(mock_send_slack)
         mock_send_slack.assert_called_once()
         self.assert_slack_called_with(
             mock_send_slack,
@@ -26,3 +32,58 @@ class Pong(bs.AbstractSlack):
             payload["event"]["channel"],
             Message(text, author=self.author),
         )
+
+
+class Stream(bs.TestCase):
+    """Testcases on replies streamed to Slack channel."""
+
+    def setUp(self):
+        """Record calls made to Slack."""
+        self.calls = []
+        self.release = threading.Event()
+
+    def call_slack(self, token, method, **data):
+        """Record call once released, postMessage returns ts unless it is no_ts."""
+        self.release.wait(5)
+        self.calls.append((method, data["text"]))
+        return {} if data["text"] == "no_ts" else {"ts": "1"}
+
+    async def test_loop(self):
+        """Writes from event loop do not wait on Slack, updates keep order."""
+        stream = slack.SlackStream("token", "C1", interval=0)
+        with fix.patch("zoozl.slack.call_slack", self.call_slack):
+            started = time.monotonic()
+            for word in ("Once ", "upon ", "a ", "time"):
+                stream.write(word)
+            stream.close()
+            self.assertLess(time.monotonic() - started, 0.5)
+            self.assertEqual([], self.calls)
+            self.release.set()
+            await asyncio.to_thread(stream.sender.shutdown)
+        self.assertEqual(
+            [
+                ("chat.postMessage", "Once "),
+                ("chat.update", "Once upon "),
+                ("chat.update", "Once upon a "),
+                ("chat.update", "Once upon a time"),
+                ("chat.update", "Once upon a time"),
+            ],
+            self.calls,
+        )
+
+    async def test_no_ts(self):
+        """Message posted without ts stops updates, whole text is posted at end."""
+        self.release.set()
+        stream = slack.SlackStream("token", "C1", interval=0)
+        with fix.patch("zoozl.slack.call_slack", self.call_slack):
+            for word in ("no_ts", " more", " text"):
+                stream.write(word)
+            stream.close()
+            await asyncio.to_thread(stream.sender.shutdown)
+        self.assertEqual(
+            [
+                ("chat.postMessage", "no_ts"),
+                ("chat.postMessage", "no_ts more text"),
+            ],
+            self.calls,
+        )
@@ -0,0 +1,157 @@
+"""Testcases on state of plugins kept per conversation.
+
+Module is also loaded as chatbot extension, it provides plugins that count turns.
+"""
+
+import asyncio
+
+from zoozl import chatbot
+from zoozl.chatbot import Interface, api
+
+from tests import base as bs
+
+
+class Counter(Interface):
+    """Plugin that completes on third turn."""
+
+    aliases = {"count"}
+    state = {"turns": 0}
+
+    async def consume(self, package):
+        """Count turn, yielding to other talkers meanwhile."""
+        state = package.state(self)
+        turns = state["turns"]
+        await asyncio.sleep(0.01)
+        state["turns"] = turns + 1
+        package.callback(str(state["turns"]))
+
+    def is_complete(self, package):
+        """Complete on third turn."""
+        return package.state(self)["turns"] >= 3
+
+
+class Legacy(Interface):
+    """Plugin with completion check that does not take package."""
+
+    aliases = {"legacy"}
+
+    async def consume(self, package):
+        """Answer."""
+        package.callback("done")
+
+    def is_complete(self):
+        """Complete immediately."""
+        return True
+
+
+class Greet(Interface):
+    """Plugin that remembers greeting."""
+
+    aliases = {"greet"}
+    state = {"greeted": False}
+
+    async def consume(self, package):
+        """Greet once and start conversation."""
+        state = package.state(self)
+        if not state["greeted"]:
+            package.callback("Hello")
+        state["greeted"] = True
+        package.conversation.ongoing = True
+
+
+class State(bs.TestCase):
+    """Testcases on state view of interface."""
+
+    def test_compact(self):
+        """Only values that differ from defaults are stored."""
+        package = api.Package(api.Conversation(), None)
+        state = package.state(Counter())
+        self.assertEqual({"turns": 0}, dict(state))
+        state["turns"] = 2
+        self.assertEqual(
+            {"state": {"tests.state.Counter": {"turns": 2}}}, package.conversation.data
+        )
+        self.assertEqual({("tests.state.Counter", "turns")}, package.changes)
+        del state["turns"]
+        self.assertEqual({}, package.conversation.data)
+        with self.assertRaises(KeyError):
+            state["other"] = 1
+
+    def test_names(self):
+        """Plugins of the same class name keep their own state."""
+        other = type("Counter", (Interface,), {"state": {"turns": 0}})
+        other.__module__ = "other"
+        package = api.Package(api.Conversation(), None)
+        package.state(Counter())["turns"] = 2
+        package.state(other())["turns"] = 5
+        self.assertEqual(2, package.state(Counter())["turns"])
+        self.assertEqual(5, package.state(other())["turns"])
+
+
+class Conversations(bs.TestCase):
+    """Testcases on plugins serving many talkers at once."""
+
+    def setUp(self):
+        """Load interface root with counting plugins."""
+        self.root = chatbot.InterfaceRoot(
+            {"extensions": ["tests.state", "zoozl.plugins.helpers"]}
+        )
+        self.root.load()
+
+    def tearDown(self):
+        """Close interface root."""
+        self.root.close()
+
+    async def test_concurrent(self):
+        """Concurrent talkers count their own turns."""
+        answers = {i: [] for i in ("a", "b")}
+        bots = [chatbot.Chat(i, answers[i].append, self.root) for i in answers]
+        for bot in bots:
+            await bot.ask(chatbot.Message("count"))
+        await asyncio.gather(*(i.ask(chatbot.Message("again")) for i in bots))
+        await bots[0].ask(chatbot.Message("again"))
+        self.assertEqual(["1", "2", "3"], [i.text for i in answers["a"]])
+        self.assertEqual(["1", "2"], [i.text for i in answers["b"]])
+        self.assertEqual("", bots[0].subject)
+        self.assertEqual("count", bots[1].subject)
+
+    async def test_games(self):
+        """Game won by one talker does not complete game of another."""
+        bots = [chatbot.Chat(i, lambda x: None, self.root) for i in ("a", "b")]
+        for bot in bots:
+            await bot.ask(chatbot.Message("play games"))
+            await bot.ask(chatbot.Message("yes"))
+        state = bots[0].conversation.data["state"]
+        number = state["zoozl.plugins.helpers.Games"]["bull_number"]
+        await bots[0].ask(chatbot.Message(number))
+        await bots[1].ask(chatbot.Message("0000"))
+        self.assertEqual("", bots[0].subject)
+        self.assertEqual("play games", bots[1].subject)
+
+    async def test_carried(self):
+        """Game kept by earlier versions continues."""
+        for data in (
+            {"state": {"Games": {"game": "bull_game", "bull_number": "1234"}}},
+            {"game": "bull_game", "bull_number": "1234"},
+        ):
+            bot = chatbot.Chat("talker", lambda x: None, self.root)
+            await bot.load()
+            bot.conversation.data = data
+            bot.set_subject("play games")
+            await bot.ask(chatbot.Message("1234"))
+            self.assertEqual("", bot.subject)
+
+    async def test_legacy(self):
+        """Completion check that does not take package still works."""
+        bot = chatbot.Chat("talker", lambda x: None, self.root)
+        await bot.ask(chatbot.Message("legacy"))
+        self.assertEqual("", bot.subject)
+
+    async def test_greet(self):
+        """Greeting that changes state is saved."""
+        answers = []
+        bot = chatbot.Chat("talker", answers.append, self.root)
+        await bot.greet()
+        bot = chatbot.Chat("talker", answers.append, self.root)
+        await bot.greet()
+        self.assertEqual(["Hello"], [i.text for i in answers])
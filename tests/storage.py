@@ -0,0 +1,211 @@
+"""Testcases on conversation storages."""
+
+import asyncio
+import datetime
+import sqlite3
+import tempfile
+
+from zoozl import chatbot
+from zoozl.chatbot import storage
+
+from tests import base as bs
+
+
+class AbstractStorage(bs.TestCase):
+    """Testcases every storage must pass."""
+
+    def get_storage(self):
+        """Return storage under test."""
+        return storage.MemoryStorage()
+
+    async def asyncSetUp(self):
+        """Open storage."""
+        self.storage = self.get_storage()
+
+    async def asyncTearDown(self):
+        """Close storage."""
+        self.storage.close()
+
+    def get_conversation(self, talker, *texts, ongoing=True):
+        """Return conversation of talker with messages sent a second apart."""
+        start = datetime.datetime(2024, 5, 1, tzinfo=datetime.timezone.utc)
+        messages = [
+            chatbot.Message(text, sent=start + datetime.timedelta(seconds=i))
+            for i, text in enumerate(texts)
+        ]
+        return chatbot.Conversation(
+            talker=talker, ongoing=ongoing, messages=messages, data={"a": 1}
+        )
+
+    async def test_pages(self):
+        """Conversations are listed page by page in order they were created."""
+        for talker in "abcde":
+            await self.storage.put(self.get_conversation(talker, "hello"))
+        pages = [await self.storage.list_conversations(i, 2) for i in (0, 2, 4, 6)]
+        self.assertEqual(
+            [["a", "b"], ["c", "d"], ["e"], []],
+            [[i.talker for i in page] for page in pages],
+        )
+
+    async def test_ongoing(self):
+        """Ongoing conversation of talker is loaded as it was saved."""
+        self.assertIsNone(await self.storage.get_ongoing("talker"))
+        conversation = self.get_conversation("talker", "hello")
+        conversation.subject = "help"
+        await self.storage.put(conversation)
+        conversation.messages.append(chatbot.Message("unsaved"))
+        loaded = await self.storage.get_ongoing("talker")
+        self.assertEqual(conversation.uuid, loaded.uuid)
+        self.assertEqual("help", loaded.subject)
+        self.assertEqual({"a": 1}, loaded.data)
+        self.assertEqual(["hello"], [i.text for i in loaded.messages])
+        self.assertEqual(conversation.messages[0].sent, loaded.messages[0].sent)
+        self.assertIsNone(await self.storage.get_ongoing("other"))
+
+    async def test_finished(self):
+        """Finished conversations are listed and deleted."""
+        conversation = self.get_conversation("talker", "hello")
+        await self.storage.put(conversation)
+        self.assertEqual([], await self.storage.list_finished(10))
+        conversation.ongoing = False
+        await self.storage.put(conversation)
+        await self.storage.put(self.get_conversation("other", "bye", ongoing=False))
+        self.assertIsNone(await self.storage.get_ongoing("talker"))
+        self.assertEqual(1, len(await self.storage.list_finished(1)))
+        finished = await self.storage.list_finished(10)
+        self.assertEqual(2, len(finished))
+        for conversation in finished:
+            await self.storage.delete(conversation)
+        self.assertEqual([], await self.storage.list_finished(10))
+        self.assertEqual((0, []), await self.storage.list_messages(0, 10))
+
+    async def test_messages(self):
+        """Messages are paged with latest sent first."""
+        await self.storage.put(self.get_conversation("a", "a0", "a1", "a2"))
+        await self.storage.put(self.get_conversation("b", "b0", "b1"))
+        total, page = await self.storage.list_messages(1, 2)
+        self.assertEqual(5, total)
+        self.assertEqual(
+            [("a", "a1"), ("b", "b1")], sorted((i, j.text) for i, j in page)
+        )
+        total, page = await self.storage.list_messages(0, 1)
+        self.assertEqual([("a", "a2")], [(i, j.text) for i, j in page])
+        total, page = await self.storage.list_messages(5, 2)
+        self.assertEqual([], page)
+
+
+class MemoryStorage(AbstractStorage):
+    """Testcases on in-memory storage."""
+
+
+class MembankStorage(AbstractStorage):
+    """Testcases on membank storage."""
+
+    def get_storage(self):
+        """Return membank storage."""
+        return storage.MembankStorage()
+
+    def test_private(self):
+        """Membank without private helpers used for paging fails clearly."""
+        with self.assertRaisesRegex(RuntimeError, "not supported by membank"):
+            storage.get_membank_page(object(), "conversation", 0, 2)
+
+
+class SQLiteStorage(AbstractStorage):
+    """Testcases on SQLite storage."""
+
+    def get_storage(self):
+        """Return SQLite storage in temporary file."""
+        self.tmp = tempfile.TemporaryDirectory()
+        return storage.SQLiteStorage(f"{self.tmp.name}/zoozl.db")
+
+    async def asyncTearDown(self):
+        """Close storage and remove database."""
+        await super().asyncTearDown()
+        self.tmp.cleanup()
+
+    async def test_reopen(self):
+        """Conversations are kept in database file."""
+        await self.storage.put(self.get_conversation("talker", "hello"))
+        self.storage.close()
+        self.storage = storage.SQLiteStorage(f"{self.tmp.name}/zoozl.db")
+        loaded = await self.storage.get_ongoing("talker")
+        self.assertEqual(["hello"], [i.text for i in loaded.messages])
+
+    async def test_group_commit(self):
+        """Concurrent writes are committed together."""
+        self.storage.close()
+        self.storage = storage.SQLiteStorage(
+            f"{self.tmp.name}/zoozl.db", commit_delay=0.1
+        )
+        conversations = [self.get_conversation(str(i), "hello") for i in range(50)]
+        await asyncio.gather(*(self.storage.put(i) for i in conversations))
+        self.assertEqual(50, self.storage.writes)
+        self.assertLess(self.storage.commits, 5)
+        self.assertEqual(50, len(await self.storage.list_conversations(0, 100)))
+
+    async def test_failed_write(self):
+        """Failed write does not fail writes committed with it."""
+        conversation = self.get_conversation("talker", "hello")
+        results = await asyncio.gather(
+            self.storage._write(lambda db: db.execute("INSERT INTO nowhere")),
+            self.storage.put(conversation),
+            return_exceptions=True,
+        )
+        self.assertIsInstance(results[0], sqlite3.OperationalError)
+        self.assertIsNone(results[1])
+        self.assertIsNotNone(await self.storage.get_ongoing("talker"))
+
+    async def test_migrate(self):
+        """Conversations are imported from membank."""
+        source = storage.MembankStorage(f"sqlite://{self.tmp.name}/membank.db")
+        await source.put(self.get_conversation("a", "a0", "a1"))
+        await source.put(self.get_conversation("b", "b0", ongoing=False))
+        self.assertEqual(2, await storage.migrate(source, self.storage, batch_size=1))
+        source.close()
+        loaded = await self.storage.get_ongoing("a")
+        self.assertEqual(["a0", "a1"], [i.text for i in loaded.messages])
+        self.assertEqual(1, len(await self.storage.list_finished(10)))
+        self.assertEqual(3, (await self.storage.list_messages(0, 10))[0])
+
+    async def test_migrate_memory(self):
+        """Migration into storage that does not persist is refused."""
+        source = storage.MembankStorage(f"sqlite://{self.tmp.name}/membank.db")
+        self.addCleanup(source.close)
+        for target in (storage.MemoryStorage(), storage.MembankStorage()):
+            with self.assertRaises(RuntimeError):
+                await storage.migrate(source, target)
+            target.close()
+
+
+class Chats(bs.TestCase):
+    """Testcases on chats saving into configured storage."""
+
+    async def test_sqlite(self):
+        """Chat loads and saves conversation through SQLite storage."""
+        root = chatbot.InterfaceRoot(
+            {"extensions": ["zoozl.plugins.pong"], "storage": "sqlite"}
+        )
+        root.load()
+        answers = []
+        bot = chatbot.Chat("talker", answers.append, root)
+        await bot.ask(chatbot.Message("hello"))
+        bot = chatbot.Chat("talker", answers.append, root)
+        await bot.ask(chatbot.Message("again"))
+        conversation = await root.storage.get_ongoing("talker")
+        self.assertEqual(["hello", "again"], [i.text for i in conversation.messages])
+        root.close()
+
+    async def test_legacy(self):
+        """Reset that is not awaited completes before next turn, memory warns."""
+        root = chatbot.InterfaceRoot({"extensions": ["zoozl.plugins.pong"]})
+        root.load()
+        self.addCleanup(root.close)
+        bot = chatbot.Chat("talker", lambda x: None, root)
+        await bot.ask(chatbot.Message("hello"))
+        bot.clear_subject()
+        await bot.ask(chatbot.Message("again"))
+        conversation = await root.storage.get_ongoing("talker")
+        self.assertEqual(["again"], [i.text for i in conversation.messages])
+        with self.assertWarns(DeprecationWarning):
+            self.assertIs(root.storage, root.memory)
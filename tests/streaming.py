@@ -0,0 +1,167 @@
+"""Testcases on replies streamed to talker while they are generated.
+
+Module is also loaded as chatbot extension, it provides plugin that streams story.
+"""
+
+import asyncio
+import json
+import threading
+
+import websockets
+
+from zoozl import chatbot, server
+from zoozl.chatbot import Interface
+
+from tests import base as bs
+
+STORY = ("Once ", "upon ", "a ", "time")
+
+
+class Story(Interface):
+    """Plugin that tells story word by word."""
+
+    aliases = {"tell story"}
+
+    async def consume(self, package):
+        """Stream story."""
+        stream = package.stream()
+        for word in STORY:
+            stream.write(word)
+            await asyncio.sleep(0.01)
+        stream.close()
+
+    def is_complete(self, package):
+        """Complete immediately the conversation."""
+        return True
+
+
+class RecordingStream(chatbot.CoalescingStream):
+    """Stream that records sent pieces."""
+
+    def __init__(self, interval):
+        """Initialise records."""
+        super().__init__(interval)
+        self.sent = []
+
+    def send_delta(self, text):
+        """Record piece."""
+        self.sent.append(("partial", text))
+
+    def finish(self, text):
+        """Record whole text."""
+        self.sent.append(("text", text))
+
+
+class Coalescing(bs.TestCase):
+    """Testcases on coalescing pieces of streamed text."""
+
+    def test_interval(self):
+        """First piece is sent at once, later ones within interval together."""
+        stream = RecordingStream(interval=60)
+        for word in STORY:
+            stream.write(word)
+        stream.close("Once upon a time.")
+        stream.close()
+        self.assertEqual(
+            [("partial", "Once "), ("text", "Once upon a time.")], stream.sent
+        )
+        with self.assertRaises(RuntimeError):
+            stream.write("again")
+
+    def test_every(self):
+        """With zero interval every piece is sent."""
+        stream = RecordingStream(interval=0)
+        for word in STORY:
+            stream.write(word)
+        stream.close()
+        self.assertEqual([("partial", i) for i in STORY], stream.sent[:-1])
+        self.assertEqual(("text", "Once upon a time"), stream.sent[-1])
+
+    async def test_timer(self):
+        """Pieces held back within interval are sent once it passes."""
+        threads = threading.active_count()
+        stream = RecordingStream(interval=0.05)
+        for word in STORY:
+            stream.write(word)
+        self.assertEqual(threads, threading.active_count())
+        await asyncio.sleep(0.2)
+        self.assertEqual(
+            [("partial", "Once "), ("partial", "upon a time")], stream.sent
+        )
+        stream.close()
+        self.assertEqual(("text", "Once upon a time"), stream.sent[-1])
+
+
+class Chat(bs.TestCase):
+    """Testcases on streamed replies within chat."""
+
+    def setUp(self):
+        """Load interface root with story plugin."""
+        self.root = chatbot.InterfaceRoot({"extensions": ["tests.streaming"]})
+        self.root.load()
+
+    def tearDown(self):
+        """Close interface root."""
+        self.root.close()
+
+    async def test_whole(self):
+        """Without streamer talker receives whole message."""
+        answers = []
+        bot = chatbot.Chat("talker", answers.append, self.root)
+        await bot.ask(chatbot.Message("tell story"))
+        self.assertEqual(["Once upon a time"], [i.text for i in answers])
+
+    async def test_streamer(self):
+        """Streamer of transport receives pieces."""
+        streams = []
+
+        def streamer():
+            streams.append(RecordingStream(interval=0))
+            return streams[-1]
+
+        bot = chatbot.Chat("talker", None, self.root, streamer)
+        await bot.ask(chatbot.Message("tell story"))
+        self.assertEqual(5, len(streams[0].sent))
+
+
+class WebSocket(bs.TestCase):
+    """Testcases on partial packets over websocket."""
+
+    conf = {
+        "extensions": ["tests.streaming"],
+        "websocket_port": 30030,
+        "force_bind": True,
+        "stream_replies": True,
+        "websocket_stream_interval": 0,
+        "author": "bot",
+    }
+
+    async def asyncSetUp(self):
+        """Start websocket server."""
+        self.root = chatbot.InterfaceRoot(self.conf)
+        self.root.load()
+        self.connections = []
+        self.servers = await server.build_servers(
+            self.root, self.conf, self.connections
+        )
+
+    async def asyncTearDown(self):
+        """Stop websocket server."""
+        await server.drain_servers(self.servers, self.connections, timeout=1)
+        for srv in self.servers:
+            await srv.wait_closed()
+        self.root.close()
+
+    async def test_partial(self):
+        """Pieces arrive in partial packets, followed by whole text."""
+        url = f"ws://localhost:{self.conf['websocket_port']}"
+        async with websockets.connect(url) as websocket:
+            await websocket.send('{"text": "tell story"}')
+            packets = []
+            async with asyncio.timeout(3):
+                while not packets or "text" not in packets[-1]:
+                    packets.append(json.loads(await websocket.recv()))
+        self.assertEqual(list(STORY), [i["partial"] for i in packets[:-1]])
+        self.assertEqual("Once upon a time", packets[-1]["text"])
+        self.assertEqual("bot", packets[-1]["author"])
+        self.assertEqual(1, len({i["stream"] for i in packets}))
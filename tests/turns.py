@@ -0,0 +1,66 @@
+"""Testcases on serialising concurrent turns of talkers.
+
+Module is also loaded as chatbot extension, it provides plugin that yields to event
+loop while consuming, thus concurrent turns interleave.
+"""
+
+import asyncio
+import random
+
+from zoozl import chatbot
+from zoozl.chatbot import Interface
+
+from tests import base as bs
+
+
+class Slow(Interface):
+    """Echo plugin that yields to event loop before answering."""
+
+    aliases = {"help"}
+
+    async def consume(self, package):
+        """Send back last message after a while."""
+        await asyncio.sleep(random.random() / 1000)
+        package.callback(package.last_message_text)
+
+
+class Turns(bs.TestCase):
+    """Testcases on turns of many concurrent talkers."""
+
+    def setUp(self):
+        """Load interface root with slow plugin."""
+        self.root = chatbot.InterfaceRoot({"extensions": ["tests.turns"]})
+        self.root.load()
+        self.answers = []
+
+    def tearDown(self):
+        """Close interface root."""
+        self.root.close()
+
+    async def ask(self, talker, text):
+        """Handle one event of talker as transports do."""
+        async with self.root.turn(talker):
+            bot = chatbot.Chat(talker, self.answers.append, self.root)
+            await bot.ask(chatbot.Message(text))
+
+    async def test_stress(self):
+        """No messages are lost while talkers write concurrently."""
+        talkers = [f"talker{i}" for i in range(20)]
+        events = [(talkers[i % len(talkers)], str(i)) for i in range(200)]
+        await asyncio.gather(*(self.ask(*i) for i in events))
+        self.assertEqual(200, len(self.answers))
+        for talker in talkers:
+            conversation = await self.root.storage.get_ongoing(talker)
+            expected = [text for name, text in events if name == talker]
+            self.assertEqual(expected, [i.text for i in conversation.messages])
+        self.assertEqual(0, len(self.root.turns))
+
+    async def test_waiting(self):
+        """Turns of one talker wait on each other."""
+        async with self.root.turn("talker"):
+            task = asyncio.create_task(self.ask("talker", "hello"))
+            await asyncio.sleep(0)
+            self.assertEqual(2, self.root.turns.waiting("talker"))
+            self.assertFalse(task.done())
+        await task
+        self.assertEqual(0, self.root.turns.waiting("talker"))
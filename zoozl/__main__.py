@@ -1,9 +1,11 @@
 """Zoozl services hub."""
 
 import argparse
+import asyncio
 import logging
 import tomllib
 
+from .chatbot import storage
 from .server import start
 
 
@@ -16,6 +18,18 @@ def get_conf(path):
     return conf
 
 
+async def migrate_membank(url, conf):
+    """Import conversations from membank at url into configured storage."""
+    source = storage.MembankStorage(url)
+    target = storage.get_storage(conf)
+    try:
+        count = await storage.migrate(source, target)
+    finally:
+        source.close()
+        target.close()
+    logging.info("Imported %s conversations from %s", count, url)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Zoozl hub of services")
     parser.add_argument(
@@ -33,6 +47,12 @@ if __name__ == "__main__":
         action="store_true",
         help="bind to port even if it is already in use",
     )
+    parser.add_argument(
+        "--migrate-membank",
+        type=str,
+        metavar="URL",
+        help="import conversations from membank url into configured storage and exit",
+    )
     args = parser.parse_args()
     if args.v:
         logging.basicConfig(level=10)
@@ -40,4 +60,7 @@ if __name__ == "__main__":
         logging.basicConfig(level=20)
     conf = get_conf(args.conf)
     conf["force_bind"] = args.force_bind
-    start(conf)
+    if args.migrate_membank:
+        asyncio.run(migrate_membank(args.migrate_membank, conf))
+    else:
+        start(conf, lambda: dict(get_conf(args.conf), force_bind=args.force_bind))
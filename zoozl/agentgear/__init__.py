@@ -5,9 +5,34 @@ Usage examples:
     >>> class MyAgent(BaseAgent): pass
     >>> ai_client = OpenAI(api_key=api_key)
     >>> agents = configure(OpenAI(api_key=api_key), [MyAgent])
+    >>> diff = configure(ai_client, [MyAgent], "agents.json", dry_run=True)
+    >>> agents = configure(ai_client, [MyAgent], "agents.json", max_age=86400)
+    >>> thread_id = ThreadSessions(ai_client).sync(package.conversation)
+    >>> tools = ToolExecutor({"get_weather": get_weather}, timeout=10)
+    >>> stream_agent(ai_client, thread_id, "MyAgent", assistants, package, root, tools)
 """
 
-from .tools import BaseAgent, configure, StreamHandler, FunctionSchema
+from .tools import (
+    AgentDiff,
+    BaseAgent,
+    configure,
+    DeployedAgent,
+    StreamHandler,
+    FunctionSchema,
+    stream_agent,
+    ToolExecutor,
+)
+from .threads import ThreadSessions
 
 
-__all__ = ["BaseAgent", "configure", "StreamHandler", "FunctionSchema"]
+__all__ = [
+    "AgentDiff",
+    "BaseAgent",
+    "configure",
+    "DeployedAgent",
+    "StreamHandler",
+    "FunctionSchema",
+    "stream_agent",
+    "ThreadSessions",
+    "ToolExecutor",
+]
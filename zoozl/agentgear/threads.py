@@ -0,0 +1,210 @@
+"""OpenAI threads of chatbot conversations.
+
+Thread of conversation is kept in `Conversation.data`, so it is reused after
+conversation is loaded again from storage, and only messages sent after the last
+synced one are sent to it.
+
+    >>> sessions = ThreadSessions(client, author="bot")
+    >>> thread_id = sessions.sync(package.conversation)
+    >>> stream_agent(client, thread_id, "MyAgent", assistants, package, root)
+"""
+
+import asyncio
+import collections
+import datetime
+import logging
+import threading
+import time
+
+from openai import OpenAI
+
+import zoozl.chatbot
+
+from .tools import schedule
+
+
+log = logging.getLogger(__name__)
+
+# Key of thread within Conversation.data
+DATA_KEY = "openai_thread"
+
+
+class ThreadSessions:
+    """Map conversations to OpenAI threads and sync their new messages.
+
+    Recently used threads are cached in memory by conversation uuid, least
+    recently used ones are evicted first. Threads idle longer than idle timeout
+    are deleted by `collect`, conversation that comes back later starts new thread
+    with all its messages. Threads used before restart are known only to stored
+    conversations, `restore` adds them to be collected as well.
+    """
+
+    def __init__(
+        self,
+        client: OpenAI,
+        author: str = "",
+        max_threads: int = 1024,
+        idle_timeout: float = 7 * 24 * 3600,
+        scheduler: zoozl.chatbot.RequestScheduler = None,
+        storage: zoozl.chatbot.storage.AbstractStorage = None,
+    ):
+        """Initialise sessions.
+
+        :param client: OpenAI client
+        :param author: author of bot messages, those are left out of sync as
+            runs put replies on thread themselves
+        :param max_threads: number of threads cached in memory
+        :param idle_timeout: seconds after which unused thread is deleted
+        :param scheduler: optional scheduler that admits requests, deletion of
+            expired threads runs as background request
+        :param storage: optional storage of conversations, threads kept in them
+            are restored before first collection of `run`
+        """
+        self.client = client
+        self.author = author
+        self.max_threads = max_threads
+        self.idle_timeout = idle_timeout
+        self.scheduler = scheduler
+        self.storage = storage
+        self.threads = collections.OrderedDict()
+        self.used = {}
+        self.lock = threading.Lock()
+
+    def get(self, conversation: zoozl.chatbot.Conversation):
+        """Return thread state of conversation, None if it has none or expired."""
+        with self.lock:
+            state = self.threads.get(conversation.uuid)
+            if state is not None:
+                self.threads.move_to_end(conversation.uuid)
+        if state is None:
+            state = conversation.data.get(DATA_KEY)
+        if state is None or time.time() - state["used"] > self.idle_timeout:
+            return None
+        return state
+
+    def sync(self, conversation: zoozl.chatbot.Conversation) -> str:
+        """Send messages added since last sync, return thread id of conversation.
+
+        Thread is created with all messages if conversation has no live thread.
+        """
+        state = self.get(conversation)
+        if state is None:
+            messages = self.get_messages(conversation.messages)
+            thread = schedule(
+                self.scheduler, self.client.beta.threads.create, messages=messages
+            )
+            state = {"id": thread.id, "synced": None}
+            log.info("Created thread %s for %s", thread.id, conversation.talker)
+        else:
+            unsynced = self.get_unsynced(conversation.messages, state["synced"])
+            for message in self.get_messages(unsynced):
+                schedule(
+                    self.scheduler,
+                    self.client.beta.threads.messages.create,
+                    state["id"],
+                    **message,
+                )
+        if conversation.messages:
+            state = dict(state, synced=conversation.messages[-1].sent.isoformat())
+        state = dict(state, used=time.time())
+        conversation.data[DATA_KEY] = state
+        self.put(conversation.uuid, state)
+        return state["id"]
+
+    @staticmethod
+    def get_unsynced(messages, synced):
+        """Return messages sent after the last synced one.
+
+        Progress is kept as time the last synced message was sent, not as its
+        position, older messages may be trimmed from conversation since.
+
+        :param messages: messages of conversation
+        :param synced: isoformat of when the last synced message was sent, None
+            if none were, or position in messages as saved by earlier versions
+        """
+        if synced is None:
+            return messages
+        if isinstance(synced, int):
+            return messages[synced:]
+        synced = datetime.datetime.fromisoformat(synced)
+        start = len(messages)
+        while start > 0 and messages[start - 1].sent > synced:
+            start -= 1
+        return messages[start:]
+
+    def get_messages(self, messages):
+        """Return thread messages of conversation messages not sent by bot."""
+        return [
+            {"role": "user", "content": i.text}
+            for i in messages
+            if i.author != self.author and i.text
+        ]
+
+    def put(self, uuid, state):
+        """Cache thread state of conversation."""
+        with self.lock:
+            self.threads[uuid] = state
+            self.threads.move_to_end(uuid)
+            self.used[state["id"]] = state["used"]
+            while len(self.threads) > self.max_threads:
+                self.threads.popitem(last=False)
+
+    async def restore(self, page: int = 1000):
+        """Add threads of stored conversations to collection, return number added."""
+        restored = 0
+        offset = 0
+        while True:
+            conversations = await self.storage.list_conversations(offset, page)
+            with self.lock:
+                for conversation in conversations:
+                    state = conversation.data.get(DATA_KEY)
+                    if not state:
+                        continue
+                    if state["id"] not in self.used:
+                        restored += 1
+                    used = max(state["used"], self.used.get(state["id"], 0))
+                    self.used[state["id"]] = used
+            if len(conversations) < page:
+                return restored
+            offset += page
+
+    def collect(self):
+        """Delete threads idle longer than idle timeout, return number deleted."""
+        deadline = time.time() - self.idle_timeout
+        with self.lock:
+            expired = {i for i, used in self.used.items() if used < deadline}
+            for thread_id in expired:
+                del self.used[thread_id]
+            for uuid, state in list(self.threads.items()):
+                if state["id"] in expired:
+                    del self.threads[uuid]
+        for thread_id in expired:
+            try:
+                schedule(
+                    self.scheduler,
+                    self.client.beta.threads.delete,
+                    thread_id,
+                    priority=zoozl.chatbot.scheduler.PRIORITY_BACKGROUND,
+                )
+            except Exception:
+                log.warning("Unable to delete thread %s", thread_id, exc_info=True)
+        return len(expired)
+
+    async def run(self, interval: float = 3600):
+        """Delete expired threads forever with interval in seconds between runs."""
+        if self.storage is not None:
+            try:
+                count = await self.restore()
+            except Exception:
+                log.exception("Restoring threads of stored conversations failed")
+            else:
+                log.info("Restored %s threads of stored conversations", count)
+        while True:
+            try:
+                count = await asyncio.to_thread(self.collect)
+            except Exception:
+                log.exception("Thread collection failed")
+            else:
+                if count:
+                    log.info("Deleted %s expired threads", count)
+            await asyncio.sleep(interval)
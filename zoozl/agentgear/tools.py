@@ -1,16 +1,24 @@
 """Base definitions for agents."""
 
+import asyncio
+import concurrent.futures
+import contextlib
+import dataclasses
 import enum
+import functools
 import hashlib
+import inspect
 import logging
 import json
-from typing import Iterator, Optional
+import os
+import time
+from typing import Callable, Iterator, Optional
 
 from openai import OpenAI, AssistantEventHandler
 import pydantic
 
 import zoozl.chatbot
-
+from zoozl import utils
 
 log = logging.getLogger(__name__)
 
@@ -59,32 +67,183 @@ def get_agent_id(agent: BaseAgent) -> str:
     return hashlib.md5(json.dumps(agent_to_dict(agent)).encode()).hexdigest()
 
 
-def configure(client: OpenAI, agents: Iterator[BaseAgent]) -> None:
+@dataclasses.dataclass
+class DeployedAgent:
+    """Assistant deployed for agent definition."""
+
+    id: str
+    name: str
+    agent_id: str
+
+    @property
+    def metadata(self) -> dict:
+        """Return metadata as set on assistant."""
+        return {"agent_id": self.agent_id}
+
+
+@dataclasses.dataclass
+class AgentDiff:
+    """Changes needed to bring assistants in line with agent definitions.
+
+    create - (agent_id, agent) tuples of agents without assistant
+    delete - assistants not matching any agent
+    keep - DeployedAgent of assistants matching agents
+    """
+
+    create: list = dataclasses.field(default_factory=list)
+    delete: list = dataclasses.field(default_factory=list)
+    keep: list = dataclasses.field(default_factory=list)
+
+    def __bool__(self):
+        """Return True if any assistant is to be created or deleted."""
+        return bool(self.create or self.delete)
+
+
+def load_manifest(path: Optional[str]) -> dict:
+    """Return agent_id to DeployedAgent mapping saved in manifest file."""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+        return {i["agent_id"]: DeployedAgent(**i) for i in data["agents"]}
+    except (OSError, ValueError, KeyError, TypeError):
+        log.warning("Ignoring unreadable agent manifest %s", path, exc_info=True)
+        return {}
+
+
+def save_manifest(path: str, deployed: Iterator[DeployedAgent]) -> None:
+    """Save deployed agents into manifest file."""
+    data = {"agents": [dataclasses.asdict(i) for i in deployed]}
+    with utils.write_aside(path) as tmp, open(tmp, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=2, sort_keys=True)
+
+
+def schedule(scheduler, function, *args, priority=None, **kwargs):
+    """Call function via scheduler if any.
+
+    :param scheduler: scheduler of requests, None to call function directly
+    :param priority: priority of request, None for the current one
+    """
+    if scheduler is None:
+        return function(*args, **kwargs)
+    return scheduler.call(function, *args, priority=priority, **kwargs)
+
+
+def get_diff(client: OpenAI, wanted: dict, scheduler=None) -> AgentDiff:
+    """Return changes needed on account for wanted agent_id to agent mapping.
+
+    Assistants without agent_id, with unknown agent_id or duplicates are deleted.
+    """
+    diff = AgentDiff()
+    found = set()
+    assistants = schedule(
+        scheduler,
+        lambda: list(client.beta.assistants.list()),
+        priority=zoozl.chatbot.scheduler.PRIORITY_BACKGROUND,
+    )
+    for assistant in assistants:
+        agent_id = (assistant.metadata or {}).get("agent_id")
+        if agent_id in wanted and agent_id not in found:
+            found.add(agent_id)
+            diff.keep.append(
+                DeployedAgent(assistant.id, assistant.name, agent_id=agent_id)
+            )
+        else:
+            diff.delete.append(assistant)
+    diff.create = [(i, agent) for i, agent in wanted.items() if i not in found]
+    return diff
+
+
+def create_agent(
+    client: OpenAI, agent: BaseAgent, agent_id: str, scheduler=None
+) -> DeployedAgent:
+    """Create assistant for agent."""
+    kwargs = agent_to_dict(agent)
+    kwargs["metadata"] = {"agent_id": agent_id}
+    log.info("Creating agent %s", kwargs["name"])
+    assistant = schedule(
+        scheduler,
+        client.beta.assistants.create,
+        priority=zoozl.chatbot.scheduler.PRIORITY_BACKGROUND,
+        **kwargs,
+    )
+    return DeployedAgent(assistant.id, kwargs["name"], agent_id=agent_id)
+
+
+def delete_agent(client: OpenAI, assistant, scheduler=None) -> None:
+    """Delete assistant."""
+    log.info("Deleting agent %s", assistant.name)
+    schedule(
+        scheduler,
+        client.beta.assistants.delete,
+        assistant.id,
+        priority=zoozl.chatbot.scheduler.PRIORITY_BACKGROUND,
+    )
+
+
+def configure(
+    client: OpenAI,
+    agents: Iterator[BaseAgent],
+    manifest_path: Optional[str] = None,
+    workers: int = 8,
+    dry_run: bool = False,
+    scheduler: zoozl.chatbot.RequestScheduler = None,
+    refresh: bool = False,
+    max_age: Optional[float] = None,
+):
     """Configure all agents.
 
     Make sure that all agents provided are correctly configured and
-    available for use.
+    available for use. Return list of DeployedAgent, not assistant objects
+    of API as before manifest was introduced.
+
+    :param client: OpenAI client
+    :param agents: agent definitions
+    :param manifest_path: optional file where deployed assistants are remembered,
+        account is synced only if any agent definition has changed since
+    :param workers: number of create and delete calls made concurrently
+    :param dry_run: if True, nothing is changed and AgentDiff is returned
+    :param scheduler: optional scheduler that admits calls as background requests
+    :param refresh: if True, account is synced even if manifest is up to date,
+        assistants deleted or changed on account are recreated, strays deleted
+    :param max_age: seconds after which manifest is stale and account is synced
     """
-    existing_agents = {}
-    for agent in client.beta.assistants.list():
-        if agent.metadata.get("agent_id") is None:
-            client.beta.assistants.delete(agent.id)
-        else:
-            existing_agents[agent.metadata["agent_id"]] = agent
-    for agent in agents:
-        agent_id = get_agent_id(agent)
-        if agent_id not in existing_agents:
-            kwargs = agent_to_dict(agent)
-            kwargs["metadata"] = {"agent_id": agent_id}
-            log.info("Creating agent %s", kwargs["name"])
-            client.beta.assistants.create(**kwargs)
-        else:
-            log.info("Agent %s exists", agent.name)
-            existing_agents.pop(agent_id)
-    for agent in existing_agents.values():
-        log.info("Deleting agent %s", agent.name)
-        client.beta.assistants.delete(agent.id)
-    return list(client.beta.assistants.list())
+    wanted = {get_agent_id(i): i for i in agents}
+    manifest = {} if refresh else load_manifest(manifest_path)
+    if manifest and max_age is not None:
+        if time.time() - os.path.getmtime(manifest_path) > max_age:
+            log.info("Agent manifest older than %s seconds, syncing", max_age)
+            manifest = {}
+    if manifest and manifest.keys() == wanted.keys():
+        log.info("Agents unchanged since last sync, skipping remote calls")
+        if dry_run:
+            return AgentDiff(keep=list(manifest.values()))
+        return [manifest[i] for i in wanted]
+    diff = get_diff(client, wanted, scheduler)
+    for assistant in diff.keep:
+        log.info("Agent %s exists", assistant.name)
+    if dry_run:
+        for _, agent in diff.create:
+            log.info("Would create agent %s", agent_to_dict(agent)["name"])
+        for assistant in diff.delete:
+            log.info("Would delete agent %s", assistant.name)
+        return diff
+    with concurrent.futures.ThreadPoolExecutor(max(workers, 1)) as pool:
+        deleted = [pool.submit(delete_agent, client, i, scheduler) for i in diff.delete]
+        created = [
+            pool.submit(create_agent, client, a, i, scheduler) for i, a in diff.create
+        ]
+        # Results are collected so that any failed call raises here, failed sync
+        # leaves manifest as it was and next start syncs again
+        for future in deleted:
+            future.result()
+        deployed = {i.agent_id: i for i in diff.keep}
+        deployed.update((i.agent_id, i) for i in (f.result() for f in created))
+    deployed = [deployed[i] for i in wanted]
+    if manifest_path:
+        save_manifest(manifest_path, deployed)
+    return deployed
 
 
 class ArgumentType(enum.StrEnum):
@@ -159,8 +318,107 @@ def build_parameter(
     }
 
 
+HANDOFF_PREFIX = "transfer_to_"
+
+
+class ToolExecutor:
+    """Run tool calls of assistant with Python callables mapped to function names.
+
+    Tool calls of one run are executed concurrently: coroutine functions in event
+    loop, blocking functions in thread pool. Call that exceeds timeout of its tool
+    is answered with error output, blocking function still finishes in its thread.
+    """
+
+    def __init__(self, tools: dict = None, timeout: float = 30, workers: int = 8):
+        """Initialise executor.
+
+        :param tools: mapping of function name or FunctionSchema to callable
+        :param timeout: default seconds a tool call may take
+        :param workers: number of threads running blocking tools
+        """
+        self.tools = {}
+        self.timeouts = {}
+        self.timeout = timeout
+        self.workers = workers
+        self.pool = None
+        for name, function in (tools or {}).items():
+            self.register(name, function)
+
+    def register(self, name, function: Callable, timeout: float = None):
+        """Map function name or FunctionSchema to callable with optional timeout."""
+        if isinstance(name, FunctionSchema):
+            name = name.name
+        self.tools[name] = function
+        if timeout is not None:
+            self.timeouts[name] = timeout
+
+    def execute(self, tool_calls, loop: asyncio.AbstractEventLoop = None) -> list:
+        """Run tool calls from thread outside event loop, return tool outputs.
+
+        :param tool_calls: tool calls of run that requires action
+        :param loop: optional running event loop for coroutine tools, otherwise
+            tools run in new event loop of calling thread
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError("Tools must be executed outside event loop thread")
+        if loop is not None and loop.is_running():
+            return asyncio.run_coroutine_threadsafe(self.run(tool_calls), loop).result()
+        return asyncio.run(self.run(tool_calls))
+
+    async def run(self, tool_calls) -> list:
+        """Run tool calls concurrently, return tool outputs in the same order."""
+        return list(await asyncio.gather(*(self.call(i) for i in tool_calls)))
+
+    async def call(self, tool_call) -> dict:
+        """Run tool call, return its tool output."""
+        name = tool_call.function.name
+        function = self.tools.get(name)
+        timeout = self.timeouts.get(name, self.timeout)
+        if function is None:
+            log.warning("Unknown tool %s called", name)
+            return {
+                "tool_call_id": tool_call.id,
+                "output": f"Error: Unknown tool {name}",
+            }
+        try:
+            arguments = json.loads(tool_call.function.arguments or "{}")
+            async with asyncio.timeout(timeout):
+                if inspect.iscoroutinefunction(function):
+                    result = await function(**arguments)
+                else:
+                    if self.pool is None:
+                        self.pool = concurrent.futures.ThreadPoolExecutor(self.workers)
+                    result = await asyncio.get_running_loop().run_in_executor(
+                        self.pool, functools.partial(function, **arguments)
+                    )
+            output = result if isinstance(result, str) else json.dumps(result)
+        except TimeoutError:
+            log.warning("Tool %s timed out after %s seconds", name, timeout)
+            output = f"Error: {name} timed out after {timeout} seconds"
+        except Exception as error:
+            log.exception("Tool %s failed", name)
+            output = f"Error: {error}"
+        return {"tool_call_id": tool_call.id, "output": output}
+
+    def close(self):
+        """Stop threads of blocking tools."""
+        if self.pool:
+            self.pool.shutdown(wait=False)
+            self.pool = None
+
+
 class StreamHandler(AssistantEventHandler):
-    """Handles the stream from openai."""
+    """Handles the stream from openai.
+
+    Text is written to package stream as it is generated, transports that show
+    replies while they grow let talker read first tokens right away. Tool calls
+    are run with tools executor and their outputs submitted at once, calls of
+    `transfer_to_<agent>` functions set `handoff` to the agent name.
+    """
 
     def __init__(
         self,
@@ -169,21 +427,58 @@ class StreamHandler(AssistantEventHandler):
         assistant_map: dict,
         package: zoozl.chatbot.Package,
         context: zoozl.chatbot.InterfaceRoot,
+        tools: ToolExecutor = None,
+        loop: asyncio.AbstractEventLoop = None,
+        scheduler: zoozl.chatbot.RequestScheduler = None,
     ):
-        """Initialize the handler with callback."""
+        """Initialize the handler with callback.
+
+        :param tools: optional executor of tool calls
+        :param loop: optional event loop that runs coroutine tools
+        :param scheduler: optional scheduler that admits run requests
+        """
         super().__init__()
         self.package = package
         self.client = client
         self.thread_id = thread_id
         self.assistant_map = assistant_map
         self.context = context
+        self.tools = tools if tools is not None else ToolExecutor()
+        self.loop = loop
+        self.scheduler = scheduler
+        self.stream = None
+        self.handoff = None
+
+    def copy(self):
+        """Return new handler for stream that continues run of this handler."""
+        return type(self)(
+            self.client,
+            self.thread_id,
+            self.assistant_map,
+            self.package,
+            self.context,
+            self.tools,
+            self.loop,
+            self.scheduler,
+        )
+
+    def on_text_delta(self, delta, snapshot):
+        """Send piece of text as soon as it is generated."""
+        if delta.value:
+            if self.stream is None:
+                self.stream = self.package.stream()
+            self.stream.write(delta.value)
 
     def on_text_done(self, text):
-        """Send text back to caller."""
+        """Send whole text back to caller."""
         value = text.value
         for a in text.annotations:
             value = value.replace(a.text, "")
-        self.package.callback(value)
+        if self.stream is None:
+            self.package.callback(value)
+        else:
+            self.stream.close(value)
+            self.stream = None
 
     def on_timeout(self):
         """Handle timeout."""
@@ -192,6 +487,96 @@ class StreamHandler(AssistantEventHandler):
         )
         super().on_timeout()
 
-    def on_tool_call_created(self, tool_call):
-        """Receive tool call."""
-        log.warning("We received unhandled tool call %s", tool_call)
+    def on_event(self, event):
+        """Answer tool calls of run that requires action."""
+        if event.event == "thread.run.requires_action":
+            self.submit_tool_outputs(event.data)
+
+    def submit_tool_outputs(self, run):
+        """Run tool calls concurrently and submit all outputs in one request."""
+        tool_calls = run.required_action.submit_tool_outputs.tool_calls
+        calls = [
+            i for i in tool_calls if not i.function.name.startswith(HANDOFF_PREFIX)
+        ]
+        outputs = {i["tool_call_id"]: i for i in self.tools.execute(calls, self.loop)}
+        for call in tool_calls:
+            if call.id not in outputs:
+                self.handoff = call.function.name.removeprefix(HANDOFF_PREFIX)
+                log.info("Handing off to agent %s", self.handoff)
+                outputs[call.id] = {
+                    "tool_call_id": call.id,
+                    "output": f"Transferred to {self.handoff}",
+                }
+        handler = self.copy()
+        manager = self.client.beta.threads.runs.submit_tool_outputs_stream(
+            thread_id=self.thread_id,
+            run_id=run.id,
+            tool_outputs=[outputs[i.id] for i in tool_calls],
+            event_handler=handler,
+        )
+        run_stream(manager, self.scheduler)
+        self.handoff = handler.handoff or self.handoff
+
+
+def run_stream(manager, scheduler: zoozl.chatbot.RequestScheduler = None):
+    """Open stream of stream manager and consume it until done.
+
+    With scheduler only request that opens stream waits for admission and is
+    retried, so that text already streamed is never sent twice and slot is not
+    held while nested tool output streams wait for their own.
+    """
+    with contextlib.ExitStack() as stack:
+        enter = functools.partial(stack.enter_context, manager)
+        stream = enter() if scheduler is None else scheduler.call(enter)
+        stream.until_done()
+
+
+def stream_agent(
+    client: OpenAI,
+    thread_id: str,
+    name: str,
+    assistant_map: dict,
+    package: zoozl.chatbot.Package,
+    context: zoozl.chatbot.InterfaceRoot,
+    tools: ToolExecutor = None,
+    loop: asyncio.AbstractEventLoop = None,
+    max_handoffs: int = 5,
+    scheduler: zoozl.chatbot.RequestScheduler = None,
+) -> str:
+    """Run agent on thread following handoffs to other agents, blocking.
+
+    Return name of agent that answered last, the one whose run ended without
+    handoff followed. Run it in thread, e.g. with asyncio.to_thread, and pass
+    running loop if any of tools are coroutines.
+
+    :param name: name of agent that answers first, key of assistant_map
+    :param assistant_map: mapping of agent names to assistant ids
+    :param max_handoffs: number of handoffs followed within one call
+    :param scheduler: optional scheduler that admits run requests, e.g. one of
+        InterfaceRoot
+    """
+    for handoffs in range(max_handoffs + 1):
+        handler = StreamHandler(
+            client, thread_id, assistant_map, package, context, tools, loop, scheduler
+        )
+        manager = client.beta.threads.runs.stream(
+            thread_id=thread_id,
+            assistant_id=assistant_map[name],
+            event_handler=handler,
+        )
+        run_stream(manager, scheduler)
+        if handler.handoff is None:
+            break
+        if handler.handoff not in assistant_map:
+            log.warning("Unknown agent %s to hand off to", handler.handoff)
+            break
+        if handoffs == max_handoffs:
+            log.warning(
+                "Handoff of %s to %s dropped, %s handoffs exhausted",
+                name,
+                handler.handoff,
+                max_handoffs,
+            )
+            break
+        name = handler.handoff
+    return name
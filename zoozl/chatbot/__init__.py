@@ -7,16 +7,28 @@ Usage:
         With the api help classes extension modules are built
 """
 
-from .api import Interface, Message, Conversation, Package, MessagePart
+from .api import (
+    CoalescingStream,
+    Interface,
+    Message,
+    Conversation,
+    Package,
+    MessagePart,
+    TextStream,
+)
 from .interface import Chat, InterfaceRoot
+from .scheduler import RequestScheduler
 
 
 __all__ = [
     "Chat",
+    "CoalescingStream",
     "Conversation",
     "Interface",
     "InterfaceRoot",
     "Message",
     "Package",
     "MessagePart",
+    "RequestScheduler",
+    "TextStream",
 ]
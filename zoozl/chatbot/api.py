@@ -4,10 +4,15 @@ Extension module should contain as a minimum one subclass of Interface
 """
 
 from abc import abstractmethod
+import asyncio
 import base64
+import collections.abc
 import datetime
 import dataclasses
 from dataclasses import dataclass
+import inspect
+import threading
+import time
 import uuid
 
 
@@ -121,6 +126,71 @@ class Conversation:
             self.messages = [Message(**i) for i in self.messages]
 
 
+def get_state_name(interface):
+    """Return name state of interface is kept under, unique among extensions."""
+    cls = type(interface)
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+class State(collections.abc.MutableMapping):
+    """State of interface within one conversation.
+
+    Keys are declared with defaults in `Interface.state`. Values are kept in
+    `Conversation.data["state"]` under `get_state_name` of interface, only those
+    that differ from defaults, thus interfaces talker never used take no space. Values
+    must be replaced rather than changed in place, so that change is recorded in
+    changes and declared defaults stay intact.
+    """
+
+    def __init__(self, data, name, defaults, changes):
+        """Initialise state view.
+
+        :param data: data of conversation
+        :param name: name of interface
+        :param defaults: declared keys with default values
+        :param changes: set that receives (name, key) of every change
+        """
+        self.data = data
+        self.name = name
+        self.defaults = defaults
+        self.changes = changes
+
+    def __getitem__(self, key):
+        """Return value of key, default if it is not set."""
+        values = self.data.get("state", {}).get(self.name, {})
+        if key in values:
+            return values[key]
+        return self.defaults[key]
+
+    def __setitem__(self, key, value):
+        """Set value of declared key, value equal to default is not stored."""
+        if key not in self.defaults:
+            raise KeyError(f"State '{key}' of {self.name} is not declared")
+        states = self.data.setdefault("state", {})
+        values = states.setdefault(self.name, {})
+        if value == self.defaults[key]:
+            values.pop(key, None)
+        else:
+            values[key] = value
+        if not values:
+            del states[self.name]
+        if not states:
+            del self.data["state"]
+        self.changes.add((self.name, key))
+
+    def __delitem__(self, key):
+        """Reset key to its default."""
+        self[key] = self.defaults[key]
+
+    def __iter__(self):
+        """Iterate over declared keys."""
+        return iter(self.defaults)
+
+    def __len__(self):
+        """Return number of declared keys."""
+        return len(self.defaults)
+
+
 @dataclass
 class Package:
     """Package contains information data that is exchanged between bot and commands.
@@ -129,10 +199,48 @@ class Package:
     callback - a function to allow sending back Message object to user
         (as a convenience it is possible to send just text string that will be
         formatted into Message object automatically by interface)
+    streamer - optional function returning TextStream of talker's transport
+    changes - (interface, key) pairs of states changed since conversation was saved
+    sender - optional async function that sends message and waits on delivery
     """
 
     conversation: Conversation
     callback: type
+    streamer: type = None
+    changes: set = dataclasses.field(default_factory=set)
+    sender: type = None
+
+    async def send(self, message):
+        """Send message to user, waiting until transport delivers it.
+
+        Unlike callback that returns at once, slow talker holds plugin back here
+        and failed delivery raises.
+        """
+        if self.sender is not None:
+            await self.sender(message)
+            return
+        result = self.callback(message)
+        if inspect.isawaitable(result):
+            await result
+
+    def state(self, interface):
+        """Return State of interface within conversation.
+
+        Plugin instance serves all talkers at once, thus anything that belongs to
+        one conversation is kept in its state rather than on plugin itself.
+        """
+        return State(
+            self.conversation.data,
+            get_state_name(interface),
+            interface.state,
+            self.changes,
+        )
+
+    def stream(self):
+        """Return TextStream to send reply to user while it is being generated."""
+        if self.streamer is None:
+            return TextStream(self.callback)
+        return self.streamer()
 
     @property
     def last_message(self):
@@ -164,16 +272,136 @@ class Package:
         return attachments
 
 
+class TextStream:
+    """Text message sent to user piece by piece while it is being generated.
+
+    Plugin writes pieces of text as they are generated and closes stream with
+    whole text. This stream sends whole text with callback once it is closed,
+    transports that show message while it grows subclass CoalescingStream.
+    """
+
+    def __init__(self, send=None):
+        """Initialise stream with function that sends whole text."""
+        self.send = send
+        self.pieces = []
+        self.closed = False
+        # Receives future returned by finish, set by Chat to await it within turn
+        self.on_finish = None
+
+    @property
+    def text(self):
+        """Return text written so far."""
+        return "".join(self.pieces)
+
+    def write(self, text):
+        """Add piece of text to message."""
+        if self.closed:
+            raise RuntimeError("Stream is closed.")
+        self.pieces.append(text)
+
+    def close(self, text=None):
+        """Finish message with whole text, by default with all pieces written."""
+        if not self.closed:
+            self.closed = True
+            result = self.finish(self.text if text is None else text)
+            if result is not None and self.on_finish is not None:
+                self.on_finish(result)
+
+    def finish(self, text):
+        """Send whole text of message, return None or future of its delivery."""
+        self.send(text)
+
+
+class CoalescingStream(TextStream):
+    """Stream that sends pieces written within flush interval at once.
+
+    First piece is sent right away, so user sees reply as soon as it starts.
+    Pieces held back within interval are sent from event loop once it passes, even
+    if nothing more is written, e.g. while plugin waits on tool call. Stream created
+    outside event loop without loop given sends them with next write or close.
+    """
+
+    def __init__(self, interval=0.1, loop=None):
+        """Initialise stream with seconds between sending pieces.
+
+        :param loop: event loop that sends held back pieces, by default running one
+        """
+        super().__init__()
+        self.interval = interval
+        self.pending = []
+        self.flushed = None
+        self.scheduled = False
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+        self.loop = loop
+        # Writers and event loop send pieces in order they were written
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        """Add piece of text, send pending pieces if flush interval has passed."""
+        super().write(text)
+        with self.lock:
+            self.pending.append(text)
+            elapsed = None if self.flushed is None else time.monotonic() - self.flushed
+            if elapsed is None or elapsed >= self.interval:
+                self.send_pending()
+            elif not self.scheduled and self.loop is not None:
+                self.scheduled = True
+                try:
+                    self.loop.call_soon_threadsafe(
+                        self.loop.call_later, self.interval - elapsed, self.flush
+                    )
+                except RuntimeError:
+                    # Loop is closed, pieces are sent with next write or close
+                    self.scheduled = False
+
+    def flush(self):
+        """Send pieces held back within flush interval."""
+        with self.lock:
+            self.scheduled = False
+            if self.pending and not self.closed:
+                self.send_pending()
+
+    def send_pending(self):
+        """Send pending pieces at once, caller holds lock."""
+        self.flushed = time.monotonic()
+        text = "".join(self.pending)
+        self.pending.clear()
+        self.send_delta(text)
+
+    def close(self, text=None):
+        """Finish message, pending pieces are part of whole text sent."""
+        with self.lock:
+            self.pending.clear()
+            super().close(text)
+
+    def send_delta(self, text):
+        """Send text added to message since last sent piece."""
+        raise NotImplementedError
+
+
 class Interface:
     """Interface to the chat command handling.
 
     Subclass this to extend a chat module
 
     aliases - define a set of command functions that would trigger this event
+    examples - optional set of other phrasings that trigger this event as well
+    state - keys with defaults of state per conversation, see Package.state
+
+    One instance serves all talkers, possibly concurrently, thus state of
+    conversation is kept in `package.state(self)` rather than on instance.
     """
 
     # Command names as typed by the one who asks
     aliases = set()
+    # Other phrasings that should route to this interface as well
+    examples = set()
+    # State kept per conversation, mapped to default values
+    state = {}
 
     def load(self, root):
         """Preload once an Interface.
@@ -190,6 +418,15 @@ class Interface:
         :param package: is a special object defined as Package, exchanges data
         """
 
-    def is_complete(self):
-        """Must return True or False."""
+    def is_complete(self, package):
+        """Return True if subject of conversation in package is complete."""
+        return False
+
+    def is_cancelled(self, package):
+        """Return True if last message of package cancels ongoing subject.
+
+        Checked before every turn of subject of this interface, thus must be cheap.
+        Predicate of interface with cancel alias is checked on subjects of all
+        interfaces.
+        """
         return False
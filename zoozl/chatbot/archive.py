@@ -0,0 +1,161 @@
+"""Retention and archival of conversation history.
+
+Ongoing conversations keep only the last `history_hot_messages` messages in memory,
+older messages and finished conversations are moved into compressed per-day segment
+files within `archive_path`:
+
+    archive_path/
+        2024-05-01.jsonl.gz
+        2024-05-02.jsonl.gz
+
+Each line in a segment is a JSON record of either type "message" (message trimmed
+from ongoing conversation) or type "conversation" (finished conversation with all its
+remaining messages). Segments are appended as separate gzip members, thus any gzip
+reader is able to read them as one stream.
+
+>>> archiver = Archiver("archive", hot_messages=100)
+>>> archiver.compact(conversation)  # trim conversation, buffer older messages
+>>> archiver.flush()  # write trimmed messages before conversation is saved
+>>> await archiver.step(storage)  # archive finished conversations, flush buffers
+"""
+
+import asyncio
+import datetime
+import gzip
+import json
+import logging
+import os
+import threading
+
+from . import api
+
+log = logging.getLogger(__name__)
+
+
+def get_day(message=None):
+    """Return ISO day of the message or of today if message is not given."""
+    if message is None:
+        sent = datetime.datetime.now(datetime.timezone.utc)
+    else:
+        sent = message.sent.astimezone(datetime.timezone.utc)
+    return sent.date().isoformat()
+
+
+class Archiver:
+    """Archive conversation history into compressed per-day segments."""
+
+    def __init__(self, path, hot_messages=100, compact_step=None, batch_size=100):
+        """Initialise archiver.
+
+        :param path: directory where segment files are stored
+        :param hot_messages: number of latest messages ongoing conversation keeps
+        :param compact_step: number of messages conversation may grow above
+            hot_messages before it is compacted, defaults to half of hot_messages
+        :param batch_size: maximum number of finished conversations archived per step
+        """
+        if hot_messages < 1:
+            raise ValueError("Archiver must keep at least one hot message.")
+        self.path = path
+        self.hot_messages = hot_messages
+        self.compact_step = (
+            compact_step if compact_step is not None else max(hot_messages // 2, 1)
+        )
+        self.batch_size = batch_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def segment_path(self, day):
+        """Return segment file path for the ISO day."""
+        return os.path.join(self.path, f"{day}.jsonl.gz")
+
+    def compact(self, conversation):
+        """Trim older messages of the conversation into archive buffer.
+
+        Return number of messages trimmed, buffer must be flushed before trimmed
+        conversation is saved, otherwise trimmed messages are lost on crash.
+        """
+        if len(conversation.messages) <= self.hot_messages + self.compact_step:
+            return 0
+        cut = len(conversation.messages) - self.hot_messages
+        trimmed = conversation.messages[:cut]
+        del conversation.messages[:cut]
+        for message in trimmed:
+            self._add(
+                get_day(message),
+                {
+                    "type": "message",
+                    "conversation": conversation.uuid,
+                    "talker": conversation.talker,
+                    "message": api.encode_class(message),
+                },
+            )
+        return cut
+
+    def archive_conversation(self, conversation):
+        """Put whole conversation into archive buffer."""
+        last = conversation.messages[-1] if conversation.messages else None
+        self._add(
+            get_day(last),
+            {"type": "conversation", "conversation": api.encode_class(conversation)},
+        )
+
+    def _add(self, day, record):
+        """Add record to pending buffer of the day."""
+        self._pending.setdefault(day, []).append(json.dumps(record))
+
+    def flush(self):
+        """Write all buffered records into segment files.
+
+        Return number of records written.
+        """
+        # Flushes from worker threads must not interleave within segment
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            total = 0
+            for day, records in pending.items():
+                path = self.segment_path(day)
+                with gzip.open(path, "at", encoding="utf-8") as segment:
+                    segment.write("\n".join(records) + "\n")
+                total += len(records)
+        return total
+
+    async def step(self, storage):
+        """Archive one batch of finished conversations and flush buffers.
+
+        Return number of finished conversations archived.
+        """
+        finished = await storage.list_finished(self.batch_size)
+        for conversation in finished:
+            self.archive_conversation(conversation)
+        # Conversations are removed only after they are safely in segment files,
+        # segments are compressed in thread, talkers are not held back meanwhile
+        await asyncio.to_thread(self.flush)
+        for conversation in finished:
+            await storage.delete(conversation)
+        return len(finished)
+
+    def read(self, day):
+        """Generate archived records of the ISO day."""
+        path = self.segment_path(day)
+        if not os.path.exists(path):
+            return
+        with gzip.open(path, "rt", encoding="utf-8") as segment:
+            for line in segment:
+                yield json.loads(line)
+
+    async def run(self, storage, interval=60):
+        """Archive incrementally forever with interval in seconds between steps."""
+        while True:
+            try:
+                count = await self.step(storage)
+            except Exception:
+                log.exception("Archive step failed")
+            else:
+                if count:
+                    log.info("Archived %s finished conversations", count)
+                if count >= self.batch_size:
+                    # More finished conversations might be waiting, only yield
+                    await asyncio.sleep(0)
+                    continue
+            await asyncio.sleep(interval)
@@ -1,89 +1,568 @@
-"""Retrieve and manipulate embeddings of different supported models."""
+"""Retrieve and manipulate embeddings of different supported models.
+
+Intents are routed with an index of embedded aliases:
+
+    -> BruteForceIndex scores every alias, exact and fast for small catalogs
+    -> IVFIndex clusters aliases and scores only nearest clusters, for large catalogs
+
+>>> index = lookup.build_index([("help", "help"), ("help", "what can you do")])
+>>> index.search(lookup.get("what do you do"), k=1)
+[('help', 0.93)]
+"""
 
 from abc import ABC, abstractmethod
+import codecs
+import concurrent.futures
+import copy
+import functools
+import hashlib
+import logging
+import math
+import multiprocessing
+import operator
+import os
+import re
 import string
+import zlib
+
+import numpy as np
 
-from scipy import spatial
-from openai import OpenAI
+from zoozl import utils
+
+log = logging.getLogger(__name__)
 
 
 def get_cosine_similarity(x, y):
-    """Get cosine similarity of two embeddings."""
-    return 1 - spatial.distance.cosine(x, y)
+    """Get cosine similarity of two embeddings, zero if any of them is zero."""
+    norm = math.hypot(*x) * math.hypot(*y)
+    if not norm:
+        return 0.0
+    return math.fsum(map(operator.mul, x, y)) / norm
 
 
 class Lookup:
     """Lookup embeddings for the given text."""
 
-    def __init__(self, memory, embedder):
+    def __init__(self, storage, embedder):
         """Initialise lookup.
 
-        :param memory: memory bank to store embeddings
-        :param embedder: external embedder to use when embedding is not in memory
+        :param storage: conversation storage of interface root
+        :param embedder: external embedder that embeds texts
         """
-        self.memory = memory
+        self.storage = storage
         if not isinstance(embedder, AbstractExternalEmbedder):
             raise TypeError("Embedder should be instance of AbstractExternalEmbedder")
         self.embedder = embedder
 
     def load(self):
         """Load instance."""
-        self.external_query = self.embedder()
+        self.embedder.warmup()
 
     def clear(self):
         """Safely clear and close instance."""
+        self.embedder.close()
 
-    def get(self, text):
-        """Get embedding of the text."""
+    def get(self, text, index=None):
+        """Get embedding of the text, with embedder fitted for index if given."""
+        if index is not None and index.embedder is not None:
+            return index.embedder.get(text)
         return self.embedder.get(text)
 
+    def get_many(self, texts):
+        """Get embeddings of all texts in one batch."""
+        return self.embedder.get_many(texts)
+
+    def build_index(self, entries, path=None, ivf_threshold=1024):
+        """Return index of (label, text) entries.
+
+        :param entries: list of (label, text) tuples, text is embedded and searched
+        :param path: optional file to persist index in, index is loaded from it if
+            it was built from the same entries with the same embedder
+        :param ivf_threshold: number of entries from which IVFIndex is built
+        """
+        # Index keeps embedder fitted for it, queries are weighted as its entries
+        embedder = self.embedder.fit([text for _, text in entries])
+        key = get_index_key(embedder, entries)
+        if path and os.path.exists(path):
+            index = load_index(path, key)
+            if index is not None:
+                index.embedder = embedder
+                return index
+        labels = [label for label, _ in entries]
+        vectors = embedder.get_many([text for _, text in entries])
+        if len(entries) >= ivf_threshold:
+            index = IVFIndex(labels, vectors)
+        else:
+            index = BruteForceIndex(labels, vectors)
+        index.embedder = embedder
+        if path:
+            index.save(path, key)
+        return index
+
+
+def get_index_key(embedder, entries):
+    """Return key identifying index of entries embedded with embedder."""
+    digest = hashlib.sha256(embedder.name.encode())
+    for label, text in entries:
+        digest.update(f"\0{label}\t{text}".encode())
+    return digest.hexdigest()
+
+
+def normalise(vectors):
+    """Return float32 matrix of vectors scaled to unit length, zero ones stay zero."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class BruteForceIndex:
+    """Index that scores query against every labelled vector by cosine similarity."""
+
+    # Embedder fitted for indexed entries, queries are embedded with it
+    embedder = None
+
+    def __init__(self, labels, vectors):
+        """Initialise index with labels and their vectors, labels may repeat."""
+        self.labels = list(labels)
+        self.vectors = normalise(vectors) if self.labels else np.zeros((0, 0))
+
+    def __len__(self):
+        """Return number of indexed vectors."""
+        return len(self.labels)
+
+    def candidates(self, query):
+        """Return positions of vectors worth scoring against normalised query."""
+        return np.arange(len(self.labels))
+
+    def search(self, vector, k=1):
+        """Return up to k best (label, score) tuples, one per label, best first."""
+        if not self.labels:
+            return []
+        query = normalise(vector)[0]
+        positions = self.candidates(query)
+        scores = self.vectors[positions] @ query
+        # Labels repeat with several phrasings, best score of each label counts
+        found = {}
+        for i in np.argsort(-scores, kind="stable"):
+            label = self.labels[positions[i]]
+            if label not in found:
+                found[label] = float(scores[i])
+                if len(found) == k:
+                    break
+        return list(found.items())
+
+    def arrays(self):
+        """Return arrays that persist index."""
+        return {"labels": np.array(self.labels), "vectors": self.vectors}
+
+    def save(self, path, key):
+        """Persist index into file under key."""
+        # Suffix keeps numpy from appending .npz to temporary name
+        with utils.write_aside(path, ".tmp.npz") as tmp:
+            np.savez(
+                tmp,
+                key=np.array(key),
+                kind=np.array(type(self).__name__),
+                **self.arrays(),
+            )
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Return index restored from persisted arrays."""
+        index = cls.__new__(cls)
+        index.labels = arrays["labels"].tolist()
+        index.vectors = arrays["vectors"]
+        return index
+
+
+class IVFIndex(BruteForceIndex):
+    """Inverted file index that scores query only against vectors of nearest clusters.
+
+    Vectors are clustered with spherical k-means into about sqrt(n) lists, search
+    looks into `n_probe` lists with centroids nearest to query.
+    """
+
+    def __init__(self, labels, vectors, n_lists=None, n_probe=8, iterations=10, seed=0):
+        """Initialise index and train its clusters."""
+        super().__init__(labels, vectors)
+        self.n_probe = n_probe
+        n_lists = n_lists or max(int(math.sqrt(len(self.labels))), 1)
+        self.train(min(n_lists, len(self.labels)), iterations, seed)
+
+    def train(self, n_lists, iterations, seed):
+        """Cluster vectors into n_lists lists."""
+        rng = np.random.default_rng(seed)
+        count = len(self.labels)
+        centroids = self.vectors[rng.choice(count, n_lists, replace=False)]
+        for _ in range(iterations):
+            assignments = np.argmax(self.vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, self.vectors)
+            empty = ~sums.any(axis=1)
+            # Empty clusters are restarted from random vectors
+            sums[empty] = self.vectors[rng.choice(count, int(empty.sum()))]
+            centroids = normalise(sums)
+        self.centroids = centroids
+        self.assignments = np.argmax(self.vectors @ centroids.T, axis=1)
+        self.build_lists()
+
+    def build_lists(self):
+        """Build inverted lists of vector positions per cluster."""
+        order = np.argsort(self.assignments, kind="stable")
+        bounds = np.searchsorted(
+            self.assignments[order], np.arange(1, len(self.centroids))
+        )
+        self.lists = np.split(order, bounds)
+
+    def candidates(self, query):
+        """Return positions of vectors within lists nearest to query."""
+        probe = min(self.n_probe, len(self.centroids))
+        nearest = np.argpartition(-(self.centroids @ query), probe - 1)[:probe]
+        return np.concatenate([self.lists[i] for i in nearest])
+
+    def arrays(self):
+        """Return arrays that persist index."""
+        return dict(
+            super().arrays(),
+            centroids=self.centroids,
+            assignments=self.assignments,
+            n_probe=np.array(self.n_probe),
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Return index restored from persisted arrays."""
+        index = super().from_arrays(arrays)
+        index.centroids = arrays["centroids"]
+        index.assignments = arrays["assignments"]
+        index.n_probe = int(arrays["n_probe"])
+        index.build_lists()
+        return index
+
+
+def load_index(path, key):
+    """Return index persisted in file under key, None if it is missing or stale."""
+    kinds = {i.__name__: i for i in (BruteForceIndex, IVFIndex)}
+    try:
+        with np.load(path, allow_pickle=False) as arrays:
+            if str(arrays["key"]) != key:
+                return None
+            return kinds[str(arrays["kind"])].from_arrays(arrays)
+    except (OSError, KeyError, ValueError):
+        log.warning("Unable to load intent index from %s", path, exc_info=True)
+        return None
+
 
 class AbstractExternalEmbedder(ABC):
     """Abstract class for external embedder."""
 
+    # Similarity above which message is routed to alias by default
+    threshold = 0.8
+    # Scheduler of requests to rate limited API, set by InterfaceRoot if None
+    scheduler = None
+    # Embedder makes requests over network, messages are embedded off event loop
+    remote = False
+
+    @property
+    def name(self):
+        """Return name that identifies embeddings this embedder produces."""
+        return type(self).__name__
+
     @abstractmethod
     def get(self, text):
         """Get embedding of the text."""
 
+    def get_many(self, texts):
+        """Get embeddings of texts, override when model embeds batches faster."""
+        return [self.get(i) for i in texts]
+
+    def fit(self, texts):
+        """Return embedder adapted to texts that are going to be indexed."""
+        return self
+
+    def warmup(self):
+        """Prepare embedder, so that first message is embedded without delay."""
+
+    def close(self):
+        """Release resources held by embedder."""
+
 
 class OpenAIEmbedder(AbstractExternalEmbedder):
     """OpenAI embedder."""
 
+    remote = True
+
     def __init__(self, conf, model="text-embedding-3-small"):
         """Initialise OpenAI embedder.
 
         :param conf: configuration to use
         :param model: model to use
         """
-        self.client = OpenAI(api_key=conf["api_key"])
+        from openai import OpenAI
+
+        self.client = OpenAI(
+            api_key=conf["api_key"], base_url=conf.get("openai_base_url")
+        )
         self.model = model
 
+    @property
+    def name(self):
+        """Return name that identifies embeddings of the model."""
+        return f"openai:{self.model}"
+
+    def create(self, texts):
+        """Return response of embeddings request, scheduled if scheduler is set."""
+        if self.scheduler is None:
+            return self.client.embeddings.create(input=texts, model=self.model)
+        # Roughly four characters per token
+        tokens = sum(len(i) for i in texts) // 4 + 1
+        # Scheduler retries requests itself, client retrying as well multiplies
+        # requests of rate limited account
+        client = self.client.with_options(max_retries=0)
+        return self.scheduler.call(
+            client.embeddings.create, input=texts, model=self.model, tokens=tokens
+        )
+
     def get(self, text):
         """Get embedding of the text."""
-        return (
-            self.client.embeddings.create(input=text, model=self.model)
-            .data[0]
-            .embedding
-        )
+        return self.create([text]).data[0].embedding
+
+    def get_many(self, texts):
+        """Get embeddings of texts with one request."""
+        if not texts:
+            return []
+        return [i.embedding for i in self.create(list(texts)).data]
+
+
+def get_char_table():
+    """Return translation of ASCII bytes into CharEmbedder buckets.
+
+    Letters map to their own buckets, whitespace and punctuation to one bucket,
+    digits to another one, anything else to the last bucket.
+    """
+    letters = len(string.ascii_lowercase)
+    table = bytearray([letters + 2] * 256)
+    for c in string.whitespace + string.punctuation:
+        table[ord(c)] = letters
+    for c in string.digits:
+        table[ord(c)] = letters + 1
+    for i, c in enumerate(string.ascii_lowercase):
+        table[ord(c)] = i
+    return bytes(table)
+
+
+CHAR_TABLE = get_char_table()
+CHAR_DIMENSIONS = len(string.ascii_lowercase) + 3
+# Non ASCII characters are encoded as one byte each, translated into the last bucket
+codecs.register_error("zoozl.char", lambda e: (b"\x80" * (e.end - e.start), e.end))
+# Multiplier of polynomial n-gram hash, arithmetic wraps around at 64 bits
+NGRAM_PRIME = np.uint64(1099511628211)
+
+
+def get_char_buckets(text):
+    """Return bytes with CharEmbedder bucket of each character of text."""
+    encoded = text.lower().encode("ascii", errors="zoozl.char")
+    return encoded.translate(CHAR_TABLE)
+
+
+def get_codepoints(text):
+    """Return array of code points of lowercased text."""
+    encoded = text.lower().encode("utf-32-le", errors="surrogatepass")
+    return np.frombuffer(encoded, dtype=np.uint32)
 
 
 class CharEmbedder(AbstractExternalEmbedder):
     """Dumbest embedder that works locally without any dependencies.
 
     This embedder is used as a fallback when no external embedder is available.
+    By default text is embedded into counts of each ASCII letter, of whitespace
+    and punctuation, of digits and of any other characters. With `ngrams` set,
+    counts of hashed character n-grams of given sizes are appended, they tell
+    apart texts made of the same letters in different order.
     """
 
+    def __init__(self, ngrams=(), buckets=512):
+        """Initialise embedder.
+
+        :param ngrams: sizes of character n-grams to count, e.g. (2, 3)
+        :param buckets: number of hash buckets n-grams are counted in
+        """
+        self.ngrams = tuple(ngrams)
+        self.buckets = buckets if self.ngrams else 0
+        self.dimensions = CHAR_DIMENSIONS + self.buckets
+
+    @property
+    def name(self):
+        """Return name that identifies embeddings of n-gram configuration."""
+        if not self.ngrams:
+            return type(self).__name__
+        sizes = ",".join(map(str, self.ngrams))
+        return f"{type(self).__name__}:ngrams={sizes}:buckets={self.buckets}"
+
     def get(self, text):
         """Get embedding of the text."""
-        text = text.lower()
-        vector = [0] * (len(string.ascii_lowercase) + 3)
-        for c in text:
-            if c in string.ascii_lowercase:
-                vector[string.ascii_lowercase.index(c)] += 1
-            elif c in string.whitespace or c in string.punctuation:
-                vector[-3] += 1
-            elif c in string.digits:
-                vector[-2] += 1
-            else:
-                vector[-1] += 1
-        return vector
+        return self.get_many([text])[0].tolist()
+
+    def get_many(self, texts):
+        """Return matrix of embeddings, one row per text."""
+        chars = [get_char_buckets(i) for i in texts]
+        lengths = [len(i) for i in chars]
+        # Every count lands in one flat array, row of text is its offset
+        rows = np.repeat(np.arange(len(chars)) * self.dimensions, lengths)
+        found = [rows + np.frombuffer(b"".join(chars), dtype=np.uint8)]
+        if self.ngrams and chars:
+            found.extend(self.get_ngrams(texts, rows, lengths))
+        counts = np.bincount(
+            np.concatenate(found), minlength=len(chars) * self.dimensions
+        )
+        return counts.reshape(len(chars), self.dimensions)
+
+    def get_ngrams(self, texts, rows, lengths):
+        """Yield positions of n-gram counts in flat array of embeddings."""
+        codes = np.concatenate([get_codepoints(i) for i in texts]).astype(np.uint64)
+        ends = np.repeat(np.cumsum(lengths), lengths)
+        for size in self.ngrams:
+            # N-grams crossing from one text into another are dropped
+            starts = np.flatnonzero(np.arange(len(codes)) + size <= ends)
+            hashes = np.full(len(starts), size, dtype=np.uint64)
+            for i in range(size):
+                hashes = hashes * NGRAM_PRIME + codes[starts + i]
+            buckets = (hashes % np.uint64(self.buckets)).astype(np.intp)
+            yield rows[starts] + CHAR_DIMENSIONS + buckets
+
+
+WORD = re.compile(r"\w+")
+
+
+def get_term_counts(texts, dimensions, ngrams):
+    """Return matrix of hashed word and character n-gram counts, one row per text.
+
+    Function is module level, so that process pool workers can run it.
+    """
+    counts = np.zeros((len(texts), dimensions), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = WORD.findall(text.lower())
+        found = [np.array([zlib.crc32(i.encode()) for i in words], dtype=np.uint64)]
+        # Words are padded with spaces, n-grams tell word starts and ends apart
+        codes = get_codepoints(f" {' '.join(words)} ").astype(np.uint64)
+        for size in ngrams:
+            hashes = np.full(max(len(codes) - size + 1, 0), size, dtype=np.uint64)
+            for i in range(size):
+                hashes = hashes * NGRAM_PRIME + codes[i:][: len(hashes)]
+            found.append(hashes)
+        buckets = np.concatenate(found) % np.uint64(dimensions)
+        counts[row] = np.bincount(buckets.astype(np.intp), minlength=dimensions)
+    return counts
+
+
+class TfidfEmbedder(AbstractExternalEmbedder):
+    """Local embedder of hashed TF-IDF weights of words and character n-grams.
+
+    Works offline and needs only numpy. Inverse document frequencies are fitted on
+    indexed aliases into copy of embedder kept by index, so words common to many
+    aliases weigh less than distinctive ones. Batches of at least `min_batch` texts
+    are split among `workers` processes.
+    """
+
+    # Typos and words around alias weigh a lot in short texts
+    threshold = 0.5
+
+    def __init__(self, dimensions=4096, ngrams=(3, 4), workers=0, min_batch=64):
+        """Initialise embedder.
+
+        :param dimensions: number of hash buckets terms are counted in
+        :param ngrams: sizes of character n-grams counted besides words
+        :param workers: number of processes embedding large batches, 0 for none
+        :param min_batch: smallest batch split among processes
+        """
+        self.dimensions = dimensions
+        self.ngrams = tuple(ngrams)
+        self.workers = workers
+        self.min_batch = min_batch
+        self.idf = np.ones(dimensions, dtype=np.float32)
+        self.pool = None
+
+    @property
+    def name(self):
+        """Return name that identifies embeddings of configuration."""
+        sizes = ",".join(map(str, self.ngrams))
+        return f"{type(self).__name__}:{self.dimensions}:ngrams={sizes}"
+
+    def fit(self, texts):
+        """Return copy of embedder with inverse document frequencies of texts.
+
+        Copy shares worker processes of embedder.
+        """
+        frequencies = (self.count(texts) > 0).sum(axis=0)
+        idf = np.log((1 + len(texts)) / (1 + frequencies)) + 1
+        # Terms not found in any text do not tell indexed texts apart, they are
+        # ignored in queries as well, e.g. filler words around alias
+        idf[frequencies == 0] = 0
+        fitted = copy.copy(self)
+        fitted.idf = idf.astype(np.float32)
+        return fitted
+
+    def warmup(self):
+        """Start worker processes and embed once to load everything needed."""
+        if self.workers and self.pool is None:
+            context = multiprocessing.get_context("spawn")
+            self.pool = concurrent.futures.ProcessPoolExecutor(
+                self.workers, mp_context=context
+            )
+            list(self.pool.map(self.task, [[""]] * self.workers))
+        self.get("warmup")
+
+    @property
+    def task(self):
+        """Return picklable function counting terms of texts."""
+        return functools.partial(
+            get_term_counts, dimensions=self.dimensions, ngrams=self.ngrams
+        )
+
+    def close(self):
+        """Stop worker processes."""
+        if self.pool:
+            self.pool.shutdown()
+            self.pool = None
+
+    def count(self, texts):
+        """Return term counts of texts, in worker processes if batch is large."""
+        if self.pool is None or len(texts) < self.min_batch:
+            return get_term_counts(texts, self.dimensions, self.ngrams)
+        size = math.ceil(len(texts) / self.workers)
+        chunks = [texts[i:][:size] for i in range(0, len(texts), size)]
+        return np.concatenate(list(self.pool.map(self.task, chunks)))
+
+    def get(self, text):
+        """Get embedding of the text."""
+        return self.get_many([text])[0].tolist()
+
+    def get_many(self, texts):
+        """Return matrix of unit length embeddings, one row per text."""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dimensions), dtype=np.float32)
+        return normalise(np.log1p(self.count(texts)) * self.idf)
+
+
+def get_embedder(conf):
+    """Return embedder as per configuration.
+
+    `embedder` is an embedder instance, "char" (default) or "tfidf". Char embedder
+    optionally counts `char_ngrams` in `char_ngram_buckets`, TF-IDF embedder uses
+    `tfidf_dimensions` buckets and `embedder_workers` processes.
+    """
+    embedder = conf.get("embedder", "char")
+    if isinstance(embedder, AbstractExternalEmbedder):
+        return embedder
+    if embedder == "char":
+        return CharEmbedder(
+            conf.get("char_ngrams", ()), conf.get("char_ngram_buckets", 512)
+        )
+    if embedder == "tfidf":
+        return TfidfEmbedder(
+            conf.get("tfidf_dimensions", 4096), workers=conf.get("embedder_workers", 0)
+        )
+    raise RuntimeError(f"Unknown embedder '{embedder}'")
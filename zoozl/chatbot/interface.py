@@ -13,64 +13,93 @@
 >>> root.close() # Important to call this, to close any resources opened
 """
 
+import asyncio
 import base64
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import hmac
 import importlib
+import importlib.util
+import inspect
 import json
 import logging
+import re
+import sys
+import time
 from typing import Callable, Literal
-
-import membank
-import pydantic
+import warnings
 
 from zoozl import utils
 
-from . import api, embeddings
+from . import api, archive, embeddings, scheduler, storage
 
 log = logging.getLogger(__name__)
 
+WORD = re.compile(r"\w+")
+
+
+@functools.cache
+def get_operation_payload():
+    """Return schema for operation payload validation, built on first operation."""
+    import pydantic
 
-class OperationPayload(pydantic.BaseModel):
-    """Schema for operation payload validation."""
+    class OperationPayload(pydantic.BaseModel):
+        """Schema for operation payload validation."""
 
-    operation: Literal["list_messages", "auth"]
-    page: int = 1
-    page_size: int = 10
+        operation: Literal["list_messages", "auth", "reload"]
+        page: int = 1
+        page_size: int = 10
+        token: str = ""
+
+    return OperationPayload
 
 
 class Operations:
     """Container for operations handling."""
 
-    def __init__(self, callback: Callable, memory, conf):
-        """Add operation handler with callback and memory."""
+    def __init__(self, callback: Callable, storage, conf, root=None):
+        """Add operation handler with callback, storage and optional root."""
         if not callable(callback):
             raise TypeError("Operation callback must be callable.")
         self.callback = callback
-        self.memory = memory
+        self.storage = storage
         self.conf = conf
+        self.root = root
 
-    async def list_messages(self, payload: OperationPayload):
-        """Handle list_messages operation."""
-        items = self.memory.get("conversation")
-        records = []
-        for conversation in items:
-            messages = conversation.messages
-            for msg in messages:
-                records.append(
-                    {
-                        "date": msg.sent.isoformat(),
-                        "user": conversation.talker,
-                        "message": msg.text,
-                        "response": "n/a",
-                        "status": "completed",
-                    }
-                )
-        total_count = len(records)
+    async def reload(self, payload):
+        """Handle reload operation, allowed only with `admin_token`."""
+        token = self.conf.get("admin_token")
+        if not token or not hmac.compare_digest(token.encode(), payload.token.encode()):
+            self.callback({"operation": payload.operation, "error": "Not authorised"})
+            return
+        routes = await self.root.reload()
+        self.callback(
+            {
+                "operation": payload.operation,
+                "status": "reloaded",
+                "extensions": sorted(routes.extensions),
+            }
+        )
+
+    async def list_messages(self, payload):
+        """Handle list_messages operation with validated OperationPayload."""
         start = max(payload.page - 1, 0) * payload.page_size
-        end = start + payload.page_size
-        records.sort(key=lambda x: x["date"], reverse=True)
+        total_count, page = await self.storage.list_messages(start, payload.page_size)
+        records = [
+            {
+                "date": msg.sent.isoformat(),
+                "user": talker,
+                "message": msg.text,
+                "response": "n/a",
+                "status": "completed",
+            }
+            for talker, msg in page
+        ]
         response = {
             "operation": payload.operation,
-            "data": records[start:end],
+            "data": records,
             "page": payload.page,
             "page_size": payload.page_size,
             "total_count": total_count,
@@ -78,13 +107,292 @@ class Operations:
         self.callback(response)
 
 
+class TurnScheduler:
+    """Run turns of one talker in order while different talkers run in parallel.
+
+    Lock of talker exists only while talker has a turn running or waiting, thus memory
+    is bounded by number of talkers served at the moment.
+
+    >>> turns = TurnScheduler()
+    >>> async with turns.turn("talker"):
+    ...     await bot.ask(message)
+    """
+
+    def __init__(self):
+        """Initialise without any talkers."""
+        self._locks = {}
+
+    def __len__(self):
+        """Return number of talkers with turns running or waiting."""
+        return len(self._locks)
+
+    def waiting(self, talker):
+        """Return number of turns of talker running or waiting."""
+        if talker in self._locks:
+            return self._locks[talker][1]
+        return 0
+
+    @contextlib.asynccontextmanager
+    async def turn(self, talker):
+        """Wait until all previous turns of talker are done."""
+        talker = str(talker)
+        entry = self._locks.get(talker)
+        if entry is None:
+            entry = self._locks[talker] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[talker]
+
+
+class SessionRegistry:
+    """Recently active Chat objects kept alive between events of talkers.
+
+    Sessions are keyed by talker, least recently used sessions are evicted
+    when there are more than `max_sessions` of them or when they hold more than
+    `max_messages` messages in total, sessions unused for `ttl` seconds expire.
+
+    >>> sessions = SessionRegistry(ttl=600)
+    >>> bot = sessions.get_or_create(talker, lambda: Chat(...))
+    """
+
+    def __init__(self, ttl=600, max_sessions=1024, max_messages=100000):
+        """Initialise empty registry with expiry and size limits."""
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.messages = 0
+        self._sessions = collections.OrderedDict()
+
+    def __len__(self):
+        """Return number of sessions kept."""
+        return len(self._sessions)
+
+    def __contains__(self, key):
+        """Check if unexpired session is kept under key."""
+        return self.get(key, touch=False) is not None
+
+    def get(self, key, touch=True):
+        """Return Chat kept under key or None."""
+        entry = self._sessions.get(key)
+        if entry is None:
+            return None
+        chat, used, _ = entry
+        if time.monotonic() - used > self.ttl:
+            self.pop(key)
+            return None
+        if touch:
+            self.put(key, chat)
+        return chat
+
+    def put(self, key, chat):
+        """Keep Chat under key as most recently used session."""
+        self.pop(key)
+        size = len(chat.conversation.messages)
+        self._sessions[key] = (chat, time.monotonic(), size)
+        self.messages += size
+        self.evict()
+
+    def pop(self, key):
+        """Forget session under key, return its Chat or None."""
+        entry = self._sessions.pop(key, None)
+        if entry is None:
+            return None
+        self.messages -= entry[2]
+        return entry[0]
+
+    def get_or_create(self, key, factory):
+        """Return Chat kept under key or keep new one created by factory."""
+        chat = self.get(key)
+        if chat is None:
+            chat = factory()
+            self.put(key, chat)
+        return chat
+
+    def evict(self):
+        """Evict expired and least recently used sessions over limits."""
+        now = time.monotonic()
+        while self._sessions:
+            key, (_, used, _) = next(iter(self._sessions.items()))
+            if (
+                now - used > self.ttl
+                or len(self._sessions) > self.max_sessions
+                or self.messages > self.max_messages
+            ):
+                self.pop(key)
+            else:
+                break
+
+
+class LazyInterface(api.Interface):
+    """Stand-in for interfaces of extension that is imported on first use.
+
+    Aliases are known from manifest, thus extension is imported and loaded only when
+    talker turns to any of them.
+    """
+
+    def __init__(self, extension, aliases):
+        """Initialise with extension module name and aliases it provides."""
+        self.extension = extension
+        self.aliases = set(aliases)
+        self.lock = asyncio.Lock()
+
+    async def consume(self, package):
+        """Refuse to consume, extension must be activated by root first."""
+        raise RuntimeError(f"Extension '{self.extension}' is not activated.")
+
+
+@functools.cache
+def takes_package(function):
+    """Return True if is_complete function takes package, older plugins do not."""
+    return len(inspect.signature(function).parameters) > 1
+
+
+def import_aside(name):
+    """Return new module of imported module name without touching imported one.
+
+    New module is in sys.modules only while it is executed, e.g. for imports of its
+    own, afterwards imported module is put back, so that it keeps working with
+    interfaces of current routing table if reload fails.
+    """
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    module = importlib.util.module_from_spec(spec)
+    previous = sys.modules[name]
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.modules[name] = previous
+    return module
+
+
+def install_module(name, module):
+    """Put module into sys.modules and onto its parent package."""
+    sys.modules[name] = module
+    parent, _, child = name.rpartition(".")
+    if parent in sys.modules:
+        setattr(sys.modules[parent], child, module)
+
+
+def normalise(text):
+    """Return lowercase words of text without punctuation."""
+    return " ".join(WORD.findall(text.lower()))
+
+
+class Routes:
+    """Routing table of aliases to interfaces of extensions.
+
+    Table is built aside and swapped on root at once, thus reload never leaves root
+    with partially loaded extensions.
+    """
+
+    def __init__(self):
+        """Initialise empty table."""
+        self.commands = {}
+        self.extensions = {}
+        # Modules imported aside on reload, installed once table is swapped in
+        self.modules = {}
+        self.report = {}
+        self.intents = embeddings.BruteForceIndex([], [])
+        self.cancels = frozenset()
+
+    def import_extension(self, name, reload=False):
+        """Import extension module and return instances of its interfaces.
+
+        :param reload: re-import module if it is already imported
+        """
+        started = time.perf_counter()
+        if reload and name in sys.modules:
+            extension = self.modules[name] = import_aside(name)
+        else:
+            extension = importlib.import_module(name)
+        interfaces = [ext() for ext in utils.load_from_module(extension, api.Interface)]
+        self.extensions[name] = interfaces
+        self.report[name] = {"import": time.perf_counter() - started, "load": 0}
+        return interfaces
+
+    def register(self, obj, replace=None):
+        """Register aliases of interface, allowing to replace given interface only."""
+        for cmd in obj.aliases:
+            if cmd in self.commands and self.commands[cmd] is not replace:
+                raise RuntimeError(f"Clash of interfaces! '{cmd}' already loaded")
+            self.commands[cmd] = obj
+
+    def entries(self):
+        """Return (alias, text) pairs to index, aliases and example phrasings."""
+        entries = [(cmd, cmd) for cmd in self.commands]
+        for cmd, obj in self.commands.items():
+            # Examples are routed to first of aliases of interface
+            if obj.examples and cmd == min(obj.aliases):
+                entries.extend((cmd, i) for i in sorted(obj.examples))
+        return entries
+
+    def index(self, lookup, conf):
+        """Build intent index of aliases with lookup as per configuration."""
+        self.intents = lookup.build_index(
+            self.entries(),
+            path=conf.get("intent_index_path"),
+            ivf_threshold=conf.get("intent_ivf_threshold", 1024),
+        )
+        self.cancels = self.get_cancels()
+
+    def get_cancels(self):
+        """Return normalised aliases and examples routed to cancel interface."""
+        obj = self.commands.get("cancel")
+        if obj is None or obj.aliases & {"greet", "help"}:
+            # Interface that handles everything cancels with its cancel alias only
+            return frozenset({"cancel"})
+        entries = self.entries()
+        return frozenset(
+            normalise(i) for cmd, i in entries if self.commands[cmd] is obj
+        )
+
+    def is_cancel(self, subject, package):
+        """Return True if last message of package cancels subject.
+
+        Message matches phrases of cancel interface exactly, apart from case and
+        punctuation, or cancel predicate of cancel or subject interface. Message is
+        not embedded, thus turns that go on with subject cost no lookup.
+        """
+        if normalise(package.last_message_text) in self.cancels:
+            return True
+        for cmd in ("cancel", subject):
+            obj = self.commands.get(cmd)
+            if obj is not None and obj.is_cancelled(package):
+                return True
+        return False
+
+
+class LoadingRoot:
+    """Interface root as seen by load hooks of routes built from new configuration.
+
+    Hooks read new configuration, while root keeps serving turns with its own until
+    routes are swapped. Other attributes are those of root.
+    """
+
+    def __init__(self, root, conf):
+        """Initialise view of root with configuration."""
+        self._root = root
+        self.conf = conf
+
+    def __getattr__(self, name):
+        """Return attribute of root."""
+        return getattr(self._root, name)
+
+
 class InterfaceRoot:
     """Interface root for chatbot to use.
 
     Holds all possible commands and options chatbot can do.
 
     Must be always initialised before use:
-    >>> root = InterfaceRoot(memory)
+    >>> root = InterfaceRoot(conf)
     >>> root.load()
     >>> root.close()
 
@@ -94,16 +402,18 @@ class InterfaceRoot:
     def __init__(self, conf=None):
         """Configure with memory and configuration.
 
-        :param conf: dictionary that holds all configuration for all Interfaces. If
-            memory_path is not set, Root instance will hold memories of ongoing chats
-            with talker only in the instance itself, closing instance will render all
-            previous conversations forgotten. In such cases Root instance per talker
-            should be kept alive as long as possible. if path is set, it must lead to
-            valid path for Root instance to be able to store it's persistent memory,
-            then history of talker conversations will be preserved upon instance
-            destructions.
+        :param conf: dictionary that holds all configuration for all Interfaces.
+            Conversations are kept in storage selected by `storage` (see
+            `storage.get_storage`). If memory_path (or storage_path for sqlite) is not
+            set, Root instance will hold memories of ongoing chats with talker only in
+            the instance itself, closing instance will render all previous
+            conversations forgotten. In such cases Root instance per talker should be
+            kept alive as long as possible. if path is set, it must lead to valid path
+            for Root instance to be able to store it's persistent memory, then history
+            of talker conversations will be preserved upon instance destructions.
         """
-        self._commands = {}
+        self.routes = Routes()
+        self._reload_lock = asyncio.Lock()
         self.conf = (
             conf
             if conf
@@ -114,44 +424,268 @@ class InterfaceRoot:
         self.operation_callback = self.conf.get("operation_callback", lambda x: None)
         self.lookup = None
         self.loaded = False
-        self.memory = None
+        self.storage = None
         self.operations = None
+        self.archiver = None
+        self.turns = TurnScheduler()
+        self.scheduler = scheduler.RequestScheduler.from_conf(self.conf)
+        self.sessions = SessionRegistry(
+            ttl=self.conf.get("session_ttl", 600),
+            max_sessions=self.conf.get("max_sessions", 1024),
+            max_messages=self.conf.get("max_session_messages", 100000),
+        )
+
+    @property
+    def memory(self):
+        """Return storage of conversations, deprecated alias of `storage`."""
+        warnings.warn(
+            "InterfaceRoot.memory is deprecated, use InterfaceRoot.storage that is "
+            "async conversation storage instead of membank memory",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        return self.storage
 
     def load(self):
-        """Load interface map with available plugins and embedder."""
-        self.memory = membank.LoadMemory(self.conf.get("memory_path", {}))
-        if "embedder" in self.conf:
-            self.lookup = embeddings.Lookup(self.memory, self.conf["embedder"])
-        else:
-            self.lookup = embeddings.Lookup(self.memory, embeddings.CharEmbedder())
-        self.operations = Operations(self.operation_callback, self.memory, self.conf)
-        if "extensions" in self.conf:
-            for interface in self.conf["extensions"]:
-                extension = importlib.import_module(interface)
-                for ext in utils.load_from_module(extension, api.Interface):
-                    obj = ext()
-                    obj.load(self)
-                    for cmd in obj.aliases:
-                        if cmd in self._commands:
-                            raise RuntimeError(
-                                f"Clash of interfaces! '{cmd}' already loaded"
-                            )
-                        self._commands[cmd] = obj
-        # Load default command handlers, if not loaded by plugins
-        if "cancel" not in self._commands:
-            log.warning("No cancel command found in plugins.")
-            self._commands["cancel"] = api.Interface()
-        if "greet" not in self._commands:
-            log.warning("No greet command found in plugins.")
-            self._commands["greet"] = api.Interface()
-        if "help" not in self._commands:
-            log.warning("No help command found in plugins.")
-            self._commands["help"] = api.Interface()
+        """Load interface map with available plugins and embedder.
+
+        Modules in `extensions` are imported and loaded right away, with
+        `parallel_load` enabled load hooks of their interfaces run concurrently in up
+        to `load_workers` threads. Modules in `lazy_extensions` table, mapped to list
+        of aliases they provide, are imported only when any of aliases is used first.
+        Embedder is warmed up before aliases are indexed, by remote embedder in
+        thread that load waits on, so root may be loaded within event loop.
+
+        Load hooks run in thread that loads, on reload and lazy activation that is
+        the event loop thread, unless `parallel_load` is enabled.
+        """
+        started = time.perf_counter()
+        self.storage = storage.get_storage(self.conf)
+        embedder = embeddings.get_embedder(self.conf)
+        if embedder.scheduler is None:
+            embedder.scheduler = self.scheduler
+        self.lookup = embeddings.Lookup(self.storage, embedder)
+        warmup = time.perf_counter()
+        self.lookup.load()
+        log.info(
+            "Embedder %s warmed up in %.3fs",
+            self.lookup.embedder.name,
+            time.perf_counter() - warmup,
+        )
+        self.operations = Operations(
+            self.operation_callback, self.storage, self.conf, self
+        )
+        if self.conf.get("archive_path"):
+            self.archiver = archive.Archiver(
+                self.conf["archive_path"],
+                hot_messages=self.conf.get("history_hot_messages", 100),
+                batch_size=self.conf.get("archive_batch_size", 100),
+            )
+        self.routes = self._build_routes()
         self.loaded = True
+        self.log_load_report(time.perf_counter() - started)
+
+    async def reload(self, conf=None):
+        """Re-import extensions and swap routing table without dropping chats.
+
+        New routing table is built aside from optionally new configuration and is
+        swapped at once, turns in flight finish with interfaces they started with.
+        Chats keep their conversations and route next messages with new table.
+        Storage, archiver and listeners are kept as they are, changing them requires
+        restart.
+        """
+        async with self._reload_lock:
+            started = time.perf_counter()
+            conf = self.conf if conf is None else conf
+            routes, evicted = await self._rebuild_routes(conf)
+            # Configuration and imports change only once new table is complete
+            self.conf = conf
+            for name, module in routes.modules.items():
+                install_module(name, module)
+            for name in evicted:
+                # Extension used before reload is imported again on first use
+                sys.modules.pop(name, None)
+            self.routes = routes
+            self.operations.conf = conf
+            self.log_load_report(time.perf_counter() - started)
+            return routes
+
+    def _build_routes(self):
+        """Return routing table of configured extensions."""
+        routes, interfaces, _ = self._import_routes(self.conf)
+        self._load_interfaces(routes, interfaces, self.conf)
+        if self.lookup.embedder.remote:
+            # Requests are refused on event loop thread, server loads within loop
+            with concurrent.futures.ThreadPoolExecutor(1) as pool:
+                pool.submit(self._index_routes, routes, self.conf).result()
+        else:
+            self._index_routes(routes, self.conf)
+        return routes
+
+    async def _rebuild_routes(self, conf):
+        """Return routing table of conf and imported lazy extensions to evict.
+
+        Extensions are re-imported and aliases indexed in threads.
+        """
+        routes, interfaces, evicted = await asyncio.to_thread(
+            self._import_routes, conf, True
+        )
+        await self._run_load_hooks(routes, interfaces, conf)
+        await asyncio.to_thread(self._index_routes, routes, conf)
+        return routes, evicted
+
+    def _import_routes(self, conf, reload=False):
+        """Return routing table of conf, its interfaces and imported lazy extensions.
+
+        :param reload: re-import extension modules that are already imported
+        """
+        routes = Routes()
+        interfaces = []
+        for name in conf.get("extensions", []):
+            interfaces.extend((name, i) for i in routes.import_extension(name, reload))
+        for _, obj in interfaces:
+            routes.register(obj)
+        imported = []
+        for name, aliases in conf.get("lazy_extensions", {}).items():
+            if name in sys.modules:
+                imported.append(name)
+            routes.register(LazyInterface(name, aliases))
+        return routes, interfaces, imported
+
+    def _index_routes(self, routes, conf):
+        """Add default command handlers missing in plugins and index aliases."""
+        for cmd in ("cancel", "greet", "help"):
+            if cmd not in routes.commands:
+                log.warning("No %s command found in plugins.", cmd)
+                routes.commands[cmd] = api.Interface()
+        routes.index(self.lookup, conf)
+
+    async def _run_load_hooks(self, routes, interfaces, conf):
+        """Call load hooks within event loop thread, unless loaded in parallel.
+
+        Hooks may then use running loop, e.g. to create tasks.
+        """
+        if conf.get("parallel_load") and len(interfaces) > 1:
+            await asyncio.to_thread(self._load_interfaces, routes, interfaces, conf)
+        else:
+            self._load_interfaces(routes, interfaces, conf)
+
+    def _load_interfaces(self, routes, interfaces, conf):
+        """Call load hooks of (extension, interface) pairs, concurrently if enabled.
+
+        Hooks see root with conf, which is not yet root's own while reloading.
+        """
+        root = self if conf is self.conf else LoadingRoot(self, conf)
+        load = functools.partial(self._load_interface, root)
+        if conf.get("parallel_load") and len(interfaces) > 1:
+            workers = conf.get("load_workers", 8)
+            with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+                # Any exception of load hook is raised here as if loaded in order
+                elapsed = list(pool.map(load, interfaces))
+        else:
+            elapsed = [load(i) for i in interfaces]
+        for (name, _), seconds in zip(interfaces, elapsed):
+            routes.report[name]["load"] += seconds
+
+    @staticmethod
+    def _load_interface(root, interface):
+        """Call load hook of (extension, interface) pair, return seconds it took."""
+        started = time.perf_counter()
+        interface[1].load(root)
+        return time.perf_counter() - started
+
+    @property
+    def load_report(self):
+        """Return import and load seconds of every loaded extension."""
+        return self.routes.report
+
+    def log_load_report(self, total):
+        """Log time spent loading extensions, slowest first."""
+        log.info("Interface root loaded in %.1f ms", total * 1000)
+        report = sorted(
+            self.load_report.items(), key=lambda x: sum(x[1].values()), reverse=True
+        )
+        for name, times in report:
+            log.info(
+                "Extension %s: import %.1f ms, load %.1f ms",
+                name,
+                times["import"] * 1000,
+                times["load"] * 1000,
+            )
+
+    def manifest(self):
+        """Return aliases of every loaded extension, usable as `lazy_extensions`."""
+        return {
+            name: sorted(cmd for obj in interfaces for cmd in obj.aliases)
+            for name, interfaces in self.routes.extensions.items()
+        }
+
+    async def activate(self, lazy):
+        """Import and load extension of lazy interface, once."""
+        routes = self.routes
+        async with lazy.lock:
+            if lazy.extension in routes.extensions:
+                return
+            started = time.perf_counter()
+            interfaces = await asyncio.to_thread(
+                routes.import_extension, lazy.extension
+            )
+            await self._run_load_hooks(
+                routes, [(lazy.extension, i) for i in interfaces], self.conf
+            )
+            for obj in interfaces:
+                for cmd in obj.aliases - lazy.aliases:
+                    log.warning(
+                        "Alias '%s' of %s is missing in manifest", cmd, lazy.extension
+                    )
+                routes.register(obj, replace=lazy)
+            for cmd in lazy.aliases:
+                if routes.commands[cmd] is lazy:
+                    log.warning("Alias '%s' not found in %s", cmd, lazy.extension)
+                    routes.commands[cmd] = api.Interface()
+            if any(obj.aliases - lazy.aliases or obj.examples for obj in interfaces):
+                await asyncio.to_thread(routes.index, self.lookup, self.conf)
+            log.info(
+                "Activated extension %s in %.1f ms",
+                lazy.extension,
+                (time.perf_counter() - started) * 1000,
+            )
 
     def close(self):
-        """When membank supports close this should close it."""
-        # self._m.close()
+        """Flush archive buffers, close storage and embedder."""
+        if self.archiver:
+            self.archiver.flush()
+        if self.lookup:
+            self.lookup.clear()
+        if self.storage:
+            self.storage.close()
+            self.storage = None
+
+    def turn(self, talker):
+        """Return async context to hold while loading, asking and saving talker.
+
+        Concurrent events of the same talker must be handled within turn, otherwise
+        they load the same conversation and the last one saved wins.
+        """
+        return self.turns.turn(talker)
+
+    async def session(self, channel, talker, callback, streamer=None):
+        """Return loaded Chat of talker on channel, reusing recently active one.
+
+        Storage keeps one ongoing conversation per talker, thus talker shares one
+        Chat across all channels, otherwise chats would overwrite each other's
+        conversation. Callback and optional streamer are set for current event,
+        thus should be called within turn of talker.
+        """
+        key = str(talker)
+        bot = self.sessions.get(key)
+        if bot is None:
+            bot = Chat(talker, callback, self)
+            await bot.load()
+            self.sessions.put(key, bot)
+        bot.callback = callback
+        bot.streamer = streamer
+        return bot
 
     async def consume(self, package, subject=None):
         """Route the package object to appropriate chat interface.
@@ -160,16 +694,31 @@ class InterfaceRoot:
         :params subject: optional subject, otherwise taken from package
         """
         subject = package.conversation.subject if subject is None else subject
-        if subject not in self._commands:
+        if subject not in self.routes.commands:
             raise RuntimeError(f"There is no subject '{subject}' available.")
-        await self._commands[subject].consume(package)
+        if isinstance(self.routes.commands[subject], LazyInterface):
+            await self.activate(self.routes.commands[subject])
+        await self.routes.commands[subject].consume(package)
+
+    def has_subject(self, cmd):
+        """Check if subject is available, it might disappear with reload."""
+        return cmd in self.routes.commands
+
+    def is_subject_complete(self, cmd, package):
+        """Check if subject is complete, subject gone with reload is complete."""
+        if cmd not in self.routes.commands:
+            return True
+        obj = self.routes.commands[cmd]
+        if takes_package(type(obj).is_complete):
+            return obj.is_complete(package)
+        return obj.is_complete()
 
-    def is_subject_complete(self, cmd):
-        """Check if subject is complete."""
-        return self._commands[cmd].is_complete()
+    def is_cancel(self, package):
+        """Return True if last message of package cancels ongoing subject."""
+        return self.routes.is_cancel(package.conversation.subject, package)
 
     async def cancel(self, package):
-        """Cancel the subject if needed."""
+        """Let cancel interface answer message that cancels subject."""
         await self.consume(package, "cancel")
 
     async def greet(self, package):
@@ -181,10 +730,30 @@ class InterfaceRoot:
         return self.lookup.get(text)
 
     def get_interface_embeddings(self):
-        """Return list of cmds and their embedding values."""
+        """Return list of cmds and their normalised embedding values."""
+        if not self.loaded:
+            raise RuntimeError("Interface map not loaded.")
+        intents = self.routes.intents
+        return list(zip(intents.labels, intents.vectors))
+
+    @property
+    def subject_threshold(self):
+        """Return similarity above which message is routed to alias."""
+        return self.conf.get("subject_threshold", self.lookup.embedder.threshold)
+
+    def find_subjects(self, text, k=1):
+        """Return up to k (cmd, score) tuples most similar to text, best first."""
         if not self.loaded:
             raise RuntimeError("Interface map not loaded.")
-        return [(cmd, self.get_embedding(cmd)) for cmd in self._commands]
+        # Routes are swapped at once, query is weighted as index it searches
+        intents = self.routes.intents
+        return intents.search(self.lookup.get(text, intents), k)
+
+    async def search_subjects(self, text, k=1):
+        """Return find_subjects of text, embedded in thread by remote embedder."""
+        if self.lookup.embedder.remote:
+            return await asyncio.to_thread(self.find_subjects, text, k)
+        return self.find_subjects(text, k)
 
     async def handle_operation(self, payload, callback: Callable):
         """Validate operation payload."""
@@ -192,7 +761,7 @@ class InterfaceRoot:
             raise TypeError("Operation payload must be a dict.")
         if not callable(callback):
             raise TypeError("Operation callback must be callable.")
-        data = OperationPayload.parse_obj(payload)
+        data = get_operation_payload().parse_obj(payload)
         self.operations.callback = callback
         handler = getattr(self.operations, data.operation, None)
         if not callable(handler):
@@ -228,52 +797,118 @@ def get_new_package(talker):
 class Chat:
     """Interface for communication and routing with talker."""
 
-    def __init__(self, talker, callback, interface_root):
+    def __init__(self, talker, callback, interface_root, streamer=None):
         """Initialise comm interface with talker, one instance per talker.
 
         Talker must be something unique. This will serve as identification across
         several talkers that might turn to bot for chat.
 
-        Callback must be a callable that accepts Message as only argument
+        Callback must be a callable that accepts Message as only argument, it may
+        be async function, then plugins that await `package.send` wait until
+        transport delivers message
+
+        Streamer is optional callable that returns api.TextStream of transport that
+        shows replies while they are generated, with streamer None replies streamed
+        by plugins are sent with callback once whole.
 
         Interface_root is object that allows routing of messages to correct interfaces
         for the talker.
+
+        Conversation is loaded from storage on first greet or ask, or with load.
         """
         if not interface_root.loaded:
             raise RuntimeError("InterfaceRoot must be in loaded state!")
         self._root = interface_root
         self._callback = callback
-        self._set_package(str(talker))
+        self.streamer = streamer
+        self._talker = str(talker)
+        self._package = None
+        self._deliveries = []
+        self._delivery = None
+        self._cleaning = []
+        self._loop = None
+
+    async def load(self):
+        """Load ongoing conversation of talker from storage, if not loaded yet."""
+        if self._package is None:
+            await self._set_package()
 
-    def _set_package(self, talker):
+    async def _set_package(self):
         """Set package on the object."""
-        conversation = self._root.memory.get.conversation(talker=talker, ongoing=True)
+        conversation = await self._root.storage.get_ongoing(self._talker)
         if not conversation:
-            conversation = api.Conversation(talker=talker)
-        self._package = api.Package(conversation, self._call)
+            conversation = api.Conversation(talker=self._talker)
+        self._package = api.Package(
+            conversation, self._call, self._stream, sender=self._send
+        )
 
-    def _save_package(self):
-        """Save package to memory."""
-        self._root.memory.put(self._package.conversation)
+    async def _save_package(self):
+        """Save package to storage."""
+        if self._root.archiver and self._root.archiver.compact(
+            self._package.conversation
+        ):
+            # Trimmed messages are safe in segment files before they leave storage
+            await asyncio.to_thread(self._root.archiver.flush)
+        await self._root.storage.put(self._package.conversation)
+        self._package.changes.clear()
 
     async def greet(self):
         """Send first greeting message."""
+        self._loop = asyncio.get_running_loop()
+        await self._settle()
+        await self.load()
         await self._root.greet(self._package)
+        if self._package.changes:
+            # Greeting is saved only if it changed any state
+            await self._save_package()
+        await self.flush()
+        await self._settle()
 
     async def ask(self, message):
-        """Make conversation by receiving text and sending message back to callback."""
+        """Make conversation by receiving text and sending message back to callback.
+
+        Returns once messages of turn are delivered, slow or failed delivery of
+        async callback holds back or fails the turn.
+        """
+        self._loop = asyncio.get_running_loop()
+        await self._settle()
+        await self.load()
+        await self._ask(message)
+        await self.flush()
+        await self._settle()
+
+    async def _ask(self, message):
+        """Route message to subject."""
         self.ongoing = True
+        if self.subject and not self._root.has_subject(self.subject):
+            # Subject is gone with reload, message is routed anew
+            self.set_subject("")
         if self.subject:
             await self.do_subject(message)
         else:
-            if not self.get_subject(message):
+            if not await self.get_subject(message):
                 self.set_subject("help")
             await self.do_subject(message)
 
     @property
     def talker(self):
         """Return talker."""
-        return self._package.conversion.talker
+        return self._talker
+
+    @property
+    def conversation(self):
+        """Return ongoing conversation, Chat must be loaded."""
+        return self._package.conversation
+
+    @property
+    def callback(self):
+        """Return callable that receives bot messages."""
+        return self._callback
+
+    @callback.setter
+    def callback(self, value):
+        """Set callable that receives bot messages, e.g. on reused session."""
+        self._callback = value
 
     @property
     def ongoing(self):
@@ -282,58 +917,135 @@ class Chat:
 
     @ongoing.setter
     def ongoing(self, value):
-        """Set talk ongoing value."""
+        """Set talk ongoing value, it is saved at the end of turn."""
         self._package.conversation.ongoing = value
-        self._save_package()
 
     @property
     def subject(self):
         """Return subject if present."""
         return self._package.conversation.subject
 
-    def get_subject(self, message):
+    async def get_subject(self, message):
         """Try to understand subject from message.
 
         if understood sets the subject and returns it otherwise returns None.
         """
-        x = self._root.get_embedding(message.text)
-        for cmd, e in self._root.get_interface_embeddings():
-            eq = embeddings.get_cosine_similarity(x, e)
-            if eq > 0.8:
+        threshold = self._root.subject_threshold
+        for cmd, score in await self._root.search_subjects(message.text):
+            if score > threshold:
                 self.set_subject(cmd)
                 return cmd
         return None
 
     def set_subject(self, cmd):
-        """Set subject as per cmd."""
+        """Set subject as per cmd, it is saved at the end of turn."""
         self._package.conversation.subject = cmd
-        self._save_package()
 
     def clear_subject(self):
-        """Reset conversation to new start."""
-        self._clean()
+        """Reset conversation to new start, return task that saves ended conversation.
+
+        Task should be awaited. It was plain method before conversations were saved
+        through async storage, therefore calls that do not await it are completed
+        before next turn of chat starts.
+        """
+        task = asyncio.ensure_future(self._clean())
+        self._cleaning.append(task)
+        return task
+
+    async def _settle(self):
+        """Wait on conversation resets that callers did not await."""
+        while self._cleaning:
+            await self._cleaning.pop(0)
 
     async def do_subject(self, message):
-        """Start or continue on the subject."""
+        """Start or continue on the subject, save conversation once per turn."""
         self._package.conversation.messages.append(message)
-        if not await self._root.cancel(self._package):
-            await self._root.consume(self._package)
-            self._save_package()
-        if self.subject and self._root.is_subject_complete(self.subject):
-            self.clear_subject()
+        if self._root.is_cancel(self._package):
+            # Cancel interface answers and conversation ends, whatever the subject
+            await self._root.cancel(self._package)
+            await self._clean()
+            return
+        await self._root.consume(self._package)
+        await self._save_package()
+        if self.subject and self._root.is_subject_complete(self.subject, self._package):
+            await self._clean()
 
-    def _call(self, message):
-        """Construct Message and route it to callback.
-
-        It must be either simple string text or Message object.
-        """
+    def _get_message(self, message):
+        """Return Message of bot from simple string text or Message object."""
         if not isinstance(message, api.Message):
             message = api.Message(message)
         message.author = self._root.conf.get("author", "")
-        self._callback(message)
+        return message
+
+    def _call(self, message):
+        """Construct Message and route it to callback without waiting on delivery.
+
+        It must be either simple string text or Message object. Delivery of async
+        callback is awaited at the end of turn, or before next awaited send.
+        Deliveries are chained, each one starts once previous one is done.
+        """
+        result = self._callback(self._get_message(message))
+        if inspect.isawaitable(result):
+            self._chain(result)
+
+    def _chain(self, result):
+        """Deliver awaitable or future result once previous delivery is done."""
+        delivery = self._deliver(self._delivery, result)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Called by plugin from another thread
+            future = asyncio.run_coroutine_threadsafe(delivery, self._loop)
+        else:
+            future = asyncio.ensure_future(delivery)
+        self._delivery = future
+        self._deliveries.append(future)
+
+    @staticmethod
+    async def _deliver(previous, result):
+        """Await result once previous delivery is done, failure of it is raised."""
+        if previous is not None:
+            if isinstance(previous, concurrent.futures.Future):
+                previous = asyncio.wrap_future(previous)
+            # Failed previous delivery is raised by flush through its own future
+            with contextlib.suppress(Exception):
+                await previous
+        if isinstance(result, concurrent.futures.Future):
+            result = asyncio.wrap_future(result)
+        await result
+
+    async def _send(self, message):
+        """Construct Message and wait until callback delivers it."""
+        await self.flush()
+        result = self._callback(self._get_message(message))
+        if inspect.isawaitable(result):
+            await result
+
+    async def flush(self):
+        """Wait on deliveries of messages sent without waiting, raise if any failed."""
+        while self._deliveries:
+            deliveries = [
+                (
+                    asyncio.wrap_future(i)
+                    if isinstance(i, concurrent.futures.Future)
+                    else i
+                )
+                for i in self._deliveries
+            ]
+            self._deliveries.clear()
+            await asyncio.gather(*deliveries)
+
+    def _stream(self):
+        """Return stream of transport or one that sends whole text with callback."""
+        if self.streamer is None:
+            return api.TextStream(self._call)
+        stream = self.streamer()
+        # Whole text is delivered in order with replies and awaited within turn
+        stream.on_finish = self._chain
+        return stream
 
-    def _clean(self):
+    async def _clean(self):
         """Clean all data in conversation to initial state."""
         self._package.conversation.ongoing = False
-        self._save_package()
-        self._set_package(self._package.conversation.talker)
+        await self._save_package()
+        await self._set_package()
@@ -0,0 +1,251 @@
+"""Scheduler of outbound requests to rate limited APIs, e.g. OpenAI.
+
+All requests share limits of one scheduler held by InterfaceRoot:
+
+    -> at most `max_concurrency` requests are in flight
+    -> requests and tokens per minute are limited with token buckets
+    -> waiting requests are admitted by priority, interactive turns first
+    -> rate limited and failed requests are retried with jittered backoff
+
+>>> root.scheduler.call(client.embeddings.create, input=text, tokens=len(text) // 4)
+>>> with priority(PRIORITY_BATCH):
+...     await bot.ask(message)
+"""
+
+import asyncio
+import collections
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Requests of talkers waiting on screen are served first, background work last
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BATCH = 2
+PRIORITY_BACKGROUND = 3
+
+current_priority = contextvars.ContextVar("priority", default=PRIORITY_NORMAL)
+
+
+@contextlib.contextmanager
+def priority(level):
+    """Schedule requests made within context, also from asyncio.to_thread, at level."""
+    token = current_priority.set(level)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def is_rate_limited(error):
+    """Return True if error tells that request was rate limited."""
+    return getattr(error, "status_code", None) == 429
+
+
+def is_retryable(error):
+    """Return True if request that failed with error is worth retrying."""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # HTTP clients raise their own connection errors and timeouts without status
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def get_retry_after(error):
+    """Return seconds server asked to wait before retry, None if not told."""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Bucket that refills limit of tokens per minute, full at start."""
+
+    def __init__(self, per_minute):
+        """Initialise bucket with limit per minute."""
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.available = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        """Add tokens refilled since last update."""
+        self.available = min(
+            self.capacity, self.available + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def get_wait(self, amount, now):
+        """Return seconds until amount of tokens is available."""
+        self.refill(now)
+        # Request larger than whole bucket waits for full bucket only
+        missing = min(amount, self.capacity) - self.available
+        return max(missing / self.rate, 0)
+
+    def take(self, amount):
+        """Take amount of tokens, bucket may go into debt with large request."""
+        self.available -= amount
+
+
+class RequestScheduler:
+    """Admit outbound requests by priority within concurrency and rate limits.
+
+    Thread safe, requests are made by calling threads. Coroutines use `run` that
+    makes request from thread, `call` refuses to wait for admission or retry on
+    event loop thread.
+    """
+
+    def __init__(
+        self,
+        max_concurrency=8,
+        requests_per_minute=None,
+        tokens_per_minute=None,
+        max_retries=5,
+        backoff=0.5,
+        max_backoff=30,
+    ):
+        """Initialise scheduler.
+
+        :param max_concurrency: number of requests in flight at once
+        :param requests_per_minute: optional limit of requests
+        :param tokens_per_minute: optional limit of tokens declared by requests
+        :param max_retries: number of retries of failed request
+        :param backoff: seconds of first retry delay, doubled on every retry
+        :param max_backoff: longest delay between retries
+        """
+        self.max_concurrency = max_concurrency
+        self.requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.condition = threading.Condition()
+        self.waiting = []
+        self.sequence = itertools.count()
+        self.in_flight = 0
+        self.paused_until = 0
+        self.counters = collections.Counter()
+
+    @classmethod
+    def from_conf(cls, conf):
+        """Return scheduler as per `openai_*` keys of configuration."""
+        return cls(
+            max_concurrency=conf.get("openai_max_concurrency", 8),
+            requests_per_minute=conf.get("openai_requests_per_minute"),
+            tokens_per_minute=conf.get("openai_tokens_per_minute"),
+            max_retries=conf.get("openai_max_retries", 5),
+        )
+
+    @property
+    def stats(self):
+        """Return counters of queued, in flight, throttled and other requests."""
+        with self.condition:
+            return dict(
+                self.counters, queued=len(self.waiting), in_flight=self.in_flight
+            )
+
+    def get_delay(self, ticket, tokens):
+        """Return 0 if ticket is admitted, seconds to wait or None to wait for turn."""
+        if self.waiting[0] != ticket or self.in_flight >= self.max_concurrency:
+            return None
+        now = time.monotonic()
+        delay = self.paused_until - now
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is not None:
+                delay = max(delay, bucket.get_wait(amount, now))
+        if delay > 0:
+            return delay
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is not None:
+                bucket.take(amount)
+        return 0
+
+    def acquire(self, level, tokens):
+        """Wait until request of priority level is admitted."""
+        with self.condition:
+            ticket = (level, next(self.sequence))
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while (delay := self.get_delay(ticket, tokens)) != 0:
+                    self.condition.wait(delay)
+            finally:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                # Next one in line might be admitted now
+                self.condition.notify_all()
+            self.in_flight += 1
+
+    def release(self):
+        """Free slot of request in flight."""
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def get_backoff(self, attempt, error):
+        """Return seconds to wait before retry attempt, with full jitter."""
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    def call(self, function, *args, priority=None, tokens=0, **kwargs):
+        """Make request with function once admitted, retry it if it fails.
+
+        :param priority: priority level, by default as set by `priority` context
+        :param tokens: estimated tokens request uses of tokens per minute limit
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError("Requests must be made outside event loop thread")
+        level = current_priority.get() if priority is None else priority
+        for attempt in itertools.count():
+            self.acquire(level, tokens)
+            try:
+                result = function(*args, **kwargs)
+            except Exception as error:
+                if attempt >= self.max_retries or not is_retryable(error):
+                    self.count("failed")
+                    raise
+                delay = self.get_backoff(attempt, error)
+                log.info("Request failed with %s, retrying in %.2fs", error, delay)
+                if is_rate_limited(error):
+                    self.count("throttled")
+                    # Everyone waits, otherwise queued requests hit limit as well
+                    with self.condition:
+                        self.paused_until = max(
+                            self.paused_until, time.monotonic() + delay
+                        )
+                    delay = 0
+                else:
+                    self.count("retried")
+            else:
+                self.count("completed")
+                return result
+            finally:
+                self.release()
+            time.sleep(delay)
+
+    def count(self, name):
+        """Increase counter of requests."""
+        with self.condition:
+            self.counters[name] += 1
+
+    async def run(self, function, *args, **kwargs):
+        """Make request with function from thread, arguments as for `call`."""
+        return await asyncio.to_thread(self.call, function, *args, **kwargs)
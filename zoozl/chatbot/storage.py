@@ -0,0 +1,589 @@
+"""Asynchronous storage of conversations.
+
+Chat loads and saves conversations through a storage backend, every backend
+implements `AbstractStorage`:
+
+    -> MembankStorage stores conversations with membank in a dedicated thread
+    -> SQLiteStorage stores conversations in SQLite WAL database with group commits
+    -> MemoryStorage keeps conversations in process memory, meant for tests
+
+Conversations stored in membank are imported into another storage with `migrate`:
+
+>>> await migrate(MembankStorage("sqlite://old.db"), SQLiteStorage("zoozl.db"))
+
+>>> storage = get_storage({"storage": "sqlite", "storage_path": "zoozl.db"})
+>>> conversation = await storage.get_ongoing("talker")
+>>> await storage.put(conversation)
+>>> storage.close()
+"""
+
+from abc import ABC, abstractmethod
+import asyncio
+import atexit
+import concurrent.futures
+import datetime
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+from . import api
+
+
+def copy_conversation(conversation):
+    """Return deep copy of conversation."""
+    return api.Conversation(**api.encode_class(conversation))
+
+
+class AbstractStorage(ABC):
+    """Abstract asynchronous storage of conversations."""
+
+    persistent = True  # False if conversations are lost when storage is closed
+
+    @abstractmethod
+    async def get_ongoing(self, talker):
+        """Return ongoing conversation of talker or None."""
+
+    @abstractmethod
+    async def put(self, conversation):
+        """Create or update conversation."""
+
+    @abstractmethod
+    async def delete(self, conversation):
+        """Delete conversation."""
+
+    @abstractmethod
+    async def list_finished(self, limit):
+        """Return up to limit conversations that are not ongoing."""
+
+    @abstractmethod
+    async def list_conversations(self, offset, limit):
+        """Return page of all conversations in order they were created."""
+
+    @abstractmethod
+    async def list_messages(self, offset, limit):
+        """Return total count and page of messages, latest sent first.
+
+        Page is a list of (talker, Message) tuples.
+        """
+
+    def close(self):
+        """Release resources held by storage."""
+
+
+class MemoryStorage(AbstractStorage):
+    """Storage that keeps conversations in process memory.
+
+    Conversations are copied on the way in and out as persistent storage would do.
+    """
+
+    persistent = False
+
+    def __init__(self):
+        """Initialise empty storage."""
+        self._conversations = {}
+
+    async def get_ongoing(self, talker):
+        """Return ongoing conversation of talker or None."""
+        for conversation in self._conversations.values():
+            if conversation.talker == talker and conversation.ongoing:
+                return copy_conversation(conversation)
+        return None
+
+    async def put(self, conversation):
+        """Create or update conversation."""
+        self._conversations[conversation.uuid] = copy_conversation(conversation)
+
+    async def delete(self, conversation):
+        """Delete conversation."""
+        self._conversations.pop(conversation.uuid, None)
+
+    async def list_finished(self, limit):
+        """Return up to limit conversations that are not ongoing."""
+        finished = [i for i in self._conversations.values() if not i.ongoing]
+        return [copy_conversation(i) for i in finished[:limit]]
+
+    async def list_conversations(self, offset, limit):
+        """Return page of all conversations in order they were created."""
+        page = list(self._conversations.values())[offset:][:limit]
+        return [copy_conversation(i) for i in page]
+
+    async def list_messages(self, offset, limit):
+        """Return total count and page of messages, latest sent first."""
+        records = [
+            (conversation.talker, message)
+            for conversation in self._conversations.values()
+            for message in conversation.messages
+        ]
+        records.sort(key=lambda x: x[1].sent, reverse=True)
+        return len(records), records[offset:][:limit]
+
+
+class ThreadedStorage(AbstractStorage):
+    """Storage that runs all blocking calls in one dedicated thread.
+
+    Subclass implements blocking `_open` and methods named with leading underscore,
+    all of them are run in the same thread, as connections of most databases are not
+    meant to be shared across threads.
+    """
+
+    def __init__(self):
+        """Start storage thread and open storage within it."""
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=type(self).__name__
+        )
+        self._executor.submit(self._open).result()
+
+    async def _run(self, method, *args):
+        """Run blocking method in storage thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, method, *args)
+
+    async def get_ongoing(self, talker):
+        """Return ongoing conversation of talker or None."""
+        return await self._run(self._get_ongoing, talker)
+
+    async def put(self, conversation):
+        """Create or update conversation."""
+        # Conversation is copied as caller continues to change it meanwhile
+        await self._run(self._put, copy_conversation(conversation))
+
+    async def delete(self, conversation):
+        """Delete conversation."""
+        await self._run(self._delete, conversation)
+
+    async def list_finished(self, limit):
+        """Return up to limit conversations that are not ongoing."""
+        return await self._run(self._list_finished, limit)
+
+    async def list_conversations(self, offset, limit):
+        """Return page of all conversations in order they were created."""
+        return await self._run(self._list_conversations, offset, limit)
+
+    async def list_messages(self, offset, limit):
+        """Return total count and page of messages, latest sent first."""
+        return await self._run(self._list_messages, offset, limit)
+
+    def close(self):
+        """Close storage within its thread and stop the thread."""
+        self._executor.submit(self._close).result()
+        self._executor.shutdown()
+
+    @abstractmethod
+    def _open(self):
+        """Open storage."""
+
+    def _close(self):
+        """Close storage."""
+
+
+class MembankStorage(ThreadedStorage):
+    """Storage of conversations in membank."""
+
+    def __init__(self, url=None):
+        """Initialise storage on membank url, defaults to in-memory database."""
+        self.url = url
+        self.persistent = bool(url) and ":memory:" not in url
+        super().__init__()
+
+    def _open(self):
+        """Load memory."""
+        import membank
+
+        self.memory = membank.LoadMemory(self.url)
+
+    def _get_ongoing(self, talker):
+        """Return ongoing conversation of talker or None."""
+        return self.memory.get.conversation(talker=talker, ongoing=True)
+
+    def _put(self, conversation):
+        """Create or update conversation."""
+        self.memory.put(conversation)
+
+    def _delete(self, conversation):
+        """Delete conversation.
+
+        Memory deletes items by matching all fields, encoded fields like messages can't
+        be matched, therefore conversation is emptied first and only then deleted.
+        """
+        conversation = api.Conversation(uuid=conversation.uuid)
+        self.memory.put(conversation)
+        self.memory.delete(conversation)
+
+    def _list_finished(self, limit):
+        """Return up to limit conversations that are not ongoing."""
+        memory = self.memory
+        return memory.get(memory.conversation.ongoing == False)[:limit]  # noqa: E712
+
+    def _list_conversations(self, offset, limit):
+        """Return page of all conversations in order they were created."""
+        return get_membank_page(self.memory, "conversation", offset, limit)
+
+    def _list_messages(self, offset, limit):
+        """Return total count and page of messages, latest sent first."""
+        records = [
+            (conversation.talker, message)
+            for conversation in self.memory.get("conversation")
+            for message in conversation.messages
+        ]
+        records.sort(key=lambda x: x[1].sent, reverse=True)
+        return len(records), records[offset:][:limit]
+
+
+def get_membank_page(memory, name, offset, limit):
+    """Return page of items of membank memory in order they were put.
+
+    Public getters of membank return all items at once, whole history would be held
+    in memory while migrated. Page is therefore selected with private table, class
+    and engine of memory and its statement helpers, all private access is here and
+    raises RuntimeError once membank changes them.
+    """
+    import membank
+    from membank import datamethods, errors
+    import sqlalchemy
+
+    try:
+        try:
+            table = memory._get_sql_table(name)
+        except errors.MemoryTableDoesNotExist:
+            return []
+        item = memory._get_class(name)
+        stmt = datamethods.make_stmt(table, item)
+        stmt = stmt.order_by(sqlalchemy.text("rowid")).limit(limit).offset(offset)
+        return datamethods.get_from_sql(item, stmt, memory._get_engine())
+    except (AttributeError, TypeError) as error:
+        version = getattr(membank, "__version__", "unknown")
+        raise RuntimeError(
+            f"Paging {name} is not supported by membank {version}: {error}"
+        ) from error
+
+
+class SQLiteStorage(AbstractStorage):
+    """Storage of conversations in SQLite database in WAL mode.
+
+    All writes go through one writer thread that commits every write queued meanwhile
+    in one transaction (group commit), thus concurrent turns share the cost of commit.
+    Reads run in their own thread on separate connection, WAL lets them proceed while
+    writer commits. In-memory database can't be shared among connections, therefore
+    its reads are queued to writer thread as well.
+
+    Statements are kept as constant strings, so sqlite3 reuses them prepared from its
+    per-connection statement cache. Messages are clustered by conversation and index on
+    sent time covers counting and paging of messages.
+    """
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS conversation (
+            uuid TEXT PRIMARY KEY,
+            talker TEXT NOT NULL,
+            ongoing INTEGER NOT NULL,
+            subject TEXT NOT NULL,
+            data TEXT NOT NULL
+        )""",
+        """CREATE INDEX IF NOT EXISTS conversation_talker_ongoing
+            ON conversation (talker, ongoing)""",
+        """CREATE TABLE IF NOT EXISTS message (
+            conversation TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            sent TEXT NOT NULL,
+            author TEXT NOT NULL,
+            parts TEXT NOT NULL,
+            PRIMARY KEY (conversation, position)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS message_sent ON message (sent)",
+    )
+    SELECT_CONVERSATION = (
+        "SELECT uuid, talker, ongoing, subject, data FROM conversation"
+    )
+    SELECT_ONGOING = SELECT_CONVERSATION + " WHERE talker = ? AND ongoing = 1 LIMIT 1"
+    SELECT_FINISHED = SELECT_CONVERSATION + " WHERE ongoing = 0 LIMIT ?"
+    SELECT_PAGE = SELECT_CONVERSATION + " ORDER BY rowid LIMIT ? OFFSET ?"
+    SELECT_MESSAGES = (
+        "SELECT sent, author, parts FROM message WHERE conversation = ?"
+        " ORDER BY position"
+    )
+    COUNT_MESSAGES = "SELECT COUNT(*) FROM message"
+    # Page is picked from covering index only, rows are read just for the page
+    SELECT_MESSAGE_PAGE = """SELECT conversation.talker, message.sent, message.author,
+            message.parts
+        FROM (
+            SELECT conversation, position FROM message
+            ORDER BY sent DESC LIMIT ? OFFSET ?
+        ) AS page
+        JOIN message
+            ON message.conversation = page.conversation
+            AND message.position = page.position
+        JOIN conversation ON conversation.uuid = page.conversation
+        ORDER BY message.sent DESC"""
+    PUT_CONVERSATION = (
+        "INSERT OR REPLACE INTO conversation (uuid, talker, ongoing, subject, data)"
+        " VALUES (?, ?, ?, ?, ?)"
+    )
+    PUT_MESSAGE = (
+        "INSERT INTO message (conversation, position, sent, author, parts)"
+        " VALUES (?, ?, ?, ?, ?)"
+    )
+    DELETE_MESSAGES = "DELETE FROM message WHERE conversation = ?"
+    DELETE_CONVERSATION = "DELETE FROM conversation WHERE uuid = ?"
+
+    def __init__(self, path=":memory:", batch_size=64, commit_delay=0):
+        """Initialise storage on database file path.
+
+        :param path: database file path, defaults to in-memory database
+        :param batch_size: maximum number of writes committed in one transaction
+        :param commit_delay: seconds writer waits on more writes before commit
+        """
+        self.path = path
+        self.persistent = path != ":memory:"
+        self.batch_size = batch_size
+        self.commit_delay = commit_delay
+        self.commits = 0
+        self.writes = 0
+        self._writes = queue.SimpleQueue()
+        opened = concurrent.futures.Future()
+        # Writer does not hold process exit, queued writes are committed at exit
+        self._writer = threading.Thread(
+            target=self._write_forever, args=(opened,), name="SQLiteWriter", daemon=True
+        )
+        self._writer.start()
+        opened.result()
+        atexit.register(self.close)
+        self._reader = None
+        if path != ":memory:":
+            self._reader = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="SQLiteReader"
+            )
+            self._reader.submit(self._open_reader).result()
+
+    def connect(self):
+        """Return new connection to database."""
+        db = sqlite3.connect(self.path, cached_statements=256)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _open_reader(self):
+        """Open connection of reader thread."""
+        self._reader_db = self.connect()
+
+    def _close_reader(self):
+        """Close connection of reader thread."""
+        self._reader_db.close()
+
+    def _write_forever(self, opened):
+        """Open database and commit queued writes in batches until closed."""
+        try:
+            db = self.connect()
+            with db:
+                for statement in self.SCHEMA:
+                    db.execute(statement)
+        except Exception as error:
+            opened.set_exception(error)
+            return
+        opened.set_result(None)
+        closing = False
+        while not closing:
+            job = self._writes.get()
+            if job is None:
+                break
+            if self.commit_delay:
+                time.sleep(self.commit_delay)
+            batch = [job]
+            while len(batch) < self.batch_size:
+                try:
+                    job = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    closing = True
+                    break
+                batch.append(job)
+            # Cancelled waiters are dropped, the rest are marked as running
+            batch = [i for i in batch if i[2].set_running_or_notify_cancel()]
+            if batch:
+                self._commit(db, batch)
+        db.close()
+
+    def _commit(self, db, batch):
+        """Run batch of jobs in one transaction and resolve their futures."""
+        try:
+            with db:
+                results = [method(db, *args) for method, args, _ in batch]
+        except Exception as error:
+            if len(batch) == 1:
+                batch[0][2].set_exception(error)
+            else:
+                # Failed job must not fail the others, retry each on its own
+                for job in batch:
+                    self._commit(db, [job])
+            return
+        self.commits += 1
+        self.writes += len(batch)
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+    async def _write(self, method, *args):
+        """Queue method to writer thread and wait until it is committed."""
+        if not self._writer.is_alive():
+            raise RuntimeError("Storage is closed.")
+        future = concurrent.futures.Future()
+        self._writes.put((method, args, future))
+        return await asyncio.wrap_future(future)
+
+    async def _read(self, method, *args):
+        """Run method in reader thread."""
+        if self._reader is None:
+            return await self._write(method, *args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._reader, lambda: method(self._reader_db, *args)
+        )
+
+    async def get_ongoing(self, talker):
+        """Return ongoing conversation of talker or None."""
+        return await self._read(self._get_ongoing, talker)
+
+    async def put(self, conversation):
+        """Create or update conversation with all its messages."""
+        # Rows are encoded here as caller continues to change conversation meanwhile
+        row = (
+            conversation.uuid,
+            conversation.talker,
+            int(conversation.ongoing),
+            conversation.subject,
+            json.dumps(conversation.data),
+        )
+        messages = [
+            (
+                conversation.uuid,
+                position,
+                get_sent(message),
+                message.author,
+                json.dumps(api.encode_array(message.parts)),
+            )
+            for position, message in enumerate(conversation.messages)
+        ]
+        await self._write(self._put, row, messages)
+
+    async def delete(self, conversation):
+        """Delete conversation with its messages."""
+        await self._write(self._delete, conversation.uuid)
+
+    async def list_finished(self, limit):
+        """Return up to limit conversations that are not ongoing."""
+        return await self._read(self._list, self.SELECT_FINISHED, (limit,))
+
+    async def list_conversations(self, offset, limit):
+        """Return page of all conversations in order they were created."""
+        return await self._read(self._list, self.SELECT_PAGE, (limit, offset))
+
+    async def list_messages(self, offset, limit):
+        """Return total count and page of messages, latest sent first."""
+        return await self._read(self._list_messages, offset, limit)
+
+    def close(self):
+        """Commit queued writes and close database."""
+        atexit.unregister(self.close)
+        if self._reader is not None:
+            try:
+                self._reader.submit(self._close_reader).result()
+            except RuntimeError:
+                # Executors are shut down before atexit, connection closes with process
+                pass
+            self._reader.shutdown()
+            self._reader = None
+        self._writes.put(None)
+        self._writer.join()
+
+    def _load(self, db, row):
+        """Return conversation with messages from conversation row."""
+        uuid, talker, ongoing, subject, data = row
+        messages = [
+            api.Message(parts=json.loads(parts), author=author, sent=sent)
+            for sent, author, parts in db.execute(self.SELECT_MESSAGES, (uuid,))
+        ]
+        return api.Conversation(
+            uuid=uuid,
+            talker=talker,
+            ongoing=bool(ongoing),
+            subject=subject,
+            messages=messages,
+            data=json.loads(data),
+        )
+
+    def _get_ongoing(self, db, talker):
+        """Return ongoing conversation of talker or None."""
+        row = db.execute(self.SELECT_ONGOING, (talker,)).fetchone()
+        return self._load(db, row) if row else None
+
+    def _list(self, db, query, params):
+        """Return conversations selected by query."""
+        return [self._load(db, row) for row in db.execute(query, params).fetchall()]
+
+    def _list_messages(self, db, offset, limit):
+        """Return total count and page of messages, latest sent first."""
+        (total,) = db.execute(self.COUNT_MESSAGES).fetchone()
+        rows = db.execute(self.SELECT_MESSAGE_PAGE, (limit, offset))
+        return total, [
+            (talker, api.Message(parts=json.loads(parts), author=author, sent=sent))
+            for talker, sent, author, parts in rows
+        ]
+
+    def _put(self, db, row, messages):
+        """Write conversation row and replace its message rows."""
+        db.execute(self.PUT_CONVERSATION, row)
+        db.execute(self.DELETE_MESSAGES, (row[0],))
+        db.executemany(self.PUT_MESSAGE, messages)
+
+    def _delete(self, db, uuid):
+        """Delete conversation with its messages."""
+        db.execute(self.DELETE_MESSAGES, (uuid,))
+        db.execute(self.DELETE_CONVERSATION, (uuid,))
+
+
+def get_sent(message):
+    """Return sent time of message as sortable UTC ISO string."""
+    return message.sent.astimezone(datetime.timezone.utc).isoformat()
+
+
+def get_storage(conf):
+    """Return storage as per configuration.
+
+    `storage` selects backend: "membank" (default), "sqlite" or "memory". Membank
+    uses `memory_path` url, SQLite uses `storage_path` file path and optionally
+    `storage_batch_size` and `storage_commit_delay`.
+    """
+    backend = conf.get("storage", "membank")
+    if backend == "membank":
+        return MembankStorage(conf.get("memory_path"))
+    if backend == "sqlite":
+        return SQLiteStorage(
+            conf.get("storage_path", ":memory:"),
+            batch_size=conf.get("storage_batch_size", 64),
+            commit_delay=conf.get("storage_commit_delay", 0),
+        )
+    if backend == "memory":
+        return MemoryStorage()
+    raise RuntimeError(f"Unknown storage '{backend}'")
+
+
+async def migrate(source, target, batch_size=100):
+    """Copy all conversations from source storage into target storage.
+
+    Return number of conversations copied. Raise RuntimeError if target does not
+    persist conversations, as they would be lost once migration is done.
+    """
+    if not target.persistent:
+        raise RuntimeError(
+            f"Target storage {type(target).__name__} does not persist conversations, "
+            "configure persistent storage to migrate into."
+        )
+    count = 0
+    while True:
+        page = await source.list_conversations(count, batch_size)
+        if not page:
+            return count
+        # Puts of one page are committed together where target supports it
+        await asyncio.gather(*(target.put(i) for i in page))
+        count += len(page)
@@ -27,6 +27,44 @@ def send_sync(sender: str, receiver: str, subject: str, msg: chatbot.Message, po
     loop.create_task(send(sender, receiver, subject, msg, port))
 
 
+class Replies:
+    """Callback that collects bot replies of turn to send them as one email."""
+
+    def __init__(
+        self, sender: str, receiver: str, subject: str, port=25, separator="\n\n"
+    ):
+        """Initialise replies to receiver with no messages collected."""
+        self.sender = sender
+        self.receiver = receiver
+        self.subject = subject
+        self.port = port
+        self.separator = separator
+        self.messages = []
+
+    def __call__(self, msg: chatbot.Message) -> None:
+        """Collect message."""
+        self.messages.append(msg)
+
+    async def send(self) -> None:
+        """Send collected messages as one email, nothing if there are none."""
+        if not self.messages:
+            return
+        msg = merge(self.messages, self.separator)
+        self.messages = []
+        await send(self.sender, self.receiver, self.subject, msg, self.port)
+
+
+def merge(messages: list, separator="\n\n") -> chatbot.Message:
+    """Merge messages into one with texts joined by separator, files after text."""
+    texts = []
+    files = []
+    for msg in messages:
+        texts.append("".join(i.text for i in msg.parts if not i.binary))
+        files.extend(i for i in msg.parts if i.binary)
+    text = separator.join(i for i in texts if i)
+    return chatbot.Message([chatbot.MessagePart(text)] + files, messages[0].author)
+
+
 def serialise_email(msg: email.message.Message) -> chatbot.Message:
     """Serialise email message into chatbot Message."""
     text = msg["subject"] + "\n"
@@ -43,7 +81,8 @@ def deserialise_email(
     mail["subject"] = subject if subject.startswith("Re: ") else f"Re: {subject}"
     mail["from"] = sender
     mail["to"] = receiver
-    txt = ""
+    # Text goes first, attachments turn message into multipart
+    mail.set_content("".join(i.text for i in msg.parts if not i.binary))
     for part in msg.parts:
         if part.binary:
             maintype, subtype = part.media_type.split("/", maxsplit=1)
@@ -53,7 +92,4 @@ def deserialise_email(
                 subtype=subtype,
                 filename=part.filename,
             )
-        else:
-            txt += part.text
-    mail.set_content(txt)
     return mail
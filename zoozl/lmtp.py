@@ -0,0 +1,91 @@
+"""LMTP server that passes received emails to chatbot.
+
+Module is imported by server only when email listener is configured, as aiosmtpd is
+not needed otherwise.
+"""
+
+import asyncio
+import email.message
+import functools
+
+from aiosmtpd.handlers import AsyncMessage
+from aiosmtpd.lmtp import LMTP
+
+from zoozl import chatbot, emailer
+from zoozl.server import ConnectionManager, get_peer
+
+
+class EmailHandler(AsyncMessage):
+    """Handle incoming emails as LMTP server."""
+
+    def __init__(self, root: chatbot.InterfaceRoot):
+        """Initialise email handler."""
+        self.root = root
+        super().__init__()
+
+    async def handle_message(self, message: email.message.Message):
+        """Handle email message."""
+        replies = emailer.Replies(
+            self.root.conf["email_address"],
+            message["from"],
+            message.get("subject", ""),
+            self.root.conf["email_smtp_port"],
+        )
+        async with self.root.turn(message["to"]):
+            bot = await self.root.session("email", message["to"], replies)
+            # Nobody waits on screen for email reply
+            with chatbot.scheduler.priority(chatbot.scheduler.PRIORITY_BATCH):
+                await bot.ask(emailer.serialise_email(message))
+            # All replies of turn go in one email, before next turn of talker
+            await replies.send()
+
+
+class ManagedLMTP(LMTP):
+    """LMTP protocol with connections admitted by connection manager."""
+
+    def __init__(self, handler, connections: ConnectionManager, **kwargs):
+        """Initialise protocol with handler and connection manager."""
+        super().__init__(handler, **kwargs)
+        self.connections = connections
+        self.admitted = False
+
+    def connection_made(self, transport):
+        """Admit connection or reject it with transient error."""
+        peer = get_peer(transport)
+        if not self.connections.admit(peer):
+            transport.write(b"421 Too many connections, try again later\r\n")
+            transport.close()
+            return
+        self.admitted = True
+        super().connection_made(transport)
+        self.connections.register(self, peer, self._handler_coroutine)
+
+    def connection_lost(self, error):
+        """Release connection."""
+        if self.admitted:
+            self.connections.release(self)
+            super().connection_lost(error)
+
+
+async def build_email_server(
+    root: chatbot.InterfaceRoot,
+    port: int,
+    force_bind=False,
+    connections: ConnectionManager = None,
+):
+    """Build LMTP server from configuration."""
+    if connections is None:
+        connections = ConnectionManager.from_conf("email", root.conf)
+    loop = asyncio.get_running_loop()
+    return await loop.create_server(
+        functools.partial(
+            ManagedLMTP,
+            EmailHandler(root),
+            connections,
+            loop=loop,
+            timeout=root.conf.get("email_idle_timeout", 300),
+        ),
+        host="localhost",
+        port=port,
+        reuse_port=force_bind,
+    )
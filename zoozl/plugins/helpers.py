@@ -21,7 +21,7 @@ class Help(Interface):
         """Try to help user."""
         package.callback(random.choice(self.helps))
 
-    def is_complete(self):
+    def is_complete(self, package):
         """Complete immediately the conversation."""
         return True
 
@@ -36,7 +36,7 @@ class Hello(Interface):
         greets = ["Hello", "Hey", "Hello, hello. What do you want to do?"]
         package.callback(random.choice(greets))
 
-    def is_complete(self):
+    def is_complete(self, package):
         """Complete immediately the conversation."""
         return True
 
@@ -60,20 +60,40 @@ class Games(Interface):
     """Defines games."""
 
     aliases = {"play games"}
-    complete = False
+    state = {"game": "", "bull_number": "", "complete": False}
 
-    def is_complete(self):
+    def is_complete(self, package):
         """Return if conversation is complete."""
-        return self.complete
+        return self.get_state(package)["complete"]
+
+    def get_state(self, package):
+        """Return state of game, carrying over game of earlier versions.
+
+        Game was kept under class name in state and before that in conversation
+        data itself.
+        """
+        state = package.state(self)
+        data = package.conversation.data
+        old = data.get("state", {}).pop(type(self).__name__, {})
+        if "state" in data and not data["state"]:
+            del data["state"]
+        for key in ("game", "bull_number"):
+            if key in data:
+                old.setdefault(key, data.pop(key))
+        for key, value in old.items():
+            if key in self.state:
+                state[key] = value
+        return state
 
     async def consume(self, package):
         """Take latest text from user and process it."""
-        if "game" not in package.conversation.data:
-            self.get_game(package)
+        state = self.get_state(package)
+        if not state["game"]:
+            self.get_game(package, state)
         else:
-            getattr(self, package.conversation.data["game"])(package)
+            getattr(self, state["game"])(package, state)
 
-    def get_game(self, package):
+    def get_game(self, package, state):
         """Try to get game name or ask for it."""
         games = {
             "bull": "bull_game",
@@ -85,27 +105,25 @@ class Games(Interface):
             package.conversation.messages[-1].text.lower(), games.keys()
         )
         if game[1] >= 95:
-            package.conversation.data["game"] = games[game[0]]
+            state["game"] = games[game[0]]
             package.callback("OK. Let's play bulls and cows")
-            self.bull_game(package)
+            self.bull_game(package, state)
         else:
             package.callback(Message("what game you want to play? bulls and cows?"))
 
-    def bull_game(self, package):
+    def bull_game(self, package, state):
         """Play a number guessing game."""
-        if "bull_number" in package.conversation.data:
+        if state["bull_number"]:
             number = package.last_message_text
             if len(number) != 4:
                 package.callback(Message("Give number with exactly 4 digits"))
             elif len(set(number)) != len(number):
                 package.callback("Digits must be unique in number")
             else:
-                bulls, cows = count_bulls_cows(
-                    number, package.conversation.data["bull_number"]
-                )
+                bulls, cows = count_bulls_cows(number, state["bull_number"])
                 if bulls == 4:
                     package.callback("Congrats. You guessed right")
-                    self.complete = True
+                    state["complete"] = True
                 else:
                     package.callback(f"You have {bulls} bulls and {cows} cows")
         else:
@@ -118,5 +136,5 @@ class Games(Interface):
                 if digit in number:
                     continue
                 number += digit
-            package.conversation.data["bull_number"] = number
+            state["bull_number"] = number
             package.callback("Guess 4 digit number")
@@ -2,6 +2,10 @@
 
 Meant to be run in main python thread.
 
+Optional dependencies of transports, embedders and storages are slow to import, so
+they are imported where configured feature is first used, rather than at the top of
+modules. `scripts/importtime.py --check` fails if importing server pulls them in.
+
 >>> with open("conf.toml", "rb") as file:
 ...     conf = tomllib.load(file)
 >>> # Run server until interrupted
@@ -9,25 +13,39 @@ Meant to be run in main python thread.
 """
 
 import asyncio
-import email
+import collections
+from dataclasses import dataclass
 import functools
 import hmac
+import itertools
 import json
 import logging
 import signal
 import time
 import traceback
 import uuid
+import warnings
 from abc import abstractmethod
 
-from aiosmtpd.handlers import AsyncMessage
-from aiosmtpd.lmtp import LMTP
-
-from zoozl import chatbot, emailer, slack, websocket
+from zoozl import chatbot, slack, websocket
 
 log = logging.getLogger(__name__)
 
 
+def __getattr__(name):
+    """Return email transport classes that moved into zoozl.lmtp."""
+    if name in ("EmailHandler", "ManagedLMTP"):
+        warnings.warn(
+            f"zoozl.server.{name} is deprecated, import it from zoozl.lmtp",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        from zoozl import lmtp
+
+        return getattr(lmtp, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 class Interrupt(Exception):
     """Exception to interrupt server."""
 
@@ -44,6 +62,7 @@ HTTP_STATUS_CODES = (
     (414, "URI Too Long"),
     (500, "Internal Server Error"),
     (501, "Not Implemented"),
+    (503, "Service Unavailable"),
 )
 
 
@@ -398,15 +417,159 @@ def allowed_methods(*methods):
     return decorator
 
 
+def get_peer(transport):
+    """Return IP address of the peer of transport or stream writer."""
+    peername = transport.get_extra_info("peername")
+    return peername[0] if peername else ""
+
+
+@dataclass
+class Connection:
+    """Record of one admitted connection.
+
+    peer - IP address of the peer
+    task - task that serves the connection, awaited while draining
+    on_close - optional callable to ask connection to close gracefully
+    stats - optional round trip time statistics of the peer
+    """
+
+    peer: str
+    task: asyncio.Task = None
+    on_close: type = None
+    stats: websocket.PeerStats = None
+
+
+class ConnectionManager:
+    """Admission control and bookkeeping of connections on one listener.
+
+    >>> connections = ConnectionManager("websocket", max_connections=100)
+    >>> server = await asyncio.start_server(connections.wrap(handler), port=80)
+    >>> # Stop admitting and wait on connections to close
+    >>> await connections.drain(timeout=10)
+    """
+
+    def __init__(self, name: str, max_connections: int = 1024, max_per_ip: int = 64):
+        """Initialise manager with listener name and connection limits."""
+        self.name = name
+        self.max_connections = max_connections
+        self.max_per_ip = max_per_ip
+        self.connections = {}
+        self.per_ip = collections.Counter()
+        self.draining = False
+
+    @classmethod
+    def from_conf(cls, name: str, conf: dict):
+        """Return manager with limits from configuration."""
+        return cls(
+            name,
+            max_connections=conf.get("max_connections", 1024),
+            max_per_ip=conf.get("max_connections_per_ip", 64),
+        )
+
+    def admit(self, peer: str) -> bool:
+        """Return True if connection from peer is allowed."""
+        if self.draining:
+            log.info("%s: rejected %s while draining", self.name, peer)
+            return False
+        if len(self.connections) >= self.max_connections:
+            log.warning(
+                "%s: connection limit %s reached", self.name, len(self.connections)
+            )
+            return False
+        if self.per_ip[peer] >= self.max_per_ip:
+            log.warning("%s: connection limit reached for %s", self.name, peer)
+            return False
+        return True
+
+    def register(self, key, peer: str, task: asyncio.Task = None) -> Connection:
+        """Register admitted connection under key."""
+        connection = Connection(peer, task)
+        self.connections[key] = connection
+        self.per_ip[peer] += 1
+        return connection
+
+    def release(self, key):
+        """Release connection registered under key."""
+        connection = self.connections.pop(key, None)
+        if connection is not None:
+            self.per_ip[connection.peer] -= 1
+            if self.per_ip[connection.peer] <= 0:
+                del self.per_ip[connection.peer]
+
+    def current(self) -> Connection:
+        """Return connection served by current task."""
+        return self.connections.get(asyncio.current_task())
+
+    def wrap(self, handler):
+        """Return stream handler that admits connections before handling them."""
+
+        @functools.wraps(handler)
+        async def wrapper(reader, writer):
+            peer = get_peer(writer)
+            if not self.admit(peer):
+                try:
+                    write_http_response(writer, 503)
+                    await writer.drain()
+                except ConnectionError:
+                    pass
+                writer.close()
+                return
+            task = asyncio.current_task()
+            self.register(task, peer, task)
+            try:
+                await handler(reader, writer)
+            finally:
+                self.release(task)
+
+        return wrapper
+
+    async def drain(self, timeout: float = 10):
+        """Stop admitting connections and wait for open ones to close.
+
+        Connections are asked to close gracefully, ones still open after timeout
+        are cancelled.
+        """
+        self.draining = True
+        connections = list(self.connections.values())
+        for connection in connections:
+            if connection.on_close is not None:
+                connection.on_close()
+        tasks = [
+            i.task for i in connections if i.task is not None and not i.task.done()
+        ]
+        if not tasks:
+            return
+        log.info("%s: draining %s connections", self.name, len(tasks))
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            log.warning("%s: cancelled %s connections", self.name, len(pending))
+            await asyncio.wait(pending)
+
+
 class RequestHandler:
     """Allows to handle requests from different sources."""
 
-    def __init__(self, root: chatbot.InterfaceRoot):
+    def __init__(
+        self, root: chatbot.InterfaceRoot, connections: ConnectionManager = None
+    ):
         """Initialise with interface root.
 
         :param root: must be already loaded
+        :param connections: manager that admits connections to the handler
         """
         self.root = root
+        self.connections = (
+            connections
+            if connections is not None
+            else ConnectionManager.from_conf(type(self).__name__, root.conf)
+        )
+
+    @property
+    def serve(self):
+        """Return connection callback with admission control for stream server."""
+        return self.connections.wrap(self.handle)
 
     def is_auth_required(self) -> bool:
         """Return whether authentication is required for this handler."""
@@ -417,8 +580,74 @@ class RequestHandler:
         """Handle request."""
 
 
+def call_in_loop(loop, function, *args):
+    """Call function in loop thread, right away if called from within loop."""
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        function(*args)
+    else:
+        loop.call_soon_threadsafe(function, *args)
+
+
+class WebSocketStream(chatbot.CoalescingStream):
+    """Reply streamed to websocket talker with partial packets.
+
+    Every packet of stream carries the same `stream` id, partial packets carry
+    text added since previous one in `partial` and last packet carries whole text
+    in `text` as any other message. Plugins may write from other threads, packets
+    are queued from loop thread.
+    """
+
+    ids = itertools.count(1)
+
+    def __init__(self, handler, queue, loop, talker=None, interval=0.05):
+        """Initialise stream to websocket queue of handler."""
+        super().__init__(interval, loop)
+        self.handler = handler
+        self.queue = queue
+        self.talker = talker
+        self.id = next(self.ids)
+
+    def send_packet(self, key, text):
+        """Send packet of stream with text under key."""
+        packet = {"author": self.handler.root.conf.get("author", ""), key: text}
+        packet["stream"] = self.id
+        if self.talker is not None:
+            packet["talker"] = self.talker
+        call_in_loop(self.loop, self.handler.send_packet, self.queue, packet)
+
+    def send_delta(self, text):
+        """Send partial packet."""
+        self.send_packet("partial", text)
+
+    def finish(self, text):
+        """Send last packet with whole text."""
+        self.send_packet("text", text)
+
+
 class WebSocketHandler(RequestHandler):
-    """Handle websocket connections."""
+    """Handle websocket connections.
+
+    Frames are sent through per connection `websocket.FrameQueue`, thus several
+    messages within one turn leave in one write and a slow talker holds back only
+    reading of its own next message. Liveness of talkers is checked by one
+    `websocket.Heartbeat` shared by all connections of the handler.
+    """
+
+    def __init__(
+        self, root: chatbot.InterfaceRoot, connections: ConnectionManager = None
+    ):
+        """Initialise with interface root and optional heartbeat."""
+        super().__init__(root, connections)
+        self.heartbeat = None
+        if root.conf.get("websocket_ping_interval", 20):
+            self.heartbeat = websocket.Heartbeat(
+                interval=root.conf.get("websocket_ping_interval", 20),
+                timeout=root.conf.get("websocket_ping_timeout", 10),
+            )
 
     @http_request
     @allowed_methods("GET")
@@ -429,75 +658,258 @@ class WebSocketHandler(RequestHandler):
             log.warning("Missing Sec-WebSocket-Key header")
             return
         writer.write(websocket.handshake(msg.headers["sec-websocket-key"]))
-        await writer.drain()
+        queue = websocket.FrameQueue(
+            writer,
+            high_water=self.root.conf.get("websocket_high_water", 2**16),
+            low_water=self.root.conf.get("websocket_low_water", 2**14),
+        )
+        queue.start()
+        self.attach(queue)
+        try:
+            if self.is_gateway(msg.headers):
+                await self.converse_multiplexed(reader, queue)
+            else:
+                await self.converse(reader, queue)
+        finally:
+            if self.heartbeat is not None:
+                self.heartbeat.unregister(queue)
+            await queue.close(self.root.conf.get("websocket_send_timeout", 30))
+
+    def attach(self, queue):
+        """Attach heartbeat and graceful close to current connection."""
+        connection = self.connections.current()
+        stats = None
+        if self.heartbeat is not None:
+            stats = self.heartbeat.register(queue, queue.writer.transport.abort)
+        if connection is not None:
+            connection.stats = stats
+            connection.on_close = functools.partial(
+                self.send_close,
+                queue,
+                websocket.close_payload(websocket.CLOSE_GOING_AWAY),
+            )
+
+    def get_streamer(self, queue, talker=None):
+        """Return streamer of replies to queue, None if streaming is not enabled."""
+        if not self.root.conf.get("stream_replies", False):
+            return None
+        return functools.partial(
+            WebSocketStream,
+            self,
+            queue,
+            asyncio.get_running_loop(),
+            talker,
+            self.root.conf.get("websocket_stream_interval", 0.05),
+        )
+
+    def is_gateway(self, headers) -> bool:
+        """Return True if connection is made by trusted gateway."""
+        token = self.root.conf.get("websocket_gateway_token")
+        sent = headers.get("x-zoozl-gateway")
+        if not token or sent is None:
+            return False
+        if hmac.compare_digest(token.encode(), sent.encode()):
+            return True
+        log.warning("Invalid gateway token, serving as single talker connection")
+        return False
+
+    async def converse(self, reader, queue):
+        """Exchange messages with talker until connection is closed."""
         if self.is_auth_required():
-            msg = await self.handle_data_frame(writer, reader)
+            msg = await self.read_message(queue, reader)
+            if msg.get("break"):
+                return
             if "auth" not in msg:
-                self.send_error(writer, "Missing 'auth' key in JSON")
-                await writer.drain()
+                self.send_error(queue, "Missing 'auth' key in JSON")
                 return
-            await writer.drain()
             talker = self.root.authenticate_token(msg["auth"])
         else:
             talker = str(uuid.uuid4())
-        await writer.drain()
-        bot = chatbot.Chat(
-            talker,
-            lambda x: self.send_message(writer, x),
-            self.root,
-        )
-        await bot.greet()
-        await writer.drain()
+        callback = functools.partial(self.deliver, queue)
+        streamer = self.get_streamer(queue)
+        async with self.root.turn(talker):
+            bot = await self.root.session("websocket", talker, callback, streamer)
+            await bot.greet()
         while True:
-            msg = await self.handle_data_frame(writer, reader)
+            await self.wait_writable(queue)
+            msg = await self.read_message(queue, reader)
             if "break" in msg and msg["break"]:
                 break
             elif "text" in msg:
-                await bot.ask(chatbot.Message(msg["text"]))
+                async with self.root.turn(talker):
+                    bot = await self.root.session(
+                        "websocket", talker, callback, streamer
+                    )
+                    with chatbot.scheduler.priority(
+                        chatbot.scheduler.PRIORITY_INTERACTIVE
+                    ):
+                        await bot.ask(chatbot.Message(msg["text"]))
             elif "operation" in msg:
                 await self.root.handle_operation(
-                    msg, lambda x: self.send_packet(writer, x)
+                    msg, lambda x: self.send_packet(queue, x)
                 )
             else:
-                self.send_error(writer, "Missing 'text'/'operation' key in JSON")
-            await writer.drain()
+                self.send_error(queue, "Missing 'text'/'operation' key in JSON")
+
+    async def converse_multiplexed(self, reader, queue):
+        """Exchange messages of many talkers over one gateway connection.
+
+        Every packet carries `talker` id and responses are sent back with the same
+        `talker` id. Packet `{"talker": id, "greet": true}` asks for greeting and
+        `{"talker": id, "break": true}` ends session of the talker. Turns of
+        different talkers run concurrently, turns of one talker in order within
+        `chatbot.InterfaceRoot.turn`, with Chat of `chatbot.InterfaceRoot.session`
+        shared with other connections and channels of the talker.
+        """
+        turns = set()
+        slots = asyncio.Semaphore(self.root.conf.get("websocket_gateway_max_turns", 64))
+        try:
+            while True:
+                await self.wait_writable(queue)
+                msg = await self.read_message(queue, reader)
+                talker = msg.get("talker")
+                if "operation" in msg:
+                    await self.root.handle_operation(
+                        msg, lambda x: self.send_packet(queue, x)
+                    )
+                    continue
+                if talker is None and msg.get("break"):
+                    break
+                if not isinstance(talker, str) or not talker:
+                    self.send_error(queue, "Missing 'talker' key in JSON")
+                elif msg.get("break"):
+                    self.root.sessions.pop(talker)
+                elif "text" in msg or msg.get("greet"):
+                    await slots.acquire()
+                    task = asyncio.create_task(
+                        self.multiplexed_turn(talker, msg, queue)
+                    )
+                    turns.add(task)
+                    task.add_done_callback(turns.discard)
+                    task.add_done_callback(lambda _: slots.release())
+                else:
+                    self.send_error(queue, "Missing 'text'/'greet' key in JSON", talker)
+        finally:
+            if turns:
+                await asyncio.wait(turns)
+
+    async def multiplexed_turn(self, talker, msg, queue):
+        """Handle one message of talker within turn of talker."""
+        async with self.root.turn(talker):
+            try:
+                bot = await self.root.session(
+                    "websocket",
+                    talker,
+                    functools.partial(self.deliver, queue, talker=talker),
+                    self.get_streamer(queue, talker),
+                )
+                if msg.get("greet"):
+                    await bot.greet()
+                if "text" in msg:
+                    with chatbot.scheduler.priority(
+                        chatbot.scheduler.PRIORITY_INTERACTIVE
+                    ):
+                        await bot.ask(chatbot.Message(msg["text"]))
+            except ConnectionError:
+                # Connection is closed by reading loop that waits on it as well
+                log.debug("Replies to talker %s were not delivered", talker)
+            except Exception:
+                log.exception("Turn of talker %s failed", talker)
+                self.send_error(queue, "Internal error", talker)
+
+    async def close(self, queue, reader, code=websocket.CLOSE_NORMAL):
+        """Start close handshake and wait for talker to confirm it."""
+        self.send_close(queue, websocket.close_payload(code))
+        try:
+            async with asyncio.timeout(
+                self.root.conf.get("websocket_close_timeout", 5)
+            ):
+                while (await websocket.read_frame(reader)).op_code != "CLOSE":
+                    pass
+        except (TimeoutError, asyncio.IncompleteReadError, RuntimeError):
+            log.debug("Talker did not confirm websocket close")
+
+    async def wait_writable(self, queue):
+        """Wait until talker has read enough of sent frames.
+
+        Raise ConnectionError if talker does not catch up within send timeout.
+        """
+        try:
+            await asyncio.wait_for(
+                queue.wait_writable(),
+                self.root.conf.get("websocket_send_timeout", 30),
+            )
+        except asyncio.TimeoutError:
+            log.warning("Websocket talker too slow to read, closing connection")
+            raise ConnectionError("Websocket send timeout") from None
 
     @staticmethod
-    def send_close(writer, text):
-        """Send close frame."""
-        sendback = 0b1000100000000010
-        sendback = sendback.to_bytes(2, "big")
-        sendback += text
-        writer.write(sendback)
+    def send_close(queue, data):
+        """Send close frame, only first close frame is sent."""
+        if not queue.close_sent:
+            queue.put(websocket.get_frame("CLOSE", data))
+            queue.close_sent = True
 
     @staticmethod
-    def send_pong(writer, data):
+    def send_pong(queue, data):
         """Send pong frame."""
-        writer.write(websocket.get_frame("PONG", data))
+        queue.put(websocket.get_frame("PONG", data))
 
     @staticmethod
-    def send_packet(writer, packet):
+    def send_packet(queue, packet):
         """Send packet."""
         packet = json.dumps(packet)
         log.debug("Sending: %s", packet)
-        writer.write(websocket.get_frame("TEXT", packet.encode()))
+        queue.put(websocket.get_frame("TEXT", packet.encode()))
 
-    def send_message(self, writer, message):
-        """Send back message."""
+    def send_message(self, queue, message, talker=None):
+        """Send back message, tagged with talker on gateway connections."""
         packet = {"author": message.author, "text": message.text}
-        self.send_packet(writer, packet)
+        if talker is not None:
+            packet["talker"] = talker
+        self.send_packet(queue, packet)
 
-    def send_error(self, writer, txt):
+    async def deliver(self, queue, message, talker=None):
+        """Send back message and wait until talker has read enough of sent frames."""
+        self.send_message(queue, message, talker)
+        await self.wait_writable(queue)
+
+    def send_error(self, queue, txt, talker=None):
         """Send error message."""
-        self.send_packet(writer, {"error": txt})
+        packet = {"error": txt}
+        if talker is not None:
+            packet["talker"] = talker
+        self.send_packet(queue, packet)
 
-    async def handle_data_frame(self, writer, reader):
-        """Handle data frame."""
-        frame = await wait_for_response(
-            websocket.read_frame(reader),
-            writer,
-            timeout=300,
-        )
+    async def read_message(self, queue, reader):
+        """Read frames until there is a message to handle.
+
+        Control frames do not count as activity, talker that sends no message
+        within idle timeout is asked to close connection.
+        """
+        msg = None
+        try:
+            async with asyncio.timeout(
+                self.root.conf.get("websocket_idle_timeout", 300)
+            ):
+                while msg is None:
+                    msg = await self.handle_data_frame(queue, reader)
+        except TimeoutError:
+            log.info("Websocket connection idle, closing")
+            await self.close(queue, reader, websocket.CLOSE_GOING_AWAY)
+            return {"break": True}
+        return msg
+
+    async def handle_data_frame(self, queue, reader):
+        """Handle data frame.
+
+        Return received message or None if frame was handled already.
+        """
+        try:
+            frame = await websocket.read_frame(reader)
+        except asyncio.IncompleteReadError:
+            log.info("Websocket connection lost while reading frame")
+            return {"break": True}
         if frame.op_code == "TEXT":
             log.info("Asking: %s", frame.data.decode())
             txt = frame.data.decode()
@@ -505,15 +917,19 @@ class WebSocketHandler(RequestHandler):
                 msg = json.loads(txt)
             except json.decoder.JSONDecodeError:
                 log.warning("User sent message with invalid json format: %s", txt)
-                self.send_error(writer, f"Invalid JSON format '{txt}'")
-                return {"break": False}
+                self.send_error(queue, f"Invalid JSON format '{txt}'")
+                return None
             return msg
         elif frame.op_code == "CLOSE":
-            self.send_close(writer, frame.data)
+            self.send_close(queue, frame.data)
             return {"break": True}
         elif frame.op_code == "PING":
-            self.send_pong(writer, frame.data)
-            return {"break": False}
+            self.send_pong(queue, frame.data)
+            return None
+        elif frame.op_code == "PONG":
+            if self.heartbeat is not None:
+                self.heartbeat.pong(queue, frame.data)
+            return None
 
 
 class SlackHandler(RequestHandler):
@@ -553,11 +969,6 @@ class SlackHandler(RequestHandler):
                         log.debug("Received slack message: %s", body)
                         slack_token = self.root.conf["slack_app_token"]
                         channel = body["channel"]
-                        bot = chatbot.Chat(
-                            body["user"],
-                            lambda msg: slack.send_slack(slack_token, channel, msg),
-                            self.root,
-                        )
                         parts = []
                         parts.append(chatbot.MessagePart(body["text"]))
                         for binary, file_type, file_name in slack.get_attachments(
@@ -566,7 +977,27 @@ class SlackHandler(RequestHandler):
                             parts.append(
                                 chatbot.MessagePart("", binary, file_type, file_name)
                             )
-                        await bot.ask(chatbot.Message(parts=parts, author=body["user"]))
+                        async with self.root.turn(body["user"]):
+                            bot = await self.root.session(
+                                f"slack:{channel}",
+                                body["user"],
+                                functools.partial(slack.send, slack_token, channel),
+                                self.get_streamer(slack_token, channel),
+                            )
+                            await bot.ask(
+                                chatbot.Message(parts=parts, author=body["user"])
+                            )
+
+    def get_streamer(self, slack_token, channel):
+        """Return streamer of replies to channel, None if streaming is not enabled."""
+        if not self.root.conf.get("stream_replies", False):
+            return None
+        return functools.partial(
+            slack.SlackStream,
+            slack_token,
+            channel,
+            self.root.conf.get("slack_stream_interval", 1),
+        )
 
     @staticmethod
     def valid_slack_request(writer, headers: dict, body: bytes, secret: bytes) -> bool:
@@ -595,34 +1026,13 @@ class SlackHandler(RequestHandler):
         return True
 
 
-class EmailHandler(AsyncMessage):
-    """Handle incoming emails as LMTP server."""
-
-    def __init__(self, root: chatbot.InterfaceRoot):
-        """Initialise email handler."""
-        self.root = root
-        super().__init__()
-
-    async def handle_message(self, message: email.message.Message):
-        """Handle email message."""
-        bot = chatbot.Chat(
-            message["to"],
-            lambda msg: emailer.send_sync(
-                self.root.conf["email_address"],
-                message["from"],
-                message.get("subject", ""),
-                msg,
-                self.root.conf["email_smtp_port"],
-            ),
-            self.root,
-        )
-        await bot.ask(emailer.serialise_email(message))
-
-
-async def run_servers_stacked(shutdown_release: asyncio.Lock, *servers):
+async def run_servers_stacked(
+    shutdown_release: asyncio.Lock, *servers, on_shutdown=None
+):
     """Run servers in stacked manner.
 
     :param shutdown_release: lock to wait on before shutting down
+    :param on_shutdown: optional coroutine function awaited before servers close
     """
     if len(servers) < 1:
         log.error("No servers configured to run")
@@ -630,15 +1040,28 @@ async def run_servers_stacked(shutdown_release: asyncio.Lock, *servers):
         async with servers[0]:
             async with shutdown_release:
                 log.info("Server shutdown")
+                if on_shutdown is not None:
+                    await on_shutdown()
     else:
         async with servers[0]:
-            await run_servers_stacked(shutdown_release, *servers[1:])
+            await run_servers_stacked(
+                shutdown_release, *servers[1:], on_shutdown=on_shutdown
+            )
 
 
-async def run_servers(*servers):
+async def drain_servers(servers, connections, timeout: float = 10):
+    """Stop listening on servers and drain their connections."""
+    for server in servers:
+        server.close()
+    await asyncio.gather(*(i.drain(timeout) for i in connections))
+
+
+async def run_servers(*servers, connections=(), drain_timeout: float = 10):
     """Run servers forever until SIGTERM/SIGINT received.
 
     :param servers: asyncio servers already started
+    :param connections: connection managers of servers to drain on shutdown
+    :param drain_timeout: seconds to wait on connections to close on shutdown
     """
     # Lock to keep server running until interrupted
     shutdown = asyncio.Lock()
@@ -646,29 +1069,43 @@ async def run_servers(*servers):
     loop = asyncio.get_running_loop()
     loop.add_signal_handler(signal.SIGTERM, shutdown.release)
     loop.add_signal_handler(signal.SIGINT, shutdown.release)
-    await run_servers_stacked(shutdown, *servers)
+    await run_servers_stacked(
+        shutdown,
+        *servers,
+        on_shutdown=functools.partial(
+            drain_servers, servers, connections, drain_timeout
+        ),
+    )
 
 
 async def build_slack_server(
-    root: chatbot.InterfaceRoot, port: int, force_bind: bool = False
+    root: chatbot.InterfaceRoot,
+    port: int,
+    force_bind: bool = False,
+    connections: ConnectionManager = None,
 ):
     """Build slack server from configuration."""
     return await asyncio.start_server(
-        SlackHandler(root).handle,
+        SlackHandler(root, connections).serve,
         host="localhost",
         port=port,
         reuse_port=force_bind,
     )
 
 
-async def build_servers(root: chatbot.Interface, conf: dict):
-    """Build servers from configuration."""
+async def build_servers(root: chatbot.Interface, conf: dict, connections=None):
+    """Build servers from configuration.
+
+    :param connections: optional list to collect connection managers of servers
+    """
     force_bind = conf.get("force_bind", False)
+    connections = connections if connections is not None else []
     servers = []
     if conf.get("websocket_port"):
+        connections.append(ConnectionManager.from_conf("websocket", conf))
         servers.append(
             await asyncio.start_server(
-                WebSocketHandler(root).handle,
+                WebSocketHandler(root, connections[-1]).serve,
                 host="localhost",
                 port=conf["websocket_port"],
                 reuse_port=force_bind,
@@ -680,42 +1117,83 @@ async def build_servers(root: chatbot.Interface, conf: dict):
         elif conf.get("slack_app_token") is None:
             log.error("Slack app token not set, disabling slack server")
         else:
+            connections.append(ConnectionManager.from_conf("slack", conf))
             servers.append(
-                await build_slack_server(root, conf["slack_port"], force_bind)
+                await build_slack_server(
+                    root, conf["slack_port"], force_bind, connections[-1]
+                )
             )
     if conf.get("email_port"):
         if conf.get("email_address") is None:
             log.error("No email address of the bot set, disabling email server")
         else:
-            loop = asyncio.get_running_loop()
+            from zoozl import lmtp
+
+            connections.append(ConnectionManager.from_conf("email", conf))
             servers.append(
-                await loop.create_server(
-                    functools.partial(LMTP, EmailHandler(root), loop=loop),
-                    host="localhost",
-                    port=conf["email_port"],
-                    reuse_port=force_bind,
+                await lmtp.build_email_server(
+                    root, conf["email_port"], force_bind, connections[-1]
                 )
             )
     return servers
 
 
-async def run(conf: dict):
-    """Start and run servers forever."""
+async def reload(root: chatbot.InterfaceRoot, get_conf=None):
+    """Reload plugins of root with configuration from get_conf if given."""
+    conf = None
+    try:
+        if get_conf is not None:
+            conf = get_conf()
+            conf.setdefault("email_smtp_port", 25)
+        await root.reload(conf)
+    except Exception:
+        log.exception("Reload failed, keeping previous plugins")
+    else:
+        log.info("Reloaded plugins")
+
+
+async def run(conf: dict, get_conf=None):
+    """Start and run servers forever.
+
+    :param get_conf: optional callable returning fresh configuration on SIGHUP
+    """
     root = chatbot.InterfaceRoot(conf)
     root.load()
+    reloads = set()
+
+    def on_reload():
+        """Reload plugins in background, keeping reference to the task."""
+        task = asyncio.create_task(reload(root, get_conf))
+        reloads.add(task)
+        task.add_done_callback(reloads.discard)
+
+    asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, on_reload)
+    archiving = None
+    if root.archiver:
+        archiving = asyncio.create_task(
+            root.archiver.run(root.storage, conf.get("archive_interval", 60))
+        )
     try:
-        servers = await build_servers(root, conf)
-        await run_servers(*servers)
+        connections = []
+        servers = await build_servers(root, conf, connections)
+        await run_servers(
+            *servers,
+            connections=connections,
+            drain_timeout=conf.get("drain_timeout", 10),
+        )
     finally:
+        if archiving:
+            archiving.cancel()
         root.close()
 
 
-def start(conf: dict) -> None:
+def start(conf: dict, get_conf=None) -> None:
     """Start server listening on given ports provided by conf.
 
-    We serve forever until interrupted or terminated.
+    We serve forever until interrupted or terminated. On SIGHUP plugins are reloaded
+    with configuration returned by optional get_conf callable.
     """
     logging.basicConfig(level=conf.get("log_level", logging.WARNING))
     if "email_smtp_port" not in conf:
         conf["email_smtp_port"] = 25
-    asyncio.run(run(conf))
+    asyncio.run(run(conf, get_conf))
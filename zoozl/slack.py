@@ -1,11 +1,14 @@
 """Slack functions to route slack events for chat completion."""
 
+import asyncio
+import concurrent.futures
 import json
+import logging
 from urllib import request
 
-import slack_sdk
+from zoozl.chatbot import CoalescingStream, Message
 
-from zoozl.chatbot import Message
+log = logging.getLogger(__name__)
 
 
 def get_attachments(body, slack_token):
@@ -34,6 +37,8 @@ def send_slack(slack_token: str, channel: str, message: Message):
     """Send a Slack message."""
     for part in message.parts:
         if part.binary:
+            import slack_sdk
+
             client = slack_sdk.WebClient(token=slack_token)
             client.files_upload_v2(
                 channel=channel,
@@ -42,14 +47,84 @@ def send_slack(slack_token: str, channel: str, message: Message):
                 filename=part.filename,
             )
         else:
-            headers = {"Authorization": f"Bearer {slack_token}"}
-            headers["Content-type"] = "application/json"
-            data = {"channel": channel, "text": part.text}
-            req = request.Request(
-                "https://slack.com/api/chat.postMessage",
-                headers=headers,
-                data=json.dumps(data).encode(),
-                method="POST",
-            )
-            with request.urlopen(req):
-                pass
+            call_slack(slack_token, "chat.postMessage", channel=channel, text=part.text)
+
+
+async def send(slack_token: str, channel: str, message: Message):
+    """Send a Slack message without blocking event loop."""
+    await asyncio.to_thread(send_slack, slack_token, channel, message)
+
+
+def call_slack(slack_token: str, method: str, **data) -> dict:
+    """Call Slack Web API method with JSON data, return decoded response."""
+    headers = {"Authorization": f"Bearer {slack_token}"}
+    headers["Content-type"] = "application/json"
+    req = request.Request(
+        f"https://slack.com/api/{method}",
+        headers=headers,
+        data=json.dumps(data).encode(),
+        method="POST",
+    )
+    with request.urlopen(req) as response:
+        return json.loads(response.read() or b"{}")
+
+
+class SlackStream(CoalescingStream):
+    """Reply streamed to Slack channel by updating one posted message.
+
+    Message is posted with first piece and updated with text written so far at
+    most once per interval, Slack limits how often message may be updated. Slack
+    is called in order from one thread of stream, writers never wait on it.
+
+    If message could not be posted or updated, stream stops showing text written
+    so far and only whole text is shown once finished.
+    """
+
+    def __init__(self, slack_token: str, channel: str, interval: float = 1):
+        """Initialise stream to Slack channel."""
+        super().__init__(interval)
+        self.slack_token = slack_token
+        self.channel = channel
+        self.ts = None
+        self.stopped = False
+        self.sender = concurrent.futures.ThreadPoolExecutor(
+            1, thread_name_prefix="slack-stream"
+        )
+
+    def update(self, text: str, whole: bool = False):
+        """Post message or update posted one with text."""
+        if self.stopped and not whole:
+            return
+        try:
+            if self.ts is None:
+                response = call_slack(
+                    self.slack_token,
+                    "chat.postMessage",
+                    channel=self.channel,
+                    text=text,
+                )
+                self.ts = response.get("ts")
+                if self.ts is None:
+                    log.warning("Slack posted no message: %s", response.get("error"))
+                    self.stopped = True
+            else:
+                call_slack(
+                    self.slack_token,
+                    "chat.update",
+                    channel=self.channel,
+                    ts=self.ts,
+                    text=text,
+                )
+        except Exception:
+            log.exception("Failed to stream message to Slack channel %s", self.channel)
+            self.stopped = True
+
+    def send_delta(self, text: str):
+        """Show text written so far."""
+        self.sender.submit(self.update, self.text)
+
+    def finish(self, text: str):
+        """Show whole text, return future of update."""
+        future = self.sender.submit(self.update, text, whole=True)
+        self.sender.shutdown(wait=False)
+        return future
@@ -1,11 +1,32 @@
 """Utilities for zoozl package."""
 
+import contextlib
+import os
 import types
 
 
 def load_from_module(module: types.ModuleType, parent: type):
     """Generate objects inheriting parent from a module."""
-    for item in dir(module):
-        i = getattr(module, item)
+    for i in list(vars(module).values()):
         if isinstance(i, type) and issubclass(i, parent) and i is not parent:
             yield i
+
+
+@contextlib.contextmanager
+def write_aside(path: str, suffix: str = ".tmp"):
+    """Yield temporary path that replaces path once block succeeds.
+
+    File is written aside and moved, so concurrent readers never see half of
+    it, and failed write leaves previous file in place.
+
+    :param path: file to replace
+    :param suffix: appended to path to name the temporary file
+    """
+    tmp = f"{path}{suffix}"
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
@@ -5,15 +5,28 @@ Note on implementation:
     -> Reading frames with payload more than 125 bytes not supported
 """
 
+import asyncio
 import base64
+import collections
+import dataclasses
 from dataclasses import dataclass
 import enum
 import hashlib
+import itertools
+import logging
+import math
 import sys
+import time
+
+log = logging.getLogger(__name__)
 
 
 FIN = "8"  # Starting nibble of frame in hex string
 
+# Close frame status codes
+CLOSE_NORMAL = 1000
+CLOSE_GOING_AWAY = 1001
+
 
 def apply_mask(data, mask):
     """Apply masking to the data of a WebSocket message.
@@ -64,6 +77,11 @@ def get_frame(op_code, payload):
     return frame
 
 
+def close_payload(code, reason=b""):
+    """Return payload of close frame with status code and reason."""
+    return code.to_bytes(2, byteorder="big") + reason
+
+
 async def read_frame(reader):
     """Read one frame from reader."""
     data = await reader.read(1)
@@ -75,7 +93,7 @@ async def read_frame(reader):
     if not fin:
         raise RuntimeError("Frames fragmentation unsupported")
     op_code = data & 0b00001111
-    data = await reader.read(1)
+    data = await reader.readexactly(1)
     data = data[0]
     length = data & 0b01111111
     if not data & 0b10000000:
@@ -94,6 +112,9 @@ async def read_frame(reader):
     if op_code == 9:
         new_frame = Frame("PING", data)
         return new_frame
+    if op_code == 10:
+        new_frame = Frame("PONG", data)
+        return new_frame
     if op_code == 1:
         new_frame = Frame("TEXT", data)
         return new_frame
@@ -119,3 +140,236 @@ def handshake(webkey):
     sendback += b"Sec-WebSocket-Accept: " + key + b"\r\n"
     sendback += b"\r\n"
     return sendback
+
+
+class FrameQueue:
+    """Outbound frame queue of one websocket connection.
+
+    Frames are put into queue without waiting on the connection. A dedicated writer
+    task joins all frames queued meanwhile into a single write followed by a single
+    drain. Sender may wait on `wait_writable` to receive backpressure, it blocks while
+    queued bytes are above high watermark until they fall to low watermark.
+
+    >>> queue = FrameQueue(writer)
+    >>> queue.start()
+    >>> queue.put(get_frame("TEXT", b"Hello"))
+    >>> await queue.wait_writable()
+    >>> await queue.close(timeout=30)  # flush remaining frames and stop writer task
+    """
+
+    def __init__(self, writer, high_water=2**16, low_water=2**14):
+        """Initialise queue on stream writer with watermarks in bytes."""
+        if low_water > high_water:
+            raise ValueError("Low watermark must not exceed high watermark.")
+        self.writer = writer
+        self.high_water = high_water
+        self.low_water = low_water
+        self.size = 0
+        self.error = None
+        self.close_sent = False
+        self._frames = collections.deque()
+        self._ready = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self._closing = False
+        self._task = None
+
+    @property
+    def closed(self):
+        """Return True if queue does not accept frames anymore."""
+        return self._closing or self.error is not None
+
+    def start(self):
+        """Start writer task."""
+        self._task = asyncio.create_task(self._run())
+
+    def put(self, frame):
+        """Queue frame for sending, frames are dropped if queue is closed."""
+        if self.closed:
+            log.debug("Dropping frame on closed connection")
+            return
+        self._frames.append(frame)
+        self.size += len(frame)
+        if self.size >= self.high_water:
+            self._writable.clear()
+        self._ready.set()
+
+    async def wait_writable(self):
+        """Wait until queued bytes are below watermark.
+
+        Raise ConnectionError if connection failed while writing.
+        """
+        await self._writable.wait()
+        if self.error is not None:
+            raise ConnectionError("Websocket connection lost") from self.error
+
+    async def close(self, timeout=None):
+        """Flush queued frames and stop writer task.
+
+        Peer that does not read queued frames within timeout in seconds has its
+        connection aborted, frames left are dropped.
+        """
+        self._closing = True
+        self._ready.set()
+        if self._task is None:
+            return
+        done, _ = await asyncio.wait({self._task}, timeout=timeout)
+        if not done:
+            log.warning("Websocket peer does not read, aborting connection")
+            self._task.cancel()
+            self._frames.clear()
+            self.writer.transport.abort()
+
+    async def _run(self):
+        """Write queued frames until closed."""
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            if self._frames:
+                data = b"".join(self._frames)
+                self._frames.clear()
+                try:
+                    self.writer.write(data)
+                    await self.writer.drain()
+                except ConnectionError as error:
+                    self.error = error
+                    self._frames.clear()
+                    self._writable.set()
+                    return
+                self.size -= len(data)
+                if self.size <= self.low_water:
+                    self._writable.set()
+            if self._closing and not self._frames:
+                return
+
+
+@dataclass
+class PeerStats:
+    """Round trip time statistics of one peer in seconds."""
+
+    pings: int = 0
+    pongs: int = 0
+    last_rtt: float = None
+    min_rtt: float = None
+    max_rtt: float = None
+    avg_rtt: float = None  # exponentially weighted moving average
+
+    def add(self, rtt):
+        """Add measured round trip time."""
+        self.pongs += 1
+        self.last_rtt = rtt
+        self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+        self.max_rtt = rtt if self.max_rtt is None else max(self.max_rtt, rtt)
+        self.avg_rtt = rtt if self.avg_rtt is None else self.avg_rtt * 0.8 + rtt * 0.2
+
+
+@dataclass(eq=False)
+class _Peer:
+    """Heartbeat state of one peer."""
+
+    queue: FrameQueue
+    on_dead: type
+    stats: PeerStats = dataclasses.field(default_factory=PeerStats)
+    slot: int = None
+    payload: bytes = None
+    sent: float = 0
+
+
+class Heartbeat:
+    """Ping scheduler shared by many websocket connections.
+
+    Peers are kept in a timer wheel of `tick` second slots, one task advances the
+    wheel and sends PING to peers that are due. Peer that does not answer with PONG
+    within `timeout` seconds is evicted by calling its `on_dead` callable.
+
+    >>> heartbeat = Heartbeat(interval=20, timeout=10)
+    >>> heartbeat.register(queue, writer.transport.abort)
+    >>> heartbeat.pong(queue, frame.data)  # on every received PONG frame
+    >>> heartbeat.stats(queue).avg_rtt
+    >>> heartbeat.unregister(queue)
+    """
+
+    def __init__(self, interval=20, timeout=10, tick=None):
+        """Initialise scheduler with ping interval, pong timeout and tick seconds.
+
+        Tick defaults to one second or less if interval or timeout is shorter.
+        """
+        tick = tick if tick is not None else min(1, interval, timeout)
+        if interval <= 0 or timeout <= 0 or tick <= 0:
+            raise ValueError("Heartbeat interval, timeout and tick must be positive.")
+        self.interval = interval
+        self.timeout = timeout
+        self.tick = tick
+        self._wheel = [{} for _ in range(math.ceil(max(interval, timeout) / tick) + 1)]
+        self._cursor = 0
+        self._peers = {}
+        self._sequence = itertools.count()
+        self._task = None
+
+    def __len__(self):
+        """Return number of registered peers."""
+        return len(self._peers)
+
+    def register(self, queue, on_dead):
+        """Start sending pings over frame queue, return peer statistics."""
+        peer = _Peer(queue, on_dead)
+        self._peers[queue] = peer
+        self._schedule(peer, self.interval)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return peer.stats
+
+    def unregister(self, queue):
+        """Stop sending pings over frame queue."""
+        peer = self._peers.pop(queue, None)
+        if peer is not None and peer.slot is not None:
+            self._wheel[peer.slot].pop(queue, None)
+
+    def stats(self, queue):
+        """Return round trip statistics of peer."""
+        return self._peers[queue].stats
+
+    def pong(self, queue, data):
+        """Register PONG received from peer, return round trip time if measured."""
+        peer = self._peers.get(queue)
+        if peer is None or peer.payload is None or peer.payload != data:
+            # Unsolicited PONG frames are allowed and ignored
+            return None
+        rtt = time.monotonic() - peer.sent
+        peer.payload = None
+        peer.stats.add(rtt)
+        self._schedule(peer, self.interval - rtt)
+        return rtt
+
+    def advance(self):
+        """Move wheel by one tick, ping due peers and evict dead ones."""
+        self._cursor = (self._cursor + 1) % len(self._wheel)
+        due, self._wheel[self._cursor] = self._wheel[self._cursor], {}
+        for queue, peer in due.items():
+            peer.slot = None
+            if peer.payload is not None:
+                log.info("Websocket peer did not answer ping, evicting")
+                self._peers.pop(queue, None)
+                peer.on_dead()
+            else:
+                peer.payload = next(self._sequence).to_bytes(8, byteorder="big")
+                peer.sent = time.monotonic()
+                peer.stats.pings += 1
+                queue.put(get_frame("PING", peer.payload))
+                self._schedule(peer, self.timeout)
+
+    async def run(self):
+        """Advance wheel every tick while there are peers registered."""
+        next_tick = time.monotonic()
+        while self._peers:
+            next_tick += self.tick
+            await asyncio.sleep(max(next_tick - time.monotonic(), 0))
+            self.advance()
+
+    def _schedule(self, peer, delay):
+        """Put peer into wheel slot after delay seconds."""
+        if peer.slot is not None:
+            self._wheel[peer.slot].pop(peer.queue, None)
+        ticks = min(max(math.ceil(delay / self.tick), 1), len(self._wheel) - 1)
+        peer.slot = (self._cursor + ticks) % len(self._wheel)
+        self._wheel[peer.slot][peer.queue] = peer